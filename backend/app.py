@@ -1,14 +1,30 @@
-﻿from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, BackgroundTasks, Response, Body
+﻿from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, BackgroundTasks, Response, Body, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import yt_dlp
 from urllib.parse import urlparse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, List, Optional
 from pathlib import Path
-import os,json,time,uuid,asyncio,logging,tempfile,subprocess,threading,shutil,concurrent.futures,psutil,torch
-from faster_whisper import WhisperModel
+import os,re,sys,json,time,uuid,hmac,socket,hashlib,asyncio,contextlib,functools,logging,tempfile,threading,shutil,wave,concurrent.futures,psutil
+# torch, yt_dlp e faster_whisper são importados só quando usados: a inicialização (e cada --reload) fica bem mais rápida
+from transcription_cache import TranscriptionCache, make_cache_key
+from job_queue import Job, JobCancelled, JobScheduler, QueueFullError
+from status_broker import StatusBroker
+from state_backend import create_backend
+from word_store import EXPORTERS, WordStore, WordTimings, resegment
+from refine import RefineAligner
+import chunked_transcription
+from model_pool import ModelPool
+from inference_workers import InferencePool, load_engine
+from audio_pipe import PipeAudioExtractor, PipeExtractionError
+from media_store import MediaStore, MediaStoreError, hash_file
+import render_engine
+from youtube_source import MetadataCache, download_audio, fetch_metadata, video_key
+import batch_transcription
+import calibration
+from metrics import LOOP_LAG_BUCKETS, LoopLagMonitor, MetricsRegistry, RequestLatencyMiddleware, SessionTimings, StageTracer
+from ffmpeg_runner import FFmpegCancelled, FFmpegError, FFmpegNotFound, FFmpegRunner, FFmpegTimeout, ffmpeg_hwaccels
 
 # --- Modelos Pydantic para Validação de Requisições ---
 
@@ -21,6 +37,33 @@ class YouTubeDownloadRequest(BaseModel):
 class YouTubeURLRequest(BaseModel):
     url: str
 
+# Usado para transcrever um vídeo do YouTube baixando só o áudio no servidor
+class TranscribeURLRequest(BaseModel):
+    url: str
+    model: Optional[str] = None # Padrão: modelo do hardware atual
+    language: str = 'pt'
+    session_id: Optional[str] = None
+    priority: int = 0
+    long_media: Optional[bool] = None
+
+# Usado para transcrever em lote arquivos do servidor (relativos a BATCH_ROOT) e URLs
+class BatchRequest(BaseModel):
+    items: List[str] = []
+    directory: Optional[str] = None # Pasta com vídeos, relativa a BATCH_ROOT
+    manifest: Optional[str] = None # .txt ou .json com um caminho/URL por item, relativo a BATCH_ROOT
+    output: Optional[str] = None # Subpasta de saída em BATCH_ROOT/output (padrão: id do lote); repetir retoma o lote
+    model: Optional[str] = None
+    language: str = 'pt'
+    batch_size: Optional[int] = None
+    priority: int = -10 # Abaixo das transcrições interativas
+    retry_failed: bool = False
+
+# Usado para iniciar um upload retomável no armazenamento de mídia
+class AssetUploadRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None # Conferido ao completar o upload
+
 # --- Configuração de Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,8 +71,26 @@ logger = logging.getLogger(__name__)
 # --- Configuração de Hardware e Modelo ---
 CPU_CORES = os.cpu_count() or 1
 MEMORY_GB = psutil.virtual_memory().total / (1024**3)
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "int8"
+
+@functools.lru_cache(maxsize=1)
+def get_device() -> str:
+    """Detecta a GPU na primeira vez que é necessário, pelo próprio CTranslate2 (o torch só é usado como alternativa)."""
+    device = os.environ.get("WHISPER_DEVICE")
+    if not device:
+        try:
+            import ctranslate2
+            device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        except Exception:
+            try:
+                import torch
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+            except ImportError:
+                device = "cpu"
+    logger.info(f"Dispositivo de inferência: {device}")
+    return device
+
+def get_compute_type() -> str:
+    return "float16" if get_device() == "cuda" else "int8"
 
 if MEMORY_GB <= 4:
     HARDWARE_TIER, DEFAULT_MODEL, MAX_WORKERS, BEAM_SIZE = "low", "tiny", 1, 1
@@ -39,6 +100,16 @@ elif MEMORY_GB <= 16:
     HARDWARE_TIER, DEFAULT_MODEL, MAX_WORKERS, BEAM_SIZE = "high", "small", min(4, CPU_CORES), 1
 else:
     HARDWARE_TIER, DEFAULT_MODEL, MAX_WORKERS, BEAM_SIZE = "ultra", "medium", min(8, CPU_CORES), 1
+CPU_THREADS = max(1, CPU_CORES // 2)
+
+# Calibração medida nesta máquina (python calibration.py ou POST /api/admin/calibrate) substitui a escolha pela RAM
+CALIBRATION_PATH = os.environ.get("CALIBRATION_PATH", os.path.join(os.getcwd(), "cache", "calibration.json"))
+CALIBRATION_TARGET_RTF = float(os.environ.get("CALIBRATION_TARGET_RTF", calibration.DEFAULT_TARGET_RTF))
+CALIBRATION = calibration.load(CALIBRATION_PATH) if os.environ.get("USE_CALIBRATION", "1") != "0" else None
+if CALIBRATION:
+    _selected = CALIBRATION["selected"]
+    HARDWARE_TIER, DEFAULT_MODEL, MAX_WORKERS = _selected["hardware_tier"], _selected["model"], _selected["workers"]
+    CPU_THREADS = _selected["cpu_threads"] or CPU_THREADS
 
 # Parâmetros otimizados para transcrição rápida com Whisper
 ULTRA_SPEED_CONFIG = {
@@ -49,8 +120,33 @@ ULTRA_SPEED_CONFIG = {
     "vad_parameters": {"threshold": 0.5, "min_speech_duration_ms": 250, "max_speech_duration_s": float("inf"),
                       "min_silence_duration_ms": 1000, "speech_pad_ms": 200}
 }
+# Tempos por palavra (re-segmentação em /api/sessions/{id}/captions e refinamento palavra a palavra): desligado por padrão,
+# pois acrescenta o alinhamento por atenção cruzada a toda transcrição. Ligar muda a chave do cache de transcrições
+# (as entradas gravadas sem ele deixam de valer); desligado, a configuração e as chaves são as de antes da opção existir
+if os.environ.get("WORD_TIMESTAMPS", "0") == "1": ULTRA_SPEED_CONFIG["word_timestamps"] = True
+
+# Transcrição paralela de mídias longas: duração dos trechos, processos simultâneos e duração mínima para ativar
+LONG_MEDIA_CONFIG = {
+    "low": {"chunk_s": 120, "workers": 1, "min_duration_s": float("inf")},
+    "medium": {"chunk_s": 120, "workers": min(2, CPU_CORES), "min_duration_s": 900},
+    "high": {"chunk_s": 180, "workers": max(1, min(4, CPU_CORES // 2)), "min_duration_s": 600},
+    "ultra": {"chunk_s": 240, "workers": max(1, min(8, CPU_CORES // 2)), "min_duration_s": 300},
+}[HARDWARE_TIER]
+LONG_MEDIA_CONFIG["chunk_s"] = float(os.environ.get("LONG_MEDIA_CHUNK_S", LONG_MEDIA_CONFIG["chunk_s"]))
+LONG_MEDIA_CONFIG["workers"] = int(os.environ.get("LONG_MEDIA_WORKERS", LONG_MEDIA_CONFIG["workers"]))
+
+# Renderização por segmentos: FFmpegs em paralelo, preset/CRF do libx264 e duração alvo de cada segmento
+RENDER_CONFIG = {
+    "low": {"workers": 1, "preset": "veryfast", "crf": 23, "segment_s": 60},
+    "medium": {"workers": min(2, CPU_CORES), "preset": "faster", "crf": 23, "segment_s": 45},
+    "high": {"workers": max(1, min(4, CPU_CORES // 2)), "preset": "fast", "crf": 23, "segment_s": 30},
+    "ultra": {"workers": max(1, min(8, CPU_CORES // 2)), "preset": "medium", "crf": 23, "segment_s": 30},
+}[HARDWARE_TIER]
+RENDER_CONFIG["workers"] = int(os.environ.get("RENDER_WORKERS", RENDER_CONFIG["workers"]))
+RENDER_CONFIG["preset"] = os.environ.get("RENDER_PRESET", RENDER_CONFIG["preset"])
+RENDER_CONFIG["crf"] = int(os.environ.get("RENDER_CRF", RENDER_CONFIG["crf"]))
 
-logger.info(f"Config: {HARDWARE_TIER} - {MEMORY_GB:.1f}GB - {CPU_CORES}c - {DEVICE} - {DEFAULT_MODEL}")
+logger.info(f"Config: {HARDWARE_TIER} - {MEMORY_GB:.1f}GB - {CPU_CORES}c - {DEFAULT_MODEL} - {CPU_THREADS} threads ({'calibrado' if CALIBRATION else 'pela RAM'})")
 
 # --- Inicialização da Aplicação FastAPI ---
 app = FastAPI(title="Video Processing API", version="5.0.0")
@@ -75,23 +171,151 @@ MAX_FILE_SIZE = 500 * 1024 * 1024  # 500 MB
 LANGUAGES = {'en': 'English', 'es': 'Spanish', 'fr': 'French', 'de': 'German', 'it': 'Italian', 'ja': 'Japanese', 'ko': 'Korean', 'zh': 'Chinese', 'ru': 'Russian', 'ar': 'Arabic', 'pt': 'Portuguese'}
 
 executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
-status_cache = {} # Cache simples em memória para status
-whisper_models_cache = {} # Cache para modelos Whisper carregados
+# Estado compartilhado entre workers/réplicas (eventos do SSE e tarefas): sqlite (padrão, mesma máquina), redis ou memory
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", os.path.join(os.getcwd(), "cache", "state.db"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+state_backend = create_backend(STATE_BACKEND, STATE_DB_PATH, REDIS_URL)
+status_broker = StatusBroker(state_backend) # Eventos de status e segmentos por sessão, entregues via SSE
+# Modelos Whisper residentes: orçamento de RAM e modelos pré-carregados/aquecidos na inicialização
+MODEL_POOL_RAM_FRACTION = float(os.environ.get("MODEL_POOL_RAM_FRACTION", 0.5))
+# Processos do uvicorn na máquina: rode com WEB_CONCURRENCY=N (padrão do `--workers`); cada um tem seu pool, então a fração é dividida entre eles
+WEB_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+MODEL_POOL_BUDGET_BYTES = int(MEMORY_GB * MODEL_POOL_RAM_FRACTION * 1024 ** 3 / WEB_WORKERS)
+PRELOAD_MODELS = [m.strip() for m in os.environ.get("PRELOAD_MODELS", "").split(",") if m.strip() in WHISPER_MODELS]
+# Aquece o modelo padrão em segundo plano logo após a inicialização (0 desativa; /api/ready só fica pronto depois)
+WARMUP_DEFAULT_MODEL = os.environ.get("WARMUP_DEFAULT_MODEL", "1") != "0"
+# Motor de inferência ("módulo:classe" com a interface do WhisperModel)
+WHISPER_ENGINE = os.environ.get("WHISPER_ENGINE", "faster_whisper:WhisperModel")
+# Inferência em processos dedicados (0 = threads neste processo): uma falha do CTranslate2 derruba só o worker.
+# Vale para as transcrições comuns e os itens de lote sem `batch_size`; a mídia longa usa o próprio pool de processos
+# (chunked_transcription) e o lote com `batch_size` > 1 usa o modelo neste processo, ambos fora destes workers
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0))
+# Worker que termina uma tarefa acima deste RSS é reciclado (padrão: sua parte do orçamento de modelos + 1 GB)
+INFERENCE_WORKER_RSS_LIMIT_MB = int(os.environ.get("INFERENCE_WORKER_RSS_LIMIT_MB", MODEL_POOL_BUDGET_BYTES / 1024 ** 2 / max(1, INFERENCE_WORKERS) + 1024))
+engine_state = {"status": "starting", "error": None, "ready_at": None, "started_at": time.time()}
+
+# Cache em disco de transcrições, indexado pelo hash da mídia + modelo + idioma + parâmetros
+TRANSCRIPTION_CACHE_DIR = os.environ.get("TRANSCRIPTION_CACHE_DIR", os.path.join(os.getcwd(), "cache", "transcriptions"))
+TRANSCRIPTION_CACHE_MAX_MB = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_MB", 512))
+TRANSCRIPTION_CACHE_MAX_AGE_DAYS = float(os.environ.get("TRANSCRIPTION_CACHE_MAX_AGE_DAYS", 30))
+transcription_cache = TranscriptionCache(TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024, TRANSCRIPTION_CACHE_MAX_AGE_DAYS * 86400)
+
+# Fila de transcrições: slots de inferência simultâneos e limite de tarefas em espera (excedido -> 429)
+JOB_SLOTS = int(os.environ.get("JOB_SLOTS", MAX_WORKERS))
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", MAX_WORKERS * 4))
+
+def mirror_job(job: Job):
+    """Grava o estado da tarefa no backend compartilhado, para consultas e cancelamentos vindos de outros workers."""
+    state_backend.put_job(job.id, {**job.to_dict(), "worker": WORKER_ID})
+
+job_scheduler = JobScheduler(JOB_SLOTS, JOB_MAX_QUEUE, on_change=mirror_job)
+
+# Armazenamento de mídias: o vídeo enviado uma vez serve à transcrição e à renderização
+MEDIA_STORE_DIR = os.environ.get("MEDIA_STORE_DIR", os.path.join(os.getcwd(), "media"))
+MEDIA_STORE_TTL_HOURS = float(os.environ.get("MEDIA_STORE_TTL_HOURS", 24))
+MEDIA_STORE_QUOTA_GB = float(os.environ.get("MEDIA_STORE_QUOTA_GB", 10))
+media_store = MediaStore(MEDIA_STORE_DIR, MEDIA_STORE_TTL_HOURS * 3600, int(MEDIA_STORE_QUOTA_GB * 1024 ** 3), MAX_FILE_SIZE)
+
+# Segmentos renderizados, reaproveitados quando as legendas daquele trecho não mudaram
+RENDER_CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", os.path.join(os.getcwd(), "cache", "render"))
+RENDER_CACHE_MAX_GB = float(os.environ.get("RENDER_CACHE_MAX_GB", 5))
+segment_cache = render_engine.SegmentCache(RENDER_CACHE_DIR, int(RENDER_CACHE_MAX_GB * 1024 ** 3))
+
+# Processos FFmpeg: limite global de codificações (libx264) simultâneas, para que picos de renderização não travem as transcrições
+FFMPEG_MAX_ENCODES = int(os.environ.get("FFMPEG_MAX_ENCODES", RENDER_CONFIG["workers"]))
+ffmpeg_runner = FFmpegRunner(FFMPEG_MAX_ENCODES)
+
+# Metadados do YouTube em memória: evita um extract_info a cada tecla digitada na URL
+COOKIES_FILE = "cookies.txt"
+YOUTUBE_METADATA_TTL_S = float(os.environ.get("YOUTUBE_METADATA_TTL_S", 3600))
+youtube_metadata = MetadataCache(lambda url: fetch_metadata(url, COOKIES_FILE), YOUTUBE_METADATA_TTL_S)
+
+# Transcrição em lote: trechos por passada do BatchedInferencePipeline, áudios extraídos à frente e pasta liberada para a API
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", {"low": 4, "medium": 8, "high": 16, "ultra": 24}[HARDWARE_TIER]))
+BATCH_LOOKAHEAD = int(os.environ.get("BATCH_LOOKAHEAD", 2))
+BATCH_ROOT = os.environ.get("BATCH_ROOT", os.path.join(os.getcwd(), "batch"))
+
+# Tempos por palavra de cada sessão, para re-segmentar e exportar legendas sem passar de novo pelo modelo
+WORD_STORE_DIR = os.environ.get("WORD_STORE_DIR", os.path.join(os.getcwd(), "cache", "words"))
+word_store = WordStore(WORD_STORE_DIR)
+
+# Endpoints de administração (/api/admin/*), exigem o cabeçalho X-Admin-Token; desativados sem ADMIN_TOKEN
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+calibration_run = {"status": "idle", "started_at": None, "finished_at": None, "returncode": None, "output": []}
+_calibration_process: Optional[asyncio.subprocess.Process] = None
+
+# Métricas para o Prometheus (/metrics) e tempos por etapa de cada sessão (/api/sessions/{id}/timings)
+metrics_registry = MetricsRegistry()
+STAGE_SECONDS = metrics_registry.histogram("noxsub_stage_seconds", "Duração de cada etapa do pipeline (upload, extração, modelo, decodificação, renderização).", ["stage"])
+LOOP_LAG_SECONDS = metrics_registry.histogram("noxsub_event_loop_lag_seconds", "Atraso do event loop da API (tempo em que ficou ocupado além do esperado).", buckets=LOOP_LAG_BUCKETS)
+HTTP_SECONDS = metrics_registry.histogram("noxsub_http_request_seconds", "Latência das requisições HTTP até o início da resposta.", ["method", "route", "status"])
+BYTES_PROCESSED = metrics_registry.counter("noxsub_bytes_processed_total", "Bytes de mídia recebidos, baixados e gerados.", ["kind"])
+AUDIO_SECONDS = metrics_registry.counter("noxsub_audio_seconds_total", "Segundos de áudio transcritos (sem contar o cache).", ["model"])
+_process = psutil.Process()
+metrics_registry.gauge_fn("noxsub_jobs_queued", "Tarefas aguardando na fila.", lambda: job_scheduler.queued)
+metrics_registry.gauge_fn("noxsub_jobs_running", "Tarefas em execução.", lambda: job_scheduler.running)
+metrics_registry.gauge_fn("noxsub_job_slots", "Slots de execução da fila.", lambda: job_scheduler.slots)
+metrics_registry.gauge_fn("noxsub_ffmpeg_running", "Processos FFmpeg em execução.", lambda: ffmpeg_runner.running)
+metrics_registry.gauge_fn("noxsub_ffmpeg_encodes_waiting", "Codificações aguardando um slot (FFMPEG_MAX_ENCODES).", lambda: ffmpeg_runner.waiting)
+metrics_registry.counter_fn("noxsub_model_pool_loads_total", "Carregamentos de modelos Whisper.", lambda: model_pool.loads)
+metrics_registry.counter_fn("noxsub_model_pool_hits_total", "Pedidos atendidos por um modelo já residente.", lambda: model_pool.hits)
+metrics_registry.counter_fn("noxsub_model_pool_evictions_total", "Modelos descarregados para liberar memória.", lambda: model_pool.evictions)
+metrics_registry.gauge_fn("noxsub_model_pool_resident_bytes", "Memória estimada dos modelos residentes.", lambda: model_pool.stats()["resident_mb"] * 1024 ** 2)
+metrics_registry.counter_fn("noxsub_inference_worker_restarts_total", "Workers de inferência substituídos (falha ou reciclagem por memória).",
+                            lambda: {"crash": inference_pool.crashes, "recycle": inference_pool.recycles} if inference_pool else {}, ["reason"])
+metrics_registry.counter_fn("noxsub_cache_hits_total", "Acertos dos caches.", lambda: {"transcription": transcription_cache.hits, "render_segment": segment_cache.hits, "youtube_metadata": youtube_metadata.hits}, ["cache"])
+metrics_registry.counter_fn("noxsub_cache_misses_total", "Falhas dos caches.", lambda: {"transcription": transcription_cache.misses, "render_segment": segment_cache.misses, "youtube_metadata": youtube_metadata.misses}, ["cache"])
+metrics_registry.gauge_fn("process_resident_memory_bytes", "Memória residente (RSS) do processo.", lambda: _process.memory_info().rss)
+metrics_registry.counter_fn("process_cpu_seconds_total", "Tempo de CPU do processo (usuário + sistema).", lambda: sum(_process.cpu_times()[:2]))
+metrics_registry.gauge_fn("process_threads", "Threads do processo.", lambda: _process.num_threads())
+session_timings = SessionTimings()
+tracer = StageTracer(STAGE_SECONDS, session_timings)
+loop_lag = LoopLagMonitor(LOOP_LAG_SECONDS)
+metrics_registry.gauge_fn("noxsub_event_loop_lag_max_seconds", "Maior atraso do event loop desde a inicialização.", lambda: loop_lag.max_s)
+app.add_middleware(RequestLatencyMiddleware, histogram=HTTP_SECONDS)
 
 # --- Funções de Ajuda e Utilitários ---
 
-def get_model(model_name: str):
-    """Carrega um modelo Whisper em cache ou da memória."""
-    if model_name not in whisper_models_cache:
-        logger.info(f"Carregando modelo Whisper: {model_name}...")
-        config = {"device": DEVICE, "compute_type": COMPUTE_TYPE, "cpu_threads": 0 if DEVICE == "cuda" else max(1, CPU_CORES // 2), "num_workers": 1}
-        if DEVICE == "cuda": config["device_index"] = 0
-        whisper_models_cache[model_name] = WhisperModel(model_name, **config)
-        logger.info("Modelo carregado.")
-    return whisper_models_cache[model_name]
-
-async def save_file_stream(file: UploadFile, path: str):
-    """Salva um arquivo enviado por streaming, verificando o tamanho."""
+def get_model_config(cpu_threads: Optional[int] = None, num_workers: int = 1) -> dict:
+    """Parâmetros de construção do WhisperModel para o hardware atual.
+
+    `num_workers` é quantas transcrições a mesma instância executa ao mesmo tempo (cada uma com `cpu_threads`);
+    com 1, chamadas simultâneas de vários threads esperam umas pelas outras dentro do CTranslate2.
+    """
+    device = get_device()
+    config = {"device": device, "compute_type": get_compute_type(), "cpu_threads": 0 if device == "cuda" else (cpu_threads or CPU_THREADS), "num_workers": num_workers}
+    if device == "cuda": config["device_index"] = 0
+    return config
+
+def load_whisper_model(model_name: str):
+    # Os slots da fila dividem o modelo residente: um worker do CTranslate2 por slot, sobre os mesmos pesos
+    return load_engine(WHISPER_ENGINE)(model_name, **get_model_config(num_workers=max(1, JOB_SLOTS)))
+
+def warmup_model(model):
+    """Executa uma inferência curta em silêncio para inicializar kernels e alocações."""
+    import numpy as np
+    segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), beam_size=1, vad_filter=False, without_timestamps=True)
+    list(segments)
+
+model_pool = ModelPool(load_whisper_model, MODEL_POOL_BUDGET_BYTES)
+inference_pool = InferencePool(INFERENCE_WORKERS, WHISPER_ENGINE, MODEL_POOL_BUDGET_BYTES // max(1, INFERENCE_WORKERS),
+                               INFERENCE_WORKER_RSS_LIMIT_MB * 1024 ** 2) if INFERENCE_WORKERS > 0 else None
+
+def get_model(model_name: str, cancel_event: Optional[threading.Event] = None):
+    """Obtém um modelo Whisper do pool (carregado uma única vez, mesmo com requisições simultâneas).
+
+    Com INFERENCE_WORKERS, devolve um representante com a mesma interface que transcreve num worker dedicado.
+    """
+    if inference_pool: return inference_pool.model(model_name, cancel_event)
+    return model_pool.get(model_name)
+
+def is_model_resident(model_name: str) -> bool:
+    return inference_pool.is_resident(model_name) if inference_pool else model_pool.is_resident(model_name)
+
+async def save_file_stream(file: UploadFile, path: str, hasher=None):
+    """Salva um arquivo enviado por streaming, verificando o tamanho (e atualizando o hash, se fornecido)."""
     total_size = 0
     with open(path, "wb") as buffer:
         while chunk := await file.read(16384):
@@ -99,42 +323,75 @@ async def save_file_stream(file: UploadFile, path: str):
             if total_size > MAX_FILE_SIZE:
                 os.remove(path)
                 raise HTTPException(status_code=413, detail=f"Arquivo muito grande. Máximo: {MAX_FILE_SIZE/(1024*1024):.0f}MB")
+            if hasher: hasher.update(chunk)
             buffer.write(chunk)
     return total_size
 
 def get_ffmpeg_cmd(input_path: str, output_path: str):
     """Gera o comando FFmpeg para extrair e converter áudio."""
     cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "0"]
-    # Tenta usar aceleração por hardware se disponível
-    if DEVICE == "cuda":
-        try:
-            subprocess.run(["ffmpeg", "-hwaccels"], capture_output=True, check=True, timeout=5)
-            cmd.extend(["-hwaccel", "cuda"])
-        except: pass
+    # Usa aceleração por hardware se disponível (a lista do FFmpeg é consultada uma única vez)
+    if get_device() == "cuda" and "cuda" in ffmpeg_hwaccels(): cmd.extend(["-hwaccel", "cuda"])
     cmd.extend(["-i", input_path, "-vn", "-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1", "-y", output_path])
     return cmd
 
-def run_ffmpeg(cmd: List[str], error_msg: str, timeout: int = 300):
-    """Executa um comando FFmpeg e lida com erros."""
+def get_ffmpeg_pipe_cmd():
+    """Comando FFmpeg que lê o vídeo do stdin e escreve PCM s16le mono de 16 kHz no stdout."""
+    return ["ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "0", "-i", "pipe:0",
+            "-vn", "-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1", "-f", "s16le", "pipe:1"]
+
+def run_ffmpeg(cmd: List[str], error_msg: str, timeout: int = 300, cancel_event: Optional[threading.Event] = None, encode: bool = False,
+               duration: Optional[float] = None, on_progress=None):
+    """Executa um comando FFmpeg pelo `ffmpeg_runner` e lida com erros; encerra o processo se a tarefa for cancelada.
+
+    `encode=True` marca uma codificação pesada, sujeita ao limite global `FFMPEG_MAX_ENCODES`. Chame fora do event loop.
+    """
     try:
-        subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=timeout)
-    except subprocess.TimeoutExpired:
+        ffmpeg_runner.run_sync(cmd, error_msg, timeout, encode=encode, duration=duration, on_progress=on_progress, cancel_event=cancel_event)
+    except FFmpegCancelled:
+        raise JobCancelled(error_msg)
+    except FFmpegTimeout:
         raise HTTPException(status_code=408, detail=f"Timeout: {error_msg}")
-    except subprocess.CalledProcessError as e:
+    except FFmpegNotFound:
+        raise HTTPException(status_code=500, detail="FFmpeg não encontrado. Verifique se está instalado e no PATH do sistema.")
+    except FFmpegError as e:
         logger.error(f"Erro no FFmpeg: {e.stderr}")
         raise HTTPException(status_code=500, detail=f"{error_msg}: {e.stderr}")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="FFmpeg não encontrado. Verifique se está instalado e no PATH do sistema.")
 
 def validate_file(file: UploadFile):
     """Valida a extensão do arquivo enviado."""
-    if not file.filename: raise HTTPException(status_code=400, detail="Nome de arquivo não fornecido.")
-    ext = Path(file.filename).suffix.lower()
+    validate_filename(file.filename)
+
+def validate_filename(filename: Optional[str]):
+    if not filename: raise HTTPException(status_code=400, detail="Nome de arquivo não fornecido.")
+    ext = Path(filename).suffix.lower()
     if ext not in ALLOWED_EXTENSIONS: raise HTTPException(status_code=400, detail=f"Formato de arquivo não suportado: {ext}")
 
 def update_status(session_id: str, status: str, step_id: int = 0):
-    """Atualiza o status de uma tarefa no cache."""
-    status_cache[session_id] = json.dumps({"status": status, "stepId": step_id})
+    """Publica o status de uma tarefa para os assinantes da sessão."""
+    status_broker.publish(session_id, {"status": status, "stepId": step_id})
+
+def publish_segment(session_id: str, caption: dict, duration: float):
+    """Publica um segmento assim que é decodificado, com o progresso relativo à duração do áudio."""
+    progress = min(1.0, caption["end"] / duration) if duration else None
+    status_broker.publish(session_id, {"type": "segment", "caption": caption, "progress": progress})
+
+def publish_progress(session_id: str, stage: str, progress: dict):
+    """Publica o progresso de um FFmpeg em execução (porcentagem, fps e velocidade) para os assinantes da sessão."""
+    status_broker.publish(session_id, {"type": "progress", "stage": stage, **progress})
+
+@contextlib.asynccontextmanager
+async def cancel_on_disconnect(request: Request, cancel):
+    """Chama `cancel()` se o cliente desconectar antes do fim do bloco (o FFmpeg e a inferência em curso são interrompidos)."""
+    async def watch():
+        while not await request.is_disconnected(): await asyncio.sleep(1)
+        logger.info("Cliente desconectou; cancelando o processamento.")
+        cancel()
+    watcher = asyncio.create_task(watch())
+    try:
+        yield
+    finally:
+        watcher.cancel()
 
 def format_srt_time(seconds: float) -> str:
     """Formata segundos para o padrão de tempo do SRT."""
@@ -155,30 +412,12 @@ def create_srt(captions: List[dict], srt_path: str):
 
 @app.post("/api/youtube-metadata")
 async def get_youtube_metadata(request: YouTubeURLRequest):
-    """Extrai metadados de um vídeo do YouTube sem fazer o download completo."""
-    url = request.url
-    parsed_url = urlparse(url)
-    if 'youtube.com' not in parsed_url.netloc and 'youtu.be' not in parsed_url.netloc:
+    """Extrai metadados de um vídeo do YouTube sem fazer o download completo (com cache por vídeo)."""
+    if not video_key(request.url):
         raise HTTPException(status_code=400, detail="URL inválida. Apenas links do YouTube são permitidos.")
-
-    ydl_opts = {'noplaylist': True, 'quiet': True, 'no_warnings': True}
-
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            loop = asyncio.get_event_loop()
-            info = await loop.run_in_executor(executor, lambda: ydl.extract_info(url, download=False))
-        
-        duration = info.get('duration', 0)
-        minutes, seconds = divmod(duration, 60)
-        
-        metadata = {
-            "title": info.get('title', 'Título não disponível'),
-            "thumbnail": info.get('thumbnail', ''),
-            "duration": duration,
-            "duration_formatted": f"{int(minutes):02}:{int(seconds):02}",
-            "author": info.get('uploader', 'Autor desconhecido'),
-        }
-        return JSONResponse(content=metadata)
+        metadata = await youtube_metadata.get(request.url, executor)
+        return JSONResponse(content={k: v for k, v in metadata.items() if k != "id"})
     except Exception as e:
         logger.error(f"Erro ao buscar metadados do YouTube: {e}")
         raise HTTPException(status_code=500, detail="Falha ao obter metadados do vídeo. Verifique a URL ou tente novamente.")
@@ -199,10 +438,11 @@ async def download_youtube_video(request: YouTubeDownloadRequest, background_tas
     elif quality == 'audio': format_selector = 'bestaudio/best'
 
     ydl_opts = {'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'), 'format': format_selector}
-    if os.path.exists("cookies.txt"): ydl_opts['cookiefile'] = "cookies.txt"
+    if os.path.exists(COOKIES_FILE): ydl_opts['cookiefile'] = COOKIES_FILE
     if quality == 'audio': ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}]
 
     try:
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             await asyncio.get_event_loop().run_in_executor(executor, lambda: ydl.download([url]))
         
@@ -218,110 +458,958 @@ async def download_youtube_video(request: YouTubeDownloadRequest, background_tas
             raise HTTPException(status_code=403, detail="Vídeo requer login. Coloque um arquivo 'cookies.txt' válido na raiz do projeto.")
         raise HTTPException(status_code=500, detail=f"Erro no download: {e}")
 
-@app.post("/api/transcribe")
-async def transcribe_video(file: UploadFile = File(...), model: str = Form(DEFAULT_MODEL), language: Optional[str] = Form("pt"), session_id: Optional[str] = Form(None)):
-    """Transcreve o áudio de um arquivo de vídeo enviado."""
+def use_long_media(audio, long_media: Optional[bool]) -> bool:
+    """Decide pelo modo paralelo: explícito pelo cliente ou automático a partir da duração (só em CPU)."""
+    if long_media is not None: return long_media
+    if get_device() == "cuda" or LONG_MEDIA_CONFIG["workers"] < 2: return False
+    if isinstance(audio, str):
+        with wave.open(audio, "rb") as w:
+            duration = w.getnframes() / w.getframerate()
+    else:
+        duration = len(audio) / 16000
+    return duration >= LONG_MEDIA_CONFIG["min_duration_s"]
+
+@contextlib.contextmanager
+def track_session(session_id: str):
+    """Publica o status final de erro/cancelamento se a transcrição falhar."""
+    try:
+        yield
+    except JobCancelled:
+        update_status(session_id, "Cancelado", 0)
+        raise
+    except Exception as e:
+        logger.error(f"Erro na transcrição (sessão {session_id}): {e}")
+        update_status(session_id, "Erro", 0)
+        raise
+
+def extract_asset_audio(asset: dict, cancel_event: Optional[threading.Event] = None, session_id: Optional[str] = None) -> str:
+    """Devolve o WAV de 16 kHz do asset, extraindo-o só na primeira vez (com o progresso publicado na sessão)."""
+    audio_path = media_store.derived_path(asset["asset_id"], "audio.wav")
+    if os.path.exists(audio_path): return audio_path
+    temp_audio = f"{audio_path}.{uuid.uuid4().hex}.wav"
+    try:
+        on_progress = (lambda p: publish_progress(session_id, "extract", p)) if session_id else None
+        with tracer.stage(session_id, "extract"):
+            run_ffmpeg(get_ffmpeg_cmd(asset["path"], temp_audio), "Erro ao extrair áudio", cancel_event=cancel_event, on_progress=on_progress)
+        os.replace(temp_audio, audio_path)
+    finally:
+        if os.path.exists(temp_audio): os.remove(temp_audio)
+    return audio_path
+
+def transcribe_file(job: Job, asset: dict, model: str, language: str, session_id: str, cache_key: str, long_media: Optional[bool] = None, phase: str = "final") -> dict:
+    """Extrai o áudio (ou reaproveita o já extraído) e transcreve um asset. Executa numa thread da fila de tarefas."""
+    with track_session(session_id):
+        update_status(session_id, "Extraindo áudio...", 3)
+        audio_path = extract_asset_audio(asset, job.cancel_event, session_id)
+        job.check_cancelled()
+        result = transcribe_audio(job, audio_path, model, language, session_id, cache_key, asset["size"], long_media, phase)
+        return {**result, "asset_id": asset["asset_id"]}
+
+def transcribe_audio(job: Job, audio, model: str, language: str, session_id: str, cache_key: str, file_size: int, long_media: Optional[bool] = None,
+                     phase: str = "final", on_segment: Optional[Callable[[dict, Optional[list], float], None]] = None) -> dict:
+    """Transcreve áudio de 16 kHz (caminho de WAV ou array float32), publicando cada segmento e gravando no cache.
+
+    `phase` "draft" termina com o status 7 (rascunho pronto) em vez do final; "refine" não publica
+    status nem segmentos: cada segmento (com suas palavras, ou None na mídia longa) vai para `on_segment`.
+    """
+    refining = phase == "refine"
+    on_segment = on_segment or (lambda caption, words, duration: publish_segment(session_id, caption, duration))
+    if refining: update_status(session_id, f"Refinando com o modelo {model}...", 8)
+    if use_long_media(audio, long_media):
+        if not refining: update_status(session_id, "Transcrevendo em paralelo...", 6)
+        workers = LONG_MEDIA_CONFIG["workers"]
+        with tracer.stage(session_id, "decode_parallel", workers=workers):
+            captions, duration, segment_words = chunked_transcription.transcribe_chunked(
+                audio, model, get_model_config(max(1, CPU_CORES // workers)), language, ULTRA_SPEED_CONFIG,
+                LONG_MEDIA_CONFIG["chunk_s"], workers, lambda c, d: on_segment(c, None, d), job.cancel_event, WHISPER_ENGINE, model_pool)
+        job.check_cancelled()
+    else:
+        if not refining: update_status(session_id, "Carregando modelo...", 5)
+        # Com INFERENCE_WORKERS o modelo carrega dentro do worker, na chamada a transcribe; a etapa usa o tempo medido lá
+        with tracer.stage(session_id, "model_load", model=model, resident=is_model_resident(model)) if not inference_pool else contextlib.nullcontext():
+            whisper_model = get_model(model, job.cancel_event)
+
+        if not refining: update_status(session_id, "Transcrevendo...", 6)
+        with tracer.stage(session_id, "decode", model=model):
+            segments, info = whisper_model.transcribe(audio, language=language, **ULTRA_SPEED_CONFIG)
+            duration = info.duration
+            if getattr(info, "model_load_s", None) is not None:
+                tracer.observe(session_id, "model_load", info.model_load_s, model=model, resident=info.model_resident, worker=True)
+
+            # O gerador decodifica sob demanda, então o cancelamento interrompe a inferência entre segmentos
+            captions, segment_words = [], []
+            try:
+                for i, s in enumerate(segments):
+                    job.check_cancelled()
+                    caption = {"id": i + 1, "start": s.start, "end": s.end, "text": s.text.strip()}
+                    captions.append(caption)
+                    segment_words.append([(w.start, w.end, w.word, w.probability) for w in (s.words or [])])
+                    on_segment(caption, segment_words[-1], duration)
+            finally:
+                segments.close()  # Num cancelamento, devolve já o worker de inferência em vez de esperar o coletor de lixo
+
+    AUDIO_SECONDS.inc(duration, model=model)
+    result = {"captions": captions, "language": language, "duration": duration}
+    timings = WordTimings.build(segment_words)
+    if len(timings):
+        word_store.put(session_id, timings)
+        result["words"] = timings.to_dict()
+    transcription_cache.put(cache_key, result)
+    if phase == "final": update_status(session_id, "Concluído", 10)
+    elif phase == "draft": update_status(session_id, "Rascunho pronto; refinando em segundo plano...", 7)
+    return {**without_words(result), "file_size_mb": round(file_size / (1024 * 1024), 2), "session_id": session_id}
+
+def without_words(result: dict) -> dict:
+    """As palavras ficam no cache e no word_store; a resposta leva só as legendas."""
+    return {k: v for k, v in result.items() if k != "words"}
+
+def submit_job(fn, priority: int = 0, pin: Optional[str] = None, **meta) -> Job:
+    """Enfileira uma tarefa, respondendo 429 quando a fila está cheia.
+
+    `pin` é o asset usado pela tarefa: fica protegido da limpeza do armazenamento até ela terminar.
+    """
+    def timed(job: Job):
+        tracer.observe(meta.get("session_id"), "queue_wait", job.started_at - job.created_at, job.created_at)
+        return fn(job)
+    try:
+        job = job_scheduler.submit(timed, priority=priority, **meta)
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail="Servidor ocupado. Tente novamente em instantes.", headers={"Retry-After": "30"})
+    if pin:
+        media_store.pin(pin)
+        job.future.add_done_callback(lambda _: media_store.unpin(pin))
+    return job
+
+def get_asset(asset_id: str, pin: bool = False) -> dict:
+    try:
+        return media_store.get(asset_id, pin)
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+async def ingest_upload(file: UploadFile, pin: bool = False) -> dict:
+    """Salva o upload direto no armazenamento de mídia, calculando o hash durante a gravação."""
     validate_file(file)
+    staging = media_store.staging_path()
+    hasher = hashlib.sha256()
+    try:
+        BYTES_PROCESSED.inc(await save_file_stream(file, staging, hasher), kind="upload")
+        return await asyncio.get_running_loop().run_in_executor(None, media_store.add_file, staging, file.filename, hasher.hexdigest(), pin)
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    finally:
+        if os.path.exists(staging): os.remove(staging)
+
+async def resolve_media(file: Optional[UploadFile], asset_id: Optional[str]) -> dict:
+    """Obtém o asset a partir do id informado ou armazenando o arquivo enviado.
+
+    O asset volta fixado (`media_store.pin`), para que a limpeza não o remova antes de a tarefa o fixar
+    também; quem chama faz o `media_store.unpin` ao terminar.
+    """
+    if asset_id: return get_asset(asset_id, pin=True)
+    if file is None: raise HTTPException(status_code=400, detail="Envie um arquivo ou informe um asset_id.")
+    return await ingest_upload(file, pin=True)
+
+async def receive_upload(file: Optional[UploadFile], asset_id: Optional[str], model: str, language: str, session_id: str):
+    """Valida a requisição e obtém a mídia, devolvendo (asset, chave de cache, resultado em cache ou None).
+
+    O asset volta fixado, como em `resolve_media`.
+    """
     if model not in WHISPER_MODELS: raise HTTPException(status_code=400, detail=f"Modelo inválido: {model}")
-    
+    status_broker.reset(session_id)
+    update_status(session_id, "Salvando arquivo...", 2)
+    with tracer.stage(session_id, "upload" if file is not None else "asset_lookup"):
+        asset = await resolve_media(file, asset_id)
+    try:
+        cache_key = make_cache_key(asset["asset_id"], model, language, ULTRA_SPEED_CONFIG)
+        cached = lookup_cached(cache_key, session_id, asset["size"])
+    except BaseException:
+        media_store.unpin(asset["asset_id"])
+        raise
+    return asset, cache_key, {**cached, "asset_id": asset["asset_id"]} if cached else None
+
+def lookup_cached(cache_key: str, session_id: str, file_size: int, final: bool = True) -> Optional[dict]:
+    """Procura a transcrição no cache; num acerto, publica os segmentos e o status final da sessão (ou o de rascunho pronto)."""
+    cached = transcription_cache.get(cache_key)
+    if cached is None: return None
+    logger.info(f"Transcrição encontrada no cache (sessão {session_id})")
+    if cached.get("words"): word_store.put(session_id, WordTimings.from_dict(cached["words"]))
+    for caption in cached["captions"]: publish_segment(session_id, caption, cached["duration"])
+    if final: update_status(session_id, "Concluído", 10)
+    else: update_status(session_id, "Rascunho pronto; refinando em segundo plano...", 7)
+    return {**without_words(cached), "file_size_mb": round(file_size / (1024 * 1024), 2), "session_id": session_id, "cached": True}
+
+def check_draft_model(draft_model: Optional[str], model: str) -> Optional[str]:
+    """Valida o modelo de rascunho; None (ou o próprio modelo final) desliga as duas passadas."""
+    if not draft_model or draft_model == model: return None
+    if draft_model not in WHISPER_MODELS: raise HTTPException(status_code=400, detail=f"Modelo de rascunho inválido: {draft_model}")
+    if WHISPER_MODELS.index(draft_model) > WHISPER_MODELS.index(model):
+        raise HTTPException(status_code=400, detail="O modelo de rascunho deve ser menor que o modelo final.")
+    return draft_model
+
+def publish_refine(session_id: str, ops: list, progress: Optional[float] = None, **extra):
+    """Publica os diffs do refinamento (por id de legenda) para os assinantes da sessão."""
+    status_broker.publish(session_id, {"type": "refine", "ops": ops, "progress": progress, **extra})
+
+def refine_transcription(job: Job, draft_captions: list, get_audio, model: str, language: str, session_id: str, cache_key: str, file_size: int, long_media: Optional[bool] = None) -> dict:
+    """Segunda passada: transcreve com o modelo final e publica as legendas do rascunho que mudaram. Executa numa thread da fila."""
+    aligner = RefineAligner(draft_captions)
+
+    def on_segment(caption: dict, words: Optional[list], duration: float):
+        # Sem tempos por palavra (mídia longa ou WORD_TIMESTAMPS desligado), o segmento inteiro conta como uma palavra
+        words = words or [(caption["start"], caption["end"], " " + caption["text"], 1.0)]
+        ops = aligner.feed(words, caption["end"])
+        if ops: publish_refine(session_id, ops, min(1.0, caption["end"] / duration) if duration else None)
+
+    audio = get_audio(job)
+    job.check_cancelled()
+    result = transcribe_audio(job, audio, model, language, session_id, cache_key, file_size, long_media, "refine", on_segment)
+    ops = aligner.finish()
+    if ops: publish_refine(session_id, ops, 1.0)
+    return {**result, "captions": aligner.captions(), "model": model, "refined": True}
+
+def finish_refine(session_id: str, status: str, refined: bool):
+    status_broker.publish(session_id, {"status": status, "stepId": 10, "refined": refined})
+
+async def watch_refine(job: Job, session_id: str):
+    """Publica o status final da sessão quando o refinamento termina, é cancelado ou falha (o rascunho continua valendo)."""
+    try:
+        await job_scheduler.wait(job)
+        finish_refine(session_id, "Concluído", True)
+    except JobCancelled:
+        finish_refine(session_id, "Concluído (refinamento cancelado)", False)
+    except Exception as e:
+        logger.error(f"Erro no refinamento (sessão {session_id}): {e}")
+        finish_refine(session_id, "Concluído (falha no refinamento)", False)
+
+def schedule_refine(refine_id: str, draft: dict, get_audio, model: str, language: str, session_id: str, cache_key: str, file_size: int,
+                    long_media: Optional[bool], priority: int, pin: Optional[str] = None) -> Optional[Job]:
+    """Enfileira o refinamento de um rascunho pronto, abaixo da prioridade das primeiras passadas de outras sessões."""
+    try:
+        job = submit_job(lambda job: refine_transcription(job, draft["captions"], get_audio, model, language, session_id, cache_key, file_size, long_media),
+                         priority=priority - 1, pin=pin, job_id=refine_id, session_id=session_id, refine=True)
+    except HTTPException:
+        finish_refine(session_id, "Concluído (sem refinamento: servidor ocupado)", False)
+        return None
+    publish_refine(session_id, [], 0.0, job_id=job.id, model=model)
+    asyncio.create_task(watch_refine(job, session_id))
+    return job
+
+async def refine_after(draft_job: Job, refine_id: str, get_audio, model: str, language: str, session_id: str, cache_key: str, file_size: int,
+                       long_media: Optional[bool], priority: int, pin: Optional[str] = None):
+    """Aguarda o rascunho de uma tarefa assíncrona e enfileira o refinamento (erro/cancelamento do rascunho já foram publicados).
+
+    `pin` chega já fixado por quem chamou e é solto depois que o refinamento fixa o seu.
+    """
+    try:
+        try:
+            draft = await job_scheduler.wait(draft_job)
+        except Exception:
+            return
+        schedule_refine(refine_id, draft, get_audio, model, language, session_id, cache_key, file_size, long_media, priority, pin)
+    finally:
+        if pin: media_store.unpin(pin)
+
+@app.post("/api/transcribe")
+async def transcribe_video(request: Request, file: Optional[UploadFile] = File(None), asset_id: Optional[str] = Form(None), model: str = Form(DEFAULT_MODEL), language: Optional[str] = Form("pt"), session_id: Optional[str] = Form(None), priority: int = Form(0), long_media: Optional[bool] = Form(None), draft_model: Optional[str] = Form(None)):
+    """Transcreve o áudio de um arquivo de vídeo enviado (ou de um asset já armazenado).
+
+    Com `draft_model` (ex.: "tiny"), responde com o rascunho desse modelo e refina em segundo plano
+    com `model`: os diffs chegam no SSE como eventos `refine` e a tarefa `refine_job_id` pode ser
+    cancelada (DELETE /api/jobs/{id}) quando o usuário começa a editar.
+    """
     session_id = session_id or str(uuid.uuid4())
     language = language or "pt"
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
+    asset = None
+    try:
+        draft_model = check_draft_model(draft_model, model)
+        asset, cache_key, cached = await receive_upload(file, asset_id, model, language, session_id)
+        if cached is not None: return JSONResponse(cached)
+
+        first_model, first_key, phase = model, cache_key, "final"
+        if draft_model:
+            first_model, phase = draft_model, "draft"
+            first_key = make_cache_key(asset["asset_id"], draft_model, language, ULTRA_SPEED_CONFIG)
+        result = lookup_cached(first_key, session_id, asset["size"], final=False) if draft_model else None
+        if result is None:
+            update_status(session_id, "Aguardando na fila...", 2)
+            job = submit_job(lambda job: transcribe_file(job, asset, first_model, language, session_id, first_key, long_media, phase),
+                             priority=priority, pin=asset["asset_id"], session_id=session_id)
+            async with cancel_on_disconnect(request, lambda: job_scheduler.cancel(job.id)):
+                result = await job_scheduler.wait(job)
+        if not draft_model: return JSONResponse(result)
+
+        refine = schedule_refine(str(uuid.uuid4()), result, lambda job: extract_asset_audio(asset, job.cancel_event),
+                                 model, language, session_id, cache_key, asset["size"], long_media, priority, asset["asset_id"])
+        return JSONResponse({**result, "asset_id": asset["asset_id"], "draft": True, "draft_model": draft_model, "model": model,
+                             "refine_job_id": refine.id if refine else None})
+    except JobCancelled:
+        raise HTTPException(status_code=409, detail="Transcrição cancelada.")
+    except Exception as e:
+        logger.error(f"Erro na transcrição (sessão {session_id}): {e}")
+        update_status(session_id, "Erro", 0)
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if asset: media_store.unpin(asset["asset_id"])
+
+@app.post("/api/transcribe-stream")
+async def transcribe_stream(request: Request, filename: str, model: str = DEFAULT_MODEL, language: str = "pt", session_id: Optional[str] = None, priority: int = 0, long_media: Optional[bool] = None, draft_model: Optional[str] = None):
+    """Transcreve o vídeo enviado como corpo bruto da requisição, sem arquivos temporários.
+
+    O FFmpeg decodifica o áudio enquanto o upload ainda chega; o PCM vai direto para a memória.
+    Vídeos MP4 sem "faststart" (índice no fim do arquivo) não podem ser lidos por pipe: use /api/transcribe.
+    `draft_model` funciona como em /api/transcribe (o áudio fica em memória até o fim do refinamento).
+    """
+    validate_filename(filename)
+    if model not in WHISPER_MODELS: raise HTTPException(status_code=400, detail=f"Modelo inválido: {model}")
+    draft_model = check_draft_model(draft_model, model)
+    session_id = session_id or str(uuid.uuid4())
+    status_broker.reset(session_id)
+    update_status(session_id, "Recebendo arquivo e extraindo áudio...", 3)
+
+    loop = asyncio.get_running_loop()
+    extractor = PipeAudioExtractor(get_ffmpeg_pipe_cmd())
+    hasher, file_size = hashlib.sha256(), 0
+    try:
         try:
-            update_status(session_id, "Salvando arquivo...", 2)
-            temp_video = os.path.join(temp_dir, f"video{Path(file.filename).suffix}")
-            file_size = await save_file_stream(file, temp_video)
-
-            update_status(session_id, "Extraindo áudio...", 3)
-            temp_audio = os.path.join(temp_dir, "audio.wav")
-            run_ffmpeg(get_ffmpeg_cmd(temp_video, temp_audio), "Erro ao extrair áudio")
-
-            update_status(session_id, "Carregando modelo...", 5)
-            whisper_model = get_model(model)
-            
-            update_status(session_id, "Transcrevendo...", 6)
-            segments, info = whisper_model.transcribe(temp_audio, language=language, **ULTRA_SPEED_CONFIG)
-
-            captions = [{"id": i + 1, "start": s.start, "end": s.end, "text": s.text.strip()} for i, s in enumerate(segments)]
-            
-            response = {
-                "captions": captions, "language": language, "duration": info.duration,
-                "file_size_mb": round(file_size / (1024 * 1024), 2), "session_id": session_id,
-            }
-            update_status(session_id, "Concluído", 10)
-            return JSONResponse(response)
+            extractor.start()
+            with tracer.stage(session_id, "upload_extract"):
+                async for chunk in request.stream():
+                    file_size += len(chunk)
+                    if file_size > MAX_FILE_SIZE:
+                        raise HTTPException(status_code=413, detail=f"Arquivo muito grande. Máximo: {MAX_FILE_SIZE/(1024*1024):.0f}MB")
+                    hasher.update(chunk)
+                    await loop.run_in_executor(None, extractor.write, chunk)
+            BYTES_PROCESSED.inc(file_size, kind="upload")
+
+            cache_key = make_cache_key(hasher.hexdigest(), model, language, ULTRA_SPEED_CONFIG)
+            cached = lookup_cached(cache_key, session_id, file_size)
+            if cached is not None: return JSONResponse(cached)
+            first_model, first_key, phase = model, cache_key, "final"
+            if draft_model:
+                first_model, phase = draft_model, "draft"
+                first_key = make_cache_key(hasher.hexdigest(), draft_model, language, ULTRA_SPEED_CONFIG)
+            result = lookup_cached(first_key, session_id, file_size, final=False) if draft_model else None
+            with tracer.stage(session_id, "extract"):
+                audio = await loop.run_in_executor(None, extractor.finish)
+        except PipeExtractionError as e:
+            logger.error(f"Erro no FFmpeg: {e.stderr}")
+            raise HTTPException(status_code=422, detail=f"{e}: {e.stderr}")
+        finally:
+            extractor.kill()
+
+        def run(job: Job):
+            with track_session(session_id):
+                return transcribe_audio(job, audio, first_model, language, session_id, first_key, file_size, long_media, phase)
+
+        if result is None:
+            update_status(session_id, "Aguardando na fila...", 3)
+            job = submit_job(run, priority=priority, session_id=session_id)
+            async with cancel_on_disconnect(request, lambda: job_scheduler.cancel(job.id)):
+                result = await job_scheduler.wait(job)
+        if not draft_model: return JSONResponse(result)
+
+        refine = schedule_refine(str(uuid.uuid4()), result, lambda job: audio, model, language, session_id, cache_key, file_size, long_media, priority)
+        return JSONResponse({**result, "draft": True, "draft_model": draft_model, "model": model, "refine_job_id": refine.id if refine else None})
+    except JobCancelled:
+        raise HTTPException(status_code=409, detail="Transcrição cancelada.")
+    except Exception as e:
+        logger.error(f"Erro na transcrição (sessão {session_id}): {e}")
+        update_status(session_id, "Erro", 0)
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+def transcribe_url(job: Job, url: str, model: str, language: str, session_id: str, cache_key: str, long_media: Optional[bool] = None) -> dict:
+    """Baixa só o áudio do vídeo, converte para WAV de 16 kHz e transcreve. Executa numa thread da fila de tarefas."""
+    with track_session(session_id), tempfile.TemporaryDirectory() as temp_dir:
+        update_status(session_id, "Baixando áudio...", 3)
+        try:
+            with tracer.stage(session_id, "download"):
+                source, _ = download_audio(url, temp_dir, COOKIES_FILE, MAX_FILE_SIZE, lambda p: publish_progress(session_id, "download", p), job.cancel_event)
+            BYTES_PROCESSED.inc(os.path.getsize(source), kind="download")
         except Exception as e:
-            logger.error(f"Erro na transcrição (sessão {session_id}): {e}")
-            update_status(session_id, "Erro", 0)
-            if isinstance(e, HTTPException): raise e
-            raise HTTPException(status_code=500, detail=str(e))
+            job.check_cancelled()
+            error_message = str(e).lower()
+            if "sign in" in error_message or "age-restricted" in error_message:
+                raise HTTPException(status_code=403, detail="Vídeo requer login. Coloque um arquivo 'cookies.txt' válido na raiz do projeto.")
+            raise HTTPException(status_code=502, detail=f"Erro no download: {e}")
+        job.check_cancelled()
+        update_status(session_id, "Extraindo áudio...", 3)
+        audio_path = os.path.join(temp_dir, "extracted.wav")
+        with tracer.stage(session_id, "extract"):
+            run_ffmpeg(get_ffmpeg_cmd(source, audio_path), "Erro ao extrair áudio", cancel_event=job.cancel_event,
+                       on_progress=lambda p: publish_progress(session_id, "extract", p))
+        job.check_cancelled()
+        return transcribe_audio(job, audio_path, model, language, session_id, cache_key, os.path.getsize(source), long_media)
+
+@app.post("/api/transcribe-url")
+async def transcribe_from_url(request: Request, body: TranscribeURLRequest):
+    """Transcreve um vídeo do YouTube baixando no servidor só o stream de áudio (sem passar o vídeo pelo navegador)."""
+    key = video_key(body.url)
+    if not key: raise HTTPException(status_code=400, detail="URL inválida. Apenas links do YouTube são permitidos.")
+    model, language = body.model or DEFAULT_MODEL, body.language or "pt"
+    if model not in WHISPER_MODELS: raise HTTPException(status_code=400, detail=f"Modelo inválido: {model}")
+    session_id = body.session_id or str(uuid.uuid4())
+    status_broker.reset(session_id)
+    update_status(session_id, "Buscando vídeo...", 2)
+    try:
+        try:
+            metadata = await youtube_metadata.get(body.url, executor)
+        except Exception as e:
+            logger.error(f"Erro ao buscar metadados do YouTube: {e}")
+            raise HTTPException(status_code=502, detail="Falha ao obter metadados do vídeo. Verifique a URL ou tente novamente.")
+        extra = {"title": metadata["title"], "source_url": body.url}
+
+        # O mesmo vídeo é o mesmo conteúdo: o cache usa o id do vídeo no lugar do hash da mídia
+        cache_key = make_cache_key(key, model, language, ULTRA_SPEED_CONFIG)
+        cached = lookup_cached(cache_key, session_id, 0)
+        if cached is not None: return JSONResponse({**cached, **extra})
+
+        update_status(session_id, "Aguardando na fila...", 2)
+        job = submit_job(lambda job: transcribe_url(job, body.url, model, language, session_id, cache_key, body.long_media),
+                         priority=body.priority, session_id=session_id, source_url=body.url)
+        async with cancel_on_disconnect(request, lambda: job_scheduler.cancel(job.id)):
+            return JSONResponse({**await job_scheduler.wait(job), **extra})
+    except JobCancelled:
+        raise HTTPException(status_code=409, detail="Transcrição cancelada.")
+    except Exception as e:
+        logger.error(f"Erro na transcrição (sessão {session_id}): {e}")
+        update_status(session_id, "Erro", 0)
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/jobs")
+async def create_transcription_job(file: Optional[UploadFile] = File(None), asset_id: Optional[str] = Form(None), model: str = Form(DEFAULT_MODEL), language: Optional[str] = Form("pt"), session_id: Optional[str] = Form(None), priority: int = Form(0), long_media: Optional[bool] = Form(None), draft_model: Optional[str] = Form(None)):
+    """Enfileira uma transcrição e retorna imediatamente o id da tarefa para consulta posterior.
+
+    Com `draft_model`, a tarefa produz o rascunho e `refine_job_id` é a tarefa de refinamento,
+    enfileirada assim que o rascunho fica pronto.
+    """
+    session_id = session_id or str(uuid.uuid4())
+    language = language or "pt"
+    draft_model = check_draft_model(draft_model, model)
+    asset, cache_key, cached = await receive_upload(file, asset_id, model, language, session_id)
+    try:
+        if cached is not None:
+            job = submit_job(lambda job: cached, priority=priority, session_id=session_id, asset_id=asset["asset_id"])
+        elif draft_model:
+            draft_key = make_cache_key(asset["asset_id"], draft_model, language, ULTRA_SPEED_CONFIG)
+            draft = lookup_cached(draft_key, session_id, asset["size"], final=False)
+            refine_id = str(uuid.uuid4())
+            run = (lambda job: draft) if draft is not None else \
+                (lambda job: transcribe_file(job, asset, draft_model, language, session_id, draft_key, long_media, "draft"))
+            job = submit_job(run, priority=priority, pin=asset["asset_id"], session_id=session_id, asset_id=asset["asset_id"], draft_model=draft_model, refine_job_id=refine_id)
+            media_store.pin(asset["asset_id"])  # Entre o fim do rascunho e o refinamento; refine_after solta
+            asyncio.create_task(refine_after(job, refine_id, lambda job: extract_asset_audio(asset, job.cancel_event),
+                                             model, language, session_id, cache_key, asset["size"], long_media, priority, asset["asset_id"]))
+        else:
+            job = submit_job(lambda job: transcribe_file(job, asset, model, language, session_id, cache_key, long_media),
+                             priority=priority, pin=asset["asset_id"], session_id=session_id, asset_id=asset["asset_id"])
+    finally:
+        media_store.unpin(asset["asset_id"])  # A tarefa já fixou o seu
+    return JSONResponse(job.to_dict(job_scheduler.position(job)), status_code=202)
+
+@app.get("/api/jobs")
+async def get_jobs_stats():
+    """Resumo da fila: slots, tarefas em espera e em execução, e os processos FFmpeg ativos."""
+    state = await asyncio.get_running_loop().run_in_executor(executor, state_backend.stats)  # No SQLite, espera a fila de escrita e consulta o disco
+    return {**job_scheduler.stats(), "ffmpeg": ffmpeg_runner.stats(), "worker": WORKER_ID, "state": state}
+
+async def get_shared_job(job_id: str) -> dict:
+    """Estado de uma tarefa executada por outro worker, lido do backend compartilhado."""
+    record = await asyncio.get_running_loop().run_in_executor(executor, state_backend.get_job, job_id)
+    if not record: raise HTTPException(status_code=404, detail="Tarefa não encontrada.")
+    return record
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Consulta o estado de uma tarefa; inclui o resultado quando concluída."""
+    job = job_scheduler.get(job_id)
+    if not job: return await get_shared_job(job_id)
+    return {**job.to_dict(job_scheduler.position(job)), "worker": WORKER_ID}
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancela uma tarefa em espera ou em execução (o FFmpeg e a inferência são interrompidos).
+
+    Se a tarefa pertence a outro worker, o pedido é repassado a ele pelo backend compartilhado
+    e a resposta traz `cancel_requested`; o status final aparece em seguida em GET /api/jobs/{id}.
+    """
+    job = job_scheduler.cancel(job_id)
+    if job: return {**job.to_dict(), "worker": WORKER_ID}
+    record = await get_shared_job(job_id)
+    if record["status"] in ("queued", "running"):
+        state_backend.request_cancel(job_id)
+        record["cancel_requested"] = True
+    return record
+
+# No modo em lote o VAD corta trechos de até 30 s (padrão do pipeline), que são decodificados juntos
+# (os tempos por palavra não são usados na saída do lote)
+BATCH_CONFIG = {k: v for k, v in ULTRA_SPEED_CONFIG.items() if k not in ("vad_parameters", "word_timestamps")}
+
+def prepare_batch_item(source: str, model: str, language: str, cancel_event: Optional[threading.Event] = None) -> dict:
+    """Baixa (se for URL) e extrai o áudio de um item do lote; devolve o resultado do cache se já houver."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if batch_transcription.is_url(source):
+            if not video_key(source): raise HTTPException(status_code=400, detail="URL inválida. Apenas links do YouTube são permitidos.")
+            media_key = video_key(source)
+            cache_key = make_cache_key(media_key, model, language, {**BATCH_CONFIG, "batched": True})
+            if (cached := transcription_cache.get(cache_key)) is not None: return {**cached, "cache_key": cache_key}
+            path, _ = download_audio(source, temp_dir, COOKIES_FILE, MAX_FILE_SIZE, cancel_event=cancel_event)
+        else:
+            path = source
+            if os.path.getsize(path) > MAX_FILE_SIZE: raise HTTPException(status_code=413, detail=f"Arquivo muito grande. Máximo: {MAX_FILE_SIZE/(1024*1024):.0f}MB")
+            cache_key = make_cache_key(hash_file(path), model, language, {**BATCH_CONFIG, "batched": True})
+            if (cached := transcription_cache.get(cache_key)) is not None: return {**cached, "cache_key": cache_key}
+        audio_path = os.path.join(temp_dir, "extracted.wav")
+        run_ffmpeg(get_ffmpeg_cmd(path, audio_path), "Erro ao extrair áudio", cancel_event=cancel_event)
+        audio = batch_transcription.read_wav(audio_path)
+    return {"audio": audio, "duration": len(audio) / batch_transcription.SAMPLE_RATE, "cache_key": cache_key}
+
+def transcribe_batch_item(prepared: dict, model: str, language: str, batch_size: int, cancel_event: Optional[threading.Event] = None) -> dict:
+    """Transcreve o áudio de um item; com `batch_size` > 1, o modelo residente decodifica vários trechos por passada.
+
+    O pipeline em lote precisa do modelo neste processo, mesmo com INFERENCE_WORKERS; sem ele, o item vai para os workers.
+    """
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:  # faster-whisper < 1.1
+        BatchedInferencePipeline = None
+    batched = BatchedInferencePipeline is not None and batch_size > 1
+    whisper_model = model_pool.get(model) if batched else get_model(model, cancel_event)
+    if batched:
+        segments, info = BatchedInferencePipeline(model=whisper_model).transcribe(prepared["audio"], language=language, batch_size=batch_size, **BATCH_CONFIG)
+    else:
+        segments, info = whisper_model.transcribe(prepared["audio"], language=language, **{**ULTRA_SPEED_CONFIG, "word_timestamps": False})
+    captions = []
+    for s in segments:
+        if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Lote cancelado")
+        if s.text.strip(): captions.append({"id": len(captions) + 1, "start": s.start, "end": s.end, "text": s.text.strip()})
+    AUDIO_SECONDS.inc(prepared["duration"], model=model)
+    result = {"captions": captions, "language": info.language or language, "duration": prepared["duration"]}
+    transcription_cache.put(prepared["cache_key"], result)
+    return result
+
+def transcribe_batch(items: List[str], output_dir: str, model: str, language: str, batch_size: Optional[int] = None, retry_failed: bool = False,
+                     cancel_event: Optional[threading.Event] = None, on_item=None) -> dict:
+    """Transcreve uma lista de arquivos/URLs gravando .srt/.json em `output_dir` (usado pela API e pela linha de comando)."""
+    if model not in WHISPER_MODELS: raise HTTPException(status_code=400, detail=f"Modelo inválido: {model}")
+    batch_size = batch_size or BATCH_SIZE
+    def prepare(source: str) -> dict:
+        with tracer.stage(None, "batch_prepare"):
+            return prepare_batch_item(source, model, language, cancel_event)
+
+    def transcribe(prepared: dict) -> dict:
+        with tracer.stage(None, "batch_decode"):
+            return transcribe_batch_item(prepared, model, language, batch_size, cancel_event)
+
+    return batch_transcription.run_batch(
+        items, output_dir, prepare, transcribe, create_srt,
+        lookahead=BATCH_LOOKAHEAD, retry_failed=retry_failed, cancel_event=cancel_event, on_item=on_item)
+
+def resolve_batch_path(relative: str) -> str:
+    """Caminho dentro de BATCH_ROOT; recusa qualquer coisa fora dela."""
+    root = os.path.realpath(BATCH_ROOT)
+    path = os.path.realpath(os.path.join(root, relative))
+    if path != root and not path.startswith(root + os.sep): raise HTTPException(status_code=400, detail=f"Caminho fora de BATCH_ROOT: {relative}")
+    return path
+
+@app.post("/api/batch")
+async def create_batch(body: BatchRequest):
+    """Enfileira a transcrição em lote de arquivos do servidor e URLs; retorna o id da tarefa e a pasta de saída.
+
+    O progresso por item fica em GET /api/batch/{output} e, para a sessão de mesmo nome, em /api/transcribe-status.
+    Reenviar o mesmo `output` retoma o lote, pulando os itens já concluídos.
+    """
+    items = list(body.items)
+    try:
+        if body.directory: items += batch_transcription.collect_items(resolve_batch_path(body.directory), ALLOWED_EXTENSIONS)
+        if body.manifest: items += batch_transcription.collect_items(resolve_batch_path(body.manifest), ALLOWED_EXTENSIONS)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Não foi possível ler a entrada do lote: {e}")
+    items = [i if batch_transcription.is_url(i) else resolve_batch_path(i) for i in dict.fromkeys(items)]
+    missing = [i for i in items if not batch_transcription.is_url(i) and not os.path.isfile(i)]
+    if missing: raise HTTPException(status_code=400, detail=f"Arquivo(s) não encontrado(s): {', '.join(missing[:5])}")
+    if not items: raise HTTPException(status_code=400, detail="Nenhum item para transcrever.")
+    model = body.model or DEFAULT_MODEL
+    if model not in WHISPER_MODELS: raise HTTPException(status_code=400, detail=f"Modelo inválido: {model}")
+
+    batch_id = body.output or uuid.uuid4().hex
+    if not re.fullmatch(r"[\w.-]+", batch_id): raise HTTPException(status_code=400, detail="Nome de saída inválido.")
+    output_dir = resolve_batch_path(os.path.join("output", batch_id))
+    status_broker.reset(batch_id)
+
+    def run(job: Job):
+        done = 0
+        def on_item(source: str, entry: dict):
+            nonlocal done
+            done += 1
+            status_broker.publish(batch_id, {"type": "batch_item", "source": source, "done": done, "total": len(items), **entry})
+        with track_session(batch_id):
+            update_status(batch_id, f"Transcrevendo {len(items)} item(ns) em lote...", 6)
+            summary = transcribe_batch(items, output_dir, model, body.language or "pt", body.batch_size, body.retry_failed, job.cancel_event, on_item)
+            job.check_cancelled()
+            update_status(batch_id, "Concluído", 10)
+            return summary
+
+    job = submit_job(run, priority=body.priority, session_id=batch_id, batch_id=batch_id, items=len(items))
+    return JSONResponse({**job.to_dict(job_scheduler.position(job)), "batch_id": batch_id, "items": len(items)}, status_code=202)
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """Resumo (itens concluídos, falhas, RTF) e estado por item de um lote."""
+    if not re.fullmatch(r"[\w.-]+", batch_id): raise HTTPException(status_code=400, detail="Nome de lote inválido.")
+    progress_path = os.path.join(resolve_batch_path(os.path.join("output", batch_id)), "progress.json")
+    if not os.path.exists(progress_path): raise HTTPException(status_code=404, detail="Lote não encontrado.")
+    progress = batch_transcription.BatchProgress(progress_path)
+    return {"batch_id": batch_id, **progress.summary(), "items": progress.items}
+
+def probe_asset(asset: dict) -> dict:
+    """Keyframes e duração do vídeo do asset, analisados uma única vez."""
+    probe_path = media_store.derived_path(asset["asset_id"], "probe.json")
+    try:
+        with open(probe_path, "r", encoding="utf-8") as f:
+            probe = json.load(f)
+        if probe.get("version") == render_engine.PROBE_VERSION: return probe
+    except (OSError, ValueError):
+        pass
+    probe = render_engine.probe_keyframes(asset["path"])
+    temp_path = f"{probe_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(probe, f)
+    os.replace(temp_path, probe_path)
+    return probe
+
+def render_captions(asset: dict, captions_data: List[dict], temp_dir: str, session_id: str, cancel_event: threading.Event) -> str:
+    """Queima as legendas no vídeo do asset, por segmentos em paralelo; devolve o caminho do arquivo gerado.
+
+    Segmentos cujas legendas não mudaram desde uma renderização anterior vêm do cache, sem recodificar.
+    O progresso é publicado na sessão e `cancel_event` interrompe todos os FFmpegs em curso.
+    """
+    output_video = os.path.join(temp_dir, "output.mp4")
+    on_progress = lambda p: publish_progress(session_id, "render", p)
+    run = lambda cmd, error_msg, **kwargs: run_ffmpeg(cmd, error_msg, cancel_event=cancel_event, **kwargs)
+    try:
+        probe = probe_asset(asset)
+    except render_engine.ProbeError as e:
+        # Sem informação de keyframes, volta para a renderização em um único processo
+        logger.warning(f"Não foi possível analisar os keyframes, renderizando em passo único: {e}")
+        srt_path = os.path.join(temp_dir, "subtitles.srt")
+        create_srt(captions_data, srt_path)
+        render_cmd = ["ffmpeg", "-i", asset["path"], "-vf", render_engine.subtitles_filter(srt_path), "-c:a", "copy", "-c:v", "libx264",
+                      "-preset", RENDER_CONFIG["preset"], "-crf", str(RENDER_CONFIG["crf"]), "-y", output_video]
+        run(render_cmd, "Erro ao renderizar vídeo", timeout=600, encode=True, on_progress=on_progress)
+        return output_video
+    workers = RENDER_CONFIG["workers"]
+    split_root = media_store.derived_path(asset["asset_id"], "render")
+    os.makedirs(split_root, exist_ok=True)
+    stats = render_engine.render_segmented(
+        asset["path"], captions_data, output_video, temp_dir, create_srt, run, workers, RENDER_CONFIG["preset"],
+        RENDER_CONFIG["crf"], RENDER_CONFIG["segment_s"], threads_per_worker=max(1, CPU_CORES // workers), probe=probe,
+        split_root=split_root, segment_cache=segment_cache, source_id=asset["asset_id"], on_progress=on_progress)
+    logger.info(f"Renderização: {stats['segments']} segmentos, {stats['encoded']} recodificados, {stats['reused']} do cache, {stats['copied']} copiados")
+    return output_video
 
 @app.post("/api/render")
-async def render_video(file: UploadFile = File(...), captions: UploadFile = File(...), background_tasks: BackgroundTasks = BackgroundTasks()):
-    """Renderiza legendas em um arquivo de vídeo."""
-    validate_file(file)
+async def render_video(request: Request, file: Optional[UploadFile] = File(None), captions: UploadFile = File(...), asset_id: Optional[str] = Form(None), session_id: Optional[str] = Form(None), background_tasks: BackgroundTasks = BackgroundTasks()):
+    """Renderiza legendas em um arquivo de vídeo (enviado ou já armazenado como asset).
+
+    Com `session_id`, o progresso (porcentagem, fps) é publicado em /api/transcribe-status; se o cliente
+    desconectar, a renderização é interrompida.
+    """
     if not captions.filename or not captions.filename.endswith('.json'):
         raise HTTPException(status_code=400, detail="Legendas devem ser um arquivo JSON.")
 
-    import re
+    session_id = session_id or str(uuid.uuid4())
+    status_broker.reset(session_id)
+    cancel_event = threading.Event()
+    asset = None
     with tempfile.TemporaryDirectory() as temp_dir:
         try:
-            temp_video = os.path.join(temp_dir, f"video{Path(file.filename).suffix}")
-            await save_file_stream(file, temp_video)
+            with tracer.stage(session_id, "upload" if file is not None else "asset_lookup"):
+                asset = await resolve_media(file, asset_id)
 
             captions_data = json.loads(await captions.read())
             if not isinstance(captions_data, list): raise ValueError("JSON de legendas inválido.")
 
-            srt_path = os.path.join(temp_dir, "subtitles.srt")
-            create_srt(captions_data, srt_path)
-            output_video = os.path.join(temp_dir, "output.mp4")
-            srt_escaped = srt_path.replace('\\', '/').replace(':', '\\:')
-            vf_filter = f"subtitles='{srt_escaped}':force_style='Fontsize=16,Outline=1,Shadow=0.5,BorderStyle=1,PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&'"
-            render_cmd = ["ffmpeg", "-i", temp_video, "-vf", vf_filter, "-c:a", "copy", "-c:v", "libx264", "-preset", "medium", "-crf", "23", "-y", output_video]
-            run_ffmpeg(render_cmd, "Erro ao renderizar vídeo", timeout=600)
+            update_status(session_id, "Renderizando vídeo...", 8)
+            async with cancel_on_disconnect(request, cancel_event.set):
+                with tracer.stage(session_id, "render"):
+                    output_video = await asyncio.get_running_loop().run_in_executor(None, render_captions, asset, captions_data, temp_dir, session_id, cancel_event)
             if not os.path.exists(output_video): raise HTTPException(status_code=500, detail="Arquivo renderizado não foi criado.")
 
             # Corrigido: salva o arquivo legendado em FILES_DIR com nome seguro
-            safe_filename = re.sub(r'[<>:"/\\|?*]', '_', f"legendado_{Path(file.filename).stem}.mp4")
+            safe_filename = re.sub(r'[<>:"/\\|?*]', '_', f"legendado_{Path(asset['filename']).stem}.mp4")
             persist_path = os.path.join(FILES_DIR, safe_filename)
             shutil.copy2(output_video, persist_path)
+            BYTES_PROCESSED.inc(os.path.getsize(persist_path), kind="render_output")
             # Opcional: agendar limpeza futura, se desejar
             # background_tasks.add_task(os.remove, persist_path)
-            return JSONResponse({"filename": safe_filename, "url": f"/files/{safe_filename}"})
+            update_status(session_id, "Concluído", 10)
+            return JSONResponse({"filename": safe_filename, "url": f"/files/{safe_filename}", "asset_id": asset["asset_id"], "session_id": session_id})
+        except JobCancelled:
+            update_status(session_id, "Cancelado", 0)
+            raise HTTPException(status_code=409, detail="Renderização cancelada.")
         except Exception as e:
             logger.error(f"Erro na renderização: {e}")
+            update_status(session_id, "Erro", 0)
             if isinstance(e, HTTPException): raise e
             raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            if asset: media_store.unpin(asset["asset_id"])
+
+@app.get("/api/render/cache")
+async def get_render_cache_stats():
+    """Tamanho e acertos do cache de segmentos renderizados."""
+    return segment_cache.stats()
+
+@app.post("/api/assets")
+async def upload_asset(file: UploadFile = File(...)):
+    """Armazena um vídeo de uma só vez e devolve seu asset_id (hash SHA-256 do conteúdo)."""
+    return await ingest_upload(file)
+
+@app.post("/api/assets/uploads")
+async def create_asset_upload(request: AssetUploadRequest):
+    """Inicia um upload em pedaços; `sha256`, se informado, é conferido ao completar (a deduplicação acontece depois de receber os bytes)."""
+    validate_filename(request.filename)
+    try:
+        return media_store.create_upload(request.filename, request.size, request.sha256)
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.get("/api/assets/uploads/{upload_id}")
+async def get_asset_upload(upload_id: str):
+    """Informa quantos bytes já foram recebidos, para retomar um upload interrompido."""
+    try:
+        return media_store.upload_status(upload_id)
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.put("/api/assets/uploads/{upload_id}")
+async def append_asset_upload(upload_id: str, request: Request, offset: int):
+    """Recebe o próximo pedaço (corpo bruto) a partir de `offset` bytes."""
+    try:
+        with media_store.open_chunk(upload_id, offset) as f:
+            size = offset
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail=f"Arquivo muito grande. Máximo: {MAX_FILE_SIZE/(1024*1024):.0f}MB")
+                f.write(chunk)
+        return {"upload_id": upload_id, "offset": size}
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.post("/api/assets/uploads/{upload_id}/complete")
+async def complete_asset_upload(upload_id: str):
+    """Finaliza o upload: confere tamanho e hash e devolve o asset (deduplicado pelo conteúdo)."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, media_store.complete_upload, upload_id)
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.get("/api/assets")
+async def get_assets_stats():
+    """Quantidade e espaço ocupado pelos assets armazenados."""
+    return media_store.stats()
+
+@app.get("/api/assets/{asset_id}")
+async def get_asset_info(asset_id: str):
+    """Metadados de um asset armazenado."""
+    asset = get_asset(asset_id)
+    asset.pop("path")
+    return asset
+
+@app.delete("/api/assets/{asset_id}")
+async def delete_asset(asset_id: str):
+    """Remove um asset e seus arquivos derivados."""
+    try:
+        if not media_store.delete(asset_id): raise HTTPException(status_code=404, detail="Asset não encontrado.")
+    except MediaStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {"status": "ok"}
 
 @app.get("/api/transcribe-status")
 async def status_stream(request: Request, session_id: str):
-    """Fornece atualizações de status via Server-Sent Events."""
+    """Fornece atualizações de status via Server-Sent Events.
+
+    Status chegam como mensagens padrão; cada legenda decodificada chega como evento `segment`
+    com o progresso, permitindo editar o início do vídeo antes do fim da transcrição; o andamento dos
+    FFmpegs (extração e renderização) chega como evento `progress`. No modo rascunho, os diffs do
+    refinamento chegam como evento `refine` (ver refine.py) entre o status 7 e o final.
+    """
     async def generator():
-        last_status = None
-        while True:
+        async for event in status_broker.subscribe(session_id):
             if await request.is_disconnected(): break
-            status = status_cache.get(session_id)
-            if status != last_status and status:
-                yield f"data: {status}\n\n"
-                last_status = status
-            if status and json.loads(status).get("stepId") in [0, 10]:
-                status_cache.pop(session_id, None)
-                break
-            await asyncio.sleep(0.5)
+            if event is None:
+                yield ": ping\n\n"
+            elif event.get("type") in ("segment", "progress", "refine"):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            else:
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
     return StreamingResponse(generator(), media_type="text/event-stream")
 
+def prepare_engine():
+    """Importa o motor de inferência, detecta o dispositivo e aquece os modelos, fora do caminho da inicialização."""
+    engine_state["status"] = "loading"
+    try:
+        load_engine(WHISPER_ENGINE)  # O import pesado (CTranslate2, tokenizers) acontece aqui
+        device = get_device()
+        if CALIBRATION and CALIBRATION.get("device") != device:
+            logger.warning(f"Calibração feita em {CALIBRATION.get('device')}, mas o dispositivo atual é {device}; recalibre.")
+        models = list(dict.fromkeys(([DEFAULT_MODEL] if WARMUP_DEFAULT_MODEL else []) + PRELOAD_MODELS))
+        if inference_pool:
+            # Os threads do CTranslate2 são divididos entre os workers, que decodificam ao mesmo tempo
+            if not inference_pool.start(get_model_config(max(1, CPU_CORES // INFERENCE_WORKERS)), models): raise RuntimeError("Workers de inferência não iniciaram")
+        else:
+            model_pool.preload(models, warmup_model)
+        missing = [m for m in models if not is_model_resident(m)]
+        if missing: raise RuntimeError(f"Falha ao carregar: {', '.join(missing)}")
+        engine_state.update(status="ready", ready_at=time.time())
+        logger.info(f"Motor de inferência pronto em {engine_state['ready_at'] - engine_state['started_at']:.1f}s.")
+    except Exception as e:
+        engine_state.update(status="error", error=str(e))
+        logger.error(f"Motor de inferência indisponível: {e}")
+
+@app.on_event("startup")
+async def startup():
+    loop = asyncio.get_running_loop()
+    ffmpeg_runner.bind(loop)
+    loop_lag.start()
+    job_scheduler.start()
+    status_broker.start(on_cancel=lambda job_id: loop.call_soon_threadsafe(job_scheduler.cancel, job_id))
+    threading.Thread(target=media_store.cleanup, daemon=True).start()
+    threading.Thread(target=prepare_engine, daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    loop_lag.stop()
+    await job_scheduler.stop()
+    status_broker.close()
+    if _calibration_process and _calibration_process.returncode is None: _calibration_process.kill()
+    chunked_transcription.shutdown_pools()
+    if inference_pool: inference_pool.close()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato de texto do Prometheus."""
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/sessions/{session_id}/timings")
+async def get_session_timings(session_id: str):
+    """Tempo gasto em cada etapa (upload, fila, extração, modelo, decodificação, renderização) de uma sessão."""
+    timings = session_timings.get(session_id)
+    if timings is None: raise HTTPException(status_code=404, detail="Sessão sem tempos registrados.")
+    return timings
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN: raise HTTPException(status_code=403, detail="Administração desativada (defina ADMIN_TOKEN).")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de administração inválido.")
+
+async def run_calibration(cmd: List[str]):
+    """Executa `calibration.py` num processo separado (os modelos medidos não ficam na memória do servidor)."""
+    global _calibration_process
+    calibration_run.update(status="running", started_at=time.time(), finished_at=None, returncode=None, output=[])
+    try:
+        _calibration_process = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                                                                    stderr=asyncio.subprocess.STDOUT)
+        async for raw in _calibration_process.stdout:
+            calibration_run["output"] = (calibration_run["output"] + [raw.decode(errors="replace").rstrip()])[-50:]
+        returncode = await _calibration_process.wait()
+        calibration_run.update(status="done" if returncode == 0 else "error", returncode=returncode)
+    except Exception as e:
+        calibration_run.update(status="error", output=calibration_run["output"] + [str(e)])
+    finally:
+        calibration_run["finished_at"] = time.time()
+        _calibration_process = None
+
+@app.get("/api/admin/calibration", dependencies=[Depends(require_admin)])
+async def get_calibration():
+    """Calibração em uso, a gravada em disco (pode ser mais nova que a em uso) e o andamento de uma recalibração."""
+    return {"source": "calibration" if CALIBRATION else "memory", "active": CALIBRATION and CALIBRATION["selected"],
+            "config": {"hardware_tier": HARDWARE_TIER, "default_model": DEFAULT_MODEL, "max_workers": MAX_WORKERS, "cpu_threads": CPU_THREADS},
+            "stored": calibration.load(CALIBRATION_PATH), "run": calibration_run}
+
+@app.post("/api/admin/calibrate", dependencies=[Depends(require_admin)], status_code=202)
+async def recalibrate(models: Optional[str] = None, threads: Optional[str] = None, target_rtf: Optional[float] = None, audio_s: float = 30):
+    """Refaz a calibração em segundo plano e grava o resultado em CALIBRATION_PATH.
+
+    O servidor continua atendendo (as medidas disputam a CPU com o tráfego; prefira horários calmos)
+    e a nova configuração vale a partir do próximo início.
+    """
+    if calibration_run["status"] == "running": raise HTTPException(status_code=409, detail="Calibração já em andamento.")
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.py"),
+           "--output", CALIBRATION_PATH, "--audio-s", str(audio_s)]
+    if models: cmd += ["--models", models]
+    if threads: cmd += ["--threads", threads]
+    if target_rtf: cmd += ["--target-rtf", str(target_rtf)]
+    calibration_run["status"] = "running"
+    asyncio.create_task(run_calibration(cmd))
+    return {**calibration_run, "restart_required": True}
+
+@app.get("/api/sessions/{session_id}/captions")
+async def get_session_captions(session_id: str, format: str = "json", max_chars_per_line: int = 42, max_lines: int = 2, max_cps: float = 17.0,
+                               min_gap_ms: int = 80, min_duration_ms: int = 800, max_duration_ms: int = 7000, pause_ms: int = 700):
+    """Re-segmenta as legendas da sessão a partir dos tempos por palavra, sem nova transcrição.
+
+    Regras: caracteres por linha e linhas por legenda, velocidade de leitura máxima (caracteres por
+    segundo), intervalo mínimo entre legendas, duração mínima/máxima e pausa que força um corte.
+    `format` = json (legendas com `cps`), srt, vtt ou ass.
+    """
+    if format != "json" and format not in EXPORTERS: raise HTTPException(status_code=400, detail=f"Formato não suportado: {format}")
+    if max_chars_per_line < 1 or max_lines < 1 or max_cps <= 0 or min_gap_ms < 0 or max_duration_ms < min_duration_ms:
+        raise HTTPException(status_code=400, detail="Regras de segmentação inválidas.")
+    timings = await asyncio.get_running_loop().run_in_executor(None, word_store.get, session_id)
+    if timings is None: raise HTTPException(status_code=404, detail="Sessão sem tempos por palavra (transcreva com WORD_TIMESTAMPS ativo).")
+    captions = resegment(timings, max_chars_per_line, max_lines, max_cps, min_gap_ms, min_duration_ms, max_duration_ms, pause_ms)
+    if format == "json": return {"session_id": session_id, "words": len(timings), "captions": captions}
+    exporter, media_type = EXPORTERS[format]
+    return Response(content=exporter(captions), media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="legendas.{format}"'})
+
 @app.get("/api/health")
 async def health():
     """Verifica a saúde do sistema."""
     return {"status": "ok"}
 
+@app.get("/api/ready")
+async def ready():
+    """Prontidão para o balanceador: 200 quando o motor de inferência está carregado (e o modelo padrão aquecido), senão 503."""
+    is_ready = engine_state["status"] == "ready"
+    body = {"ready": is_ready, "engine": engine_state["status"], "error": engine_state["error"],
+            "device": get_device() if is_ready else None, "default_model": DEFAULT_MODEL,
+            "resident_models": [m for m in WHISPER_MODELS if is_model_resident(m)], "uptime_s": round(time.time() - engine_state["started_at"], 1)}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Retorna tamanho, acertos e falhas do cache de transcrições."""
+    return transcription_cache.stats()
+
+@app.get("/api/youtube-metadata/cache")
+async def get_youtube_metadata_cache_stats():
+    """Entradas e acertos do cache de metadados do YouTube."""
+    return youtube_metadata.stats()
+
+@app.delete("/api/cache")
+async def clear_cache():
+    """Esvazia o cache de transcrições."""
+    transcription_cache.clear()
+    return {"status": "ok"}
+
 @app.get("/api/models")
 async def get_available_models():
     """Lista os modelos Whisper disponíveis."""
     recommendations = {"low": ["tiny"], "medium": ["base"], "high": ["small"], "ultra": ["medium"]}
     return {"models": WHISPER_MODELS, "default": DEFAULT_MODEL, "recommended": recommendations.get(HARDWARE_TIER, ["small"])}
 
+@app.get("/api/models/pool")
+async def get_model_pool_stats():
+    """Modelos residentes, memória estimada, tempos de carregamento e acertos do pool (e dos workers de inferência, se ativos)."""
+    if inference_pool: return {**model_pool.stats(), "inference_workers": inference_pool.stats()}
+    return model_pool.stats()
+
 @app.get("/api/languages")
 async def get_available_languages():
     """Lista os idiomas suportados para transcrição."""
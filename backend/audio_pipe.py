@@ -0,0 +1,97 @@
+"""Extração de áudio por pipe, sem arquivos temporários.
+
+Os bytes do upload entram no stdin do FFmpeg à medida que chegam; o PCM s16le de 16 kHz
+que sai no stdout é convertido para float32 direto num buffer NumPy pré-alocado, pronto
+para o `WhisperModel.transcribe`.
+"""
+import subprocess
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+_READ_SIZE = 1 << 16
+
+
+class PipeExtractionError(Exception):
+    def __init__(self, message: str, stderr: str = ""):
+        super().__init__(message)
+        self.stderr = stderr
+
+
+class PipeAudioExtractor:
+    """Processo FFmpeg alimentado por `write` e lido por uma thread que preenche o buffer de saída."""
+
+    def __init__(self, cmd: List[str], initial_seconds: float = 600):
+        self.cmd = cmd
+        self._buffer = np.empty(int(initial_seconds * SAMPLE_RATE), dtype=np.float32)
+        self._samples = 0
+        self._stderr = b""
+        self._proc: Optional[subprocess.Popen] = None
+        self._threads = []
+
+    def start(self):
+        try:
+            self._proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise PipeExtractionError("FFmpeg não encontrado. Verifique se está instalado e no PATH do sistema.")
+        self._threads = [threading.Thread(target=self._read_stdout, daemon=True), threading.Thread(target=self._read_stderr, daemon=True)]
+        for t in self._threads: t.start()
+        return self
+
+    @property
+    def decoded_seconds(self) -> float:
+        return self._samples / SAMPLE_RATE
+
+    def write(self, chunk: bytes):
+        """Envia um pedaço do upload ao FFmpeg (bloqueia se o pipe estiver cheio; chame fora do event loop)."""
+        try:
+            self._proc.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            raise PipeExtractionError("Erro ao extrair áudio", self._stderr.decode(errors="replace"))
+
+    def finish(self, timeout: float = 300) -> np.ndarray:
+        """Fecha a entrada, espera o FFmpeg terminar e devolve o áudio decodificado."""
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            raise PipeExtractionError("Timeout: Erro ao extrair áudio")
+        for t in self._threads: t.join()
+        if self._proc.returncode != 0:
+            raise PipeExtractionError("Erro ao extrair áudio", self._stderr.decode(errors="replace"))
+        return self._buffer[:self._samples]
+
+    def kill(self):
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+    def _ensure_capacity(self, extra: int):
+        needed = self._samples + extra
+        if needed <= len(self._buffer): return
+        grown = np.empty(max(needed, len(self._buffer) * 2), dtype=np.float32)
+        grown[:self._samples] = self._buffer[:self._samples]
+        self._buffer = grown
+
+    def _read_stdout(self):
+        pending = b""  # Byte ímpar que sobrou de uma leitura anterior
+        while True:
+            data = self._proc.stdout.read1(_READ_SIZE)
+            if not data: break
+            data = pending + data
+            usable = len(data) & ~1
+            pending = data[usable:]
+            pcm = np.frombuffer(data[:usable], dtype=np.int16)
+            self._ensure_capacity(len(pcm))
+            np.multiply(pcm, 1 / 32768.0, out=self._buffer[self._samples:self._samples + len(pcm)], casting="unsafe")
+            self._samples += len(pcm)
+
+    def _read_stderr(self):
+        for line in self._proc.stderr:
+            self._stderr = (self._stderr + line)[-8192:]
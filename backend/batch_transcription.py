@@ -0,0 +1,189 @@
+"""Transcrição em lote de muitos arquivos e URLs, com saída SRT/JSON e progresso retomável.
+
+Uso pela linha de comando (a partir de backend/):
+
+    python batch_transcription.py /videos/arquivo --output /legendas --model small --batch-size 16
+
+A entrada pode ser uma pasta (todos os vídeos dentro dela, recursivamente) ou um manifesto
+(.txt com um caminho ou URL por linha, ou .json com uma lista). O estado de cada item fica em
+`progress.json` na pasta de saída; rodar de novo pula o que já foi concluído. Enquanto um item
+é transcrito, o áudio dos próximos já está sendo extraído.
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import wave
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def read_wav(path: str) -> np.ndarray:
+    """Lê um WAV PCM s16le mono (como o gerado pelo FFmpeg da aplicação) como float32."""
+    with wave.open(path, "rb") as w:
+        pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    return pcm.astype(np.float32) / 32768.0
+
+
+def collect_items(source: str, extensions: Iterable[str]) -> List[str]:
+    """Lista de caminhos/URLs de uma pasta ou de um manifesto (.txt ou .json), sem repetições e na ordem original."""
+    extensions = {e.lower() for e in extensions}
+    if os.path.isdir(source):
+        items = [str(p) for p in sorted(Path(source).rglob("*")) if p.is_file() and p.suffix.lower() in extensions]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as f:
+            if source.lower().endswith(".json"):
+                entries = json.load(f)
+                raw = [e if isinstance(e, str) else e.get("source") or e.get("url") or e.get("path") for e in entries]
+            else:
+                raw = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        items = [e if is_url(e) else os.path.normpath(os.path.join(base, e)) for e in raw if e]
+    return list(dict.fromkeys(items))
+
+
+def _output_name(source: str, used: set) -> str:
+    stem = source.split("://", 1)[1] if is_url(source) else Path(source).stem
+    name = re.sub(r"[^\w.-]+", "_", stem).strip("_")[:80] or "item"
+    if name in used: name = f"{name}-{hashlib.sha1(source.encode()).hexdigest()[:8]}"
+    used.add(name)
+    return name
+
+
+class BatchProgress:
+    """Estado dos itens de um lote em `progress.json`, regravado de forma atômica a cada mudança."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.items = json.load(f).get("items", {})
+        except (OSError, ValueError):
+            self.items = {}
+
+    def update(self, source: str, **fields):
+        with self._lock:
+            self.items[source] = {**self.items.get(source, {}), **fields}
+            tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"updated_at": time.time(), "items": self.items}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+    def summary(self) -> dict:
+        with self._lock:
+            entries = list(self.items.values())
+        done = [e for e in entries if e.get("status") == "done"]
+        timed = [e for e in done if not e.get("cached")]
+        audio_s = sum(e.get("duration", 0) for e in timed)
+        processing_s = sum(e.get("elapsed_s", 0) for e in timed)
+        return {"total": len(entries), "done": len(done), "failed": sum(1 for e in entries if e.get("status") == "failed"),
+                "pending": sum(1 for e in entries if e.get("status") not in ("done", "failed")),
+                "audio_s": round(audio_s, 2), "processing_s": round(processing_s, 2),
+                "rtf": round(processing_s / audio_s, 4) if audio_s else None}
+
+
+def run_batch(items: List[str], output_dir: str, prepare: Callable[[str], dict], transcribe: Callable[[dict], dict],
+              write_srt: Callable[[List[dict], str], None], lookahead: int = 1, retry_failed: bool = False,
+              cancel_event: Optional[threading.Event] = None, on_item: Optional[Callable[[str, dict], None]] = None) -> dict:
+    """Processa os itens em ordem e devolve o resumo do lote (com o fator de tempo real, RTF).
+
+    `prepare(source)` obtém o áudio (`{"audio", "duration"}`, ou já `{"captions", "language", "duration"}` se
+    estiver em cache) e roda em até `lookahead` threads à frente; `transcribe(prepared)` devolve
+    `{"captions", "language"}`. Itens concluídos em execuções anteriores são pulados.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    progress = BatchProgress(os.path.join(output_dir, "progress.json"))
+    used = {e["output"] for e in progress.items.values() if e.get("output")}
+    todo = []
+    for source in items:
+        entry = progress.items.get(source, {})
+        if entry.get("status") == "done" and os.path.exists(os.path.join(output_dir, f"{entry['output']}.json")): continue
+        if entry.get("status") == "failed" and not retry_failed: continue
+        progress.update(source, status="pending", output=entry.get("output") or _output_name(source, used), error=None)
+        todo.append(source)
+
+    started = time.perf_counter()
+    audio_s = 0.0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, lookahead)) as prefetch:
+        queued = collections.deque()
+        upcoming = iter(todo)
+        for source in upcoming:
+            queued.append((source, prefetch.submit(prepare, source)))
+            if len(queued) > lookahead: break
+        while queued:
+            if cancel_event is not None and cancel_event.is_set():
+                for _, future in queued: future.cancel()
+                break
+            source, future = queued.popleft()
+            nxt = next(upcoming, None)
+            if nxt is not None: queued.append((nxt, prefetch.submit(prepare, nxt)))
+            name = progress.items[source]["output"]
+            try:
+                prepared = future.result()
+                t0 = time.perf_counter()
+                result = prepared if "captions" in prepared else transcribe(prepared)
+                elapsed = time.perf_counter() - t0
+                duration = prepared["duration"]
+                write_srt(result["captions"], os.path.join(output_dir, f"{name}.srt"))
+                with open(os.path.join(output_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+                    json.dump({"source": source, "language": result["language"], "duration": duration, "captions": result["captions"]},
+                              f, ensure_ascii=False, indent=1)
+                audio_s += duration
+                progress.update(source, status="done", duration=round(duration, 3), elapsed_s=round(elapsed, 3),
+                                rtf=round(elapsed / duration, 4) if duration else None, cached="captions" in prepared,
+                                captions=len(result["captions"]), finished_at=time.time())
+            except Exception as e:
+                if cancel_event is not None and cancel_event.is_set():
+                    progress.update(source, status="pending")
+                    break
+                progress.update(source, status="failed", error=str(getattr(e, "detail", e)))
+            if on_item: on_item(source, progress.items[source])
+
+    wall = time.perf_counter() - started
+    return {**progress.summary(), "output_dir": output_dir, "wall_s": round(wall, 2),
+            "wall_rtf": round(wall / audio_s, 4) if audio_s else None}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Transcreve em lote uma pasta de vídeos ou um manifesto de arquivos/URLs.")
+    parser.add_argument("source", help="Pasta com vídeos ou manifesto (.txt com um item por linha, ou .json)")
+    parser.add_argument("--output", "-o", required=True, help="Pasta onde ficam os .srt/.json e o progress.json")
+    parser.add_argument("--model", "-m", default=None, help="Modelo Whisper (padrão: o do hardware)")
+    parser.add_argument("--language", "-l", default="pt")
+    parser.add_argument("--batch-size", "-b", type=int, default=None, help="Trechos decodificados por passada (1 desativa o modo em lote)")
+    parser.add_argument("--retry-failed", action="store_true", help="Tenta de novo os itens que falharam")
+    args = parser.parse_args(argv)
+
+    import app  # Carrega o pipeline (modelos, FFmpeg, cache) só quando executado como CLI
+    items = collect_items(args.source, app.ALLOWED_EXTENSIONS)
+    print(f"{len(items)} item(ns) em {args.source}")
+
+    def report(source: str, entry: dict):
+        if entry["status"] == "done":
+            rtf = "cache" if entry.get("cached") else f"RTF {entry['rtf']}"
+            print(f"[ok] {source} -> {entry['output']} ({entry['duration']:.0f}s de áudio, {rtf})")
+        else:
+            print(f"[erro] {source}: {entry.get('error')}")
+
+    summary = app.transcribe_batch(items, args.output, args.model or app.DEFAULT_MODEL, args.language, args.batch_size,
+                                   retry_failed=args.retry_failed, on_item=report)
+    print(json.dumps(summary, ensure_ascii=False, indent=1))
+
+
+if __name__ == "__main__":
+    main()
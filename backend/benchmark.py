@@ -0,0 +1,228 @@
+"""Benchmark reprodutível do pipeline: extração de áudio, transcrição, geração de SRT e renderização.
+
+Uso (a partir de backend/):
+
+    python benchmark.py                          # matriz padrão, grava benchmark-results.json
+    python benchmark.py --quick --models tiny    # rodada curta
+    python benchmark.py --baseline benchmark-baseline.json   # compara e sai com código 1 se houver regressão
+    python benchmark.py --save-baseline          # grava o resultado como nova referência
+
+As mídias de teste são geradas com o FFmpeg (testsrc2 + áudio sintético em rajadas) e guardadas em
+cache/bench. Áudio sintético não é fala: para um RTF de transcrição realista, passe `--speech arquivo`
+com uma gravação de voz, que é repetida até a duração de cada mídia.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_DURATIONS = [10, 60]
+DEFAULT_RESOLUTIONS = ["640x360", "1280x720"]
+FPS = 30
+
+# Métricas em que um valor menor é melhor; todas as outras são "maior é melhor"
+_LOWER_IS_BETTER = (".rtf", ".load_s")
+
+
+def media_name(resolution: str, duration: int) -> str:
+    return f"{resolution}_{duration}s"
+
+
+def generate_media(directory: str, resolution: str, duration: int, speech: Optional[str] = None) -> str:
+    """Gera (uma única vez) um MP4 H.264/AAC com padrão de teste e áudio em rajadas de ~2 s."""
+    path = os.path.join(directory, f"{media_name(resolution, duration)}{'_speech' if speech else ''}.mp4")
+    if os.path.exists(path): return path
+    os.makedirs(directory, exist_ok=True)
+    if speech:
+        audio = ["-stream_loop", "-1", "-i", speech]
+    else:
+        # Tons modulados ligados 2 s / desligados 0,5 s, para que o VAD encontre "falas" e pausas
+        audio = ["-f", "lavfi", "-i", f"aevalsrc='if(lt(mod(t,2.5),2),0.4*sin(2*PI*(220+80*sin(2*PI*3*t))*t),0)':s=44100:d={duration}"]
+    tmp = f"{path}.tmp.mp4"
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate={FPS}:duration={duration}",
+                    *audio, "-map", "0:v", "-map", "1:a", "-t", str(duration), "-c:v", "libx264", "-preset", "veryfast", "-g", str(FPS * 2),
+                    "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", "-y", tmp], check=True)
+    os.replace(tmp, path)
+    return path
+
+
+def measure(fn: Callable[[], None], repeat: int) -> float:
+    """Mediana do tempo de parede de `repeat` execuções."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def synthetic_captions(duration: float, every_s: float = 2.5) -> List[dict]:
+    n = max(1, int(duration / every_s))
+    return [{"id": i + 1, "start": i * every_s, "end": i * every_s + 2.0, "text": f"Legenda de teste número {i + 1} com texto médio"} for i in range(n)]
+
+
+class Benchmark:
+    def __init__(self, app, workdir: str, repeat: int):
+        self.app = app
+        self.workdir = workdir
+        self.repeat = repeat
+        self.results: Dict[str, dict] = {}
+        self.errors: Dict[str, str] = {}
+
+    def record(self, name: str, value: float, unit: str):
+        self.results[name] = {"value": round(value, 4), "unit": unit}
+        print(f"  {name:<45} {value:>12.3f} {unit}")
+
+    def extraction(self, media: Dict[str, str], durations: Dict[str, int]):
+        from audio_pipe import PipeAudioExtractor
+        print("Extração de áudio")
+        for name, path in media.items():
+            wav = os.path.join(self.workdir, f"{name}.wav")
+            seconds = measure(lambda: self.app.run_ffmpeg(self.app.get_ffmpeg_cmd(path, wav), "Erro ao extrair áudio"), self.repeat)
+            self.record(f"extract.file.{name}.speed_x", durations[name] / seconds, "x tempo real")
+            self.record(f"extract.file.{name}.mb_s", os.path.getsize(path) / (1024 * 1024) / seconds, "MB/s")
+
+            def pipe():
+                extractor = PipeAudioExtractor(self.app.get_ffmpeg_pipe_cmd()).start()
+                try:
+                    with open(path, "rb") as f:
+                        while chunk := f.read(1 << 20): extractor.write(chunk)
+                    extractor.finish()
+                finally:
+                    extractor.kill()
+            self.record(f"extract.pipe.{name}.speed_x", durations[name] / measure(pipe, self.repeat), "x tempo real")
+
+    def transcription(self, wav: str, duration: float, models: List[str]):
+        print(f"Transcrição ({duration:.0f}s de áudio)")
+        for model in models:
+            try:
+                t0 = time.perf_counter()
+                whisper_model = self.app.load_whisper_model(model)
+                self.record(f"transcribe.{model}.load_s", time.perf_counter() - t0, "s")
+                self.app.warmup_model(whisper_model)
+
+                def run():
+                    segments, _ = whisper_model.transcribe(wav, language="pt", **self.app.ULTRA_SPEED_CONFIG)
+                    for _ in segments: pass
+                self.record(f"transcribe.{model}.rtf", measure(run, self.repeat) / duration, "RTF")
+                del whisper_model
+            except Exception as e:
+                self.errors[f"transcribe.{model}"] = str(e)
+                print(f"  transcribe.{model}: erro ({e})")
+
+    def srt(self, count: int = 100_000):
+        print("Geração de SRT")
+        captions = synthetic_captions(count * 2.5)
+        path = os.path.join(self.workdir, "bench.srt")
+        seconds = measure(lambda: self.app.create_srt(captions, path), self.repeat)
+        self.record("srt.captions_per_s", len(captions) / seconds, "legendas/s")
+
+    def render(self, media: Dict[str, str], durations: Dict[str, int]):
+        import render_engine
+        print("Renderização")
+        config = self.app.RENDER_CONFIG
+        workers = config["workers"]
+        for name, path in media.items():
+            captions = synthetic_captions(durations[name])
+            probe = render_engine.probe_keyframes(path)
+
+            def run():
+                with tempfile.TemporaryDirectory(dir=self.workdir) as temp_dir:
+                    render_engine.render_segmented(path, captions, os.path.join(temp_dir, "out.mp4"), temp_dir, self.app.create_srt,
+                                                   self.app.run_ffmpeg, workers, config["preset"], config["crf"], config["segment_s"],
+                                                   threads_per_worker=max(1, self.app.CPU_CORES // workers), probe=probe)
+            self.record(f"render.{name}.fps", durations[name] * FPS / measure(run, self.repeat), "fps")
+
+
+def environment(app) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except OSError:
+        commit = ""
+    try:
+        ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=5).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg = ""
+    return {"timestamp": time.time(), "commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "ffmpeg": ffmpeg, "hardware_tier": app.HARDWARE_TIER, "cpu_cores": app.CPU_CORES, "memory_gb": round(app.MEMORY_GB, 1),
+            "device": app.get_device(), "config": json.loads(json.dumps({"transcription": app.ULTRA_SPEED_CONFIG, "render": app.RENDER_CONFIG}),
+                                                       parse_constant=str)}  # inf vira "Infinity": o arquivo continua JSON válido
+
+
+def lower_is_better(metric: str) -> bool:
+    return metric.endswith(_LOWER_IS_BETTER)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[dict]:
+    """Variação de cada métrica em relação à referência; `regression` marca pioras acima de `threshold` (fração)."""
+    rows = []
+    for metric, current in sorted(results["results"].items()):
+        reference = baseline.get("results", {}).get(metric)
+        if not reference or not reference["value"]: continue
+        change = (current["value"] - reference["value"]) / reference["value"]
+        worse = change > threshold if lower_is_better(metric) else change < -threshold
+        rows.append({"metric": metric, "baseline": reference["value"], "current": current["value"], "change": round(change, 4), "regression": worse})
+    return rows
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark de extração, transcrição, SRT e renderização.")
+    parser.add_argument("--durations", type=lambda s: [int(x) for x in s.split(",")], default=DEFAULT_DURATIONS, help="Durações em segundos (ex.: 10,60)")
+    parser.add_argument("--resolutions", type=lambda s: s.split(","), default=DEFAULT_RESOLUTIONS, help="Resoluções (ex.: 640x360,1280x720)")
+    parser.add_argument("--models", type=lambda s: s.split(","), default=None, help="Modelos a medir (padrão: todos os WHISPER_MODELS)")
+    parser.add_argument("--only", type=lambda s: s.split(","), default=["extract", "transcribe", "srt", "render"], help="Etapas a medir")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições por medida (usa a mediana)")
+    parser.add_argument("--speech", help="Gravação de voz usada como áudio das mídias de teste")
+    parser.add_argument("--quick", action="store_true", help="Só 10 s em 640x360, uma repetição")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="Resultado de referência para comparar")
+    parser.add_argument("--save-baseline", nargs="?", const="benchmark-baseline.json", help="Grava este resultado como referência")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Piora tolerada antes de acusar regressão (fração)")
+    args = parser.parse_args(argv)
+    if args.quick: args.durations, args.resolutions, args.repeat = [10], ["640x360"], 1
+
+    import app  # Mede o pipeline com a mesma configuração do servidor
+    models = args.models or app.WHISPER_MODELS
+    media_dir = os.path.join(os.getcwd(), "cache", "bench")
+    media, durations = {}, {}
+    for resolution in args.resolutions:
+        for duration in args.durations:
+            name = media_name(resolution, duration)
+            media[name], durations[name] = generate_media(media_dir, resolution, duration, args.speech), duration
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bench = Benchmark(app, workdir, args.repeat)
+        if "extract" in args.only or "transcribe" in args.only: bench.extraction(media, durations)
+        if "transcribe" in args.only:
+            longest = max(media, key=lambda n: durations[n])
+            bench.transcription(os.path.join(workdir, f"{longest}.wav"), durations[longest], models)
+        if "srt" in args.only: bench.srt()
+        if "render" in args.only: bench.render(media, durations)
+        results = {"environment": environment(app), "results": bench.results, "errors": bench.errors}
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"Resultados gravados em {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"Referência gravada em {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            rows = compare(results, json.load(f), args.threshold)
+        print(f"\nComparação com {args.baseline} (tolerância {args.threshold:.0%})")
+        for row in rows:
+            flag = "REGRESSÃO" if row["regression"] else ""
+            print(f"  {row['metric']:<45} {row['baseline']:>12.3f} -> {row['current']:>12.3f} ({row['change']:+.1%}) {flag}")
+        if any(row["regression"] for row in rows): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
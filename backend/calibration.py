@@ -0,0 +1,213 @@
+"""Calibração do hardware: mede cada modelo Whisper com vários números de threads nesta máquina.
+
+Uso (a partir de backend/):
+
+    python calibration.py                          # mede e grava cache/calibration.json
+    python calibration.py --target-rtf 0.3         # exige transcrever a ~3x o tempo real
+    python calibration.py --models tiny,base,small --speech voz.wav
+
+A escolha pela RAM (tiers low/medium/high/ultra) ignora a CPU: uma máquina com muita memória e
+poucos núcleos lentos acaba com um modelo grande demais e workers demais. Aqui cada combinação de
+modelo e `cpu_threads` transcreve um trecho de áudio e tem o fator de tempo real (RTF) medido. O
+escolhido é o maior modelo que atinge o RTF alvo dentro do orçamento de memória, com o número de
+threads que dá a maior vazão (workers paralelos / RTF); os workers decodificam em paralelo sobre a
+mesma instância do modelo (`num_workers` do CTranslate2).
+
+Na inicialização, app.py lê o arquivo e usa o modelo, os threads e os workers escolhidos no lugar
+dos da RAM; o arquivo é ignorado se a CPU ou a memória da máquina mudaram. Áudio sintético não é
+fala (o decodificador gera menos texto); para um RTF mais fiel, passe `--speech` com uma gravação.
+"""
+import argparse
+import json
+import os
+import platform
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import psutil
+
+CALIBRATION_VERSION = 1
+SAMPLE_RATE = 16000
+DEFAULT_TARGET_RTF = 0.5
+# Tier equivalente ao modelo escolhido; define as demais configurações por tier (renderização, lote, mídias longas)
+TIER_BY_MODEL = {"tiny": "low", "base": "medium", "small": "high", "medium": "ultra", "large-v2": "ultra", "large-v3": "ultra"}
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"): return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def fingerprint() -> dict:
+    """O que precisa continuar igual para a calibração gravada valer (o dispositivo é conferido depois, sem importar o CTranslate2)."""
+    return {"cpu": _cpu_model(), "cpu_cores": os.cpu_count() or 1, "machine": platform.machine(),
+            "memory_gb": round(psutil.virtual_memory().total / (1024 ** 3))}
+
+
+def load(path: str) -> Optional[dict]:
+    """Calibração gravada, ou None se não existir, for de outra versão ou de outro hardware."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != CALIBRATION_VERSION or data.get("fingerprint") != fingerprint(): return None
+    return data
+
+
+def save(path: str, data: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def thread_options(cpu_cores: int) -> List[int]:
+    return sorted({t for t in (1, 2, 4, 8, 16, cpu_cores // 2, cpu_cores) if 1 <= t <= cpu_cores})
+
+
+def synthetic_audio(seconds: float) -> np.ndarray:
+    """Rajadas de tons harmônicos com vibrato e ruído, separadas por pausas: ocupa o codificador como fala ocuparia."""
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.7 * t) + 10 * np.sin(2 * np.pi * 5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = (np.mod(t, 3.0) < 2.4) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t) ** 2)
+    noise = np.random.default_rng(0).normal(0, 0.02, t.shape)
+    return (0.3 * voice * envelope + noise).astype(np.float32)
+
+
+def speech_audio(path: str, seconds: float) -> np.ndarray:
+    """Gravação de voz repetida (ou cortada) até `seconds`."""
+    from faster_whisper.audio import decode_audio
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+    return np.tile(audio, int(np.ceil(seconds * SAMPLE_RATE / max(1, len(audio)))))[:int(seconds * SAMPLE_RATE)]
+
+
+def measure(model_name: str, threads: int, load_model: Callable[[str, int], object], warmup: Callable[[object], None],
+            audio: np.ndarray, transcribe_config: dict, repeat: int = 1) -> dict:
+    """Carrega o modelo com `threads` threads de CPU e mede o RTF (melhor de `repeat`) e a memória ocupada."""
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    t0 = time.perf_counter()
+    model = load_model(model_name, threads)
+    load_s = time.perf_counter() - t0
+    warmup(model)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        segments, _ = model.transcribe(audio, language="pt", **transcribe_config)
+        for _ in segments: pass
+        best = min(best, time.perf_counter() - t0)
+    rss_mb = max(0, process.memory_info().rss - rss_before) / (1024 ** 2)
+    del model
+    return {"model": model_name, "threads": threads, "rtf": round(best / (len(audio) / SAMPLE_RATE), 4),
+            "load_s": round(load_s, 3), "rss_mb": round(rss_mb, 1)}
+
+
+def workers_for(threads: int, rss_mb: float, cpu_cores: int, budget_mb: float) -> int:
+    """Transcrições simultâneas que cabem na CPU (núcleos / threads).
+
+    Os workers dividem uma única instância do modelo (`num_workers` do CTranslate2, um por slot da fila),
+    então a memória só precisa comportar um modelo; se nem ele couber, sobra um worker.
+    """
+    by_cpu = max(1, cpu_cores // threads) if threads else min(4, cpu_cores)
+    return by_cpu if rss_mb <= budget_mb else 1
+
+
+def choose(measurements: List[dict], models: List[str], target_rtf: float, budget_mb: float, cpu_cores: int) -> dict:
+    """Maior modelo que atinge `target_rtf` e cabe em `budget_mb`; entre seus threads, o de maior vazão.
+
+    Se nenhum atingir o alvo, fica com a medida de menor RTF (`meets_target` = False).
+    """
+    for m in measurements:
+        m["workers"] = workers_for(m["threads"], m["rss_mb"], cpu_cores, budget_mb)
+        m["throughput"] = round(m["workers"] / m["rtf"], 3) if m["rtf"] else 0.0
+    eligible = [m for m in measurements if m["rtf"] <= target_rtf and m["rss_mb"] <= budget_mb]
+    if eligible:
+        largest = max(eligible, key=lambda m: models.index(m["model"]))["model"]
+        best, meets = max((m for m in eligible if m["model"] == largest), key=lambda m: m["throughput"]), True
+    else:
+        best, meets = min(measurements, key=lambda m: m["rtf"]), False
+    return {"model": best["model"], "cpu_threads": best["threads"], "workers": best["workers"], "rtf": best["rtf"],
+            "throughput": best["throughput"], "hardware_tier": TIER_BY_MODEL.get(best["model"], "high"), "meets_target": meets}
+
+
+def calibrate(models: List[str], threads: List[int], load_model: Callable[[str, int], object], warmup: Callable[[object], None],
+              audio: np.ndarray, transcribe_config: dict, target_rtf: float, budget_mb: float, device: str,
+              size_estimates_mb: Dict[str, float], repeat: int = 1, on_result: Optional[Callable[[dict], None]] = None) -> dict:
+    """Mede os modelos do menor para o maior e para no primeiro cujo melhor RTF já excede o alvo
+    (os maiores seriam ainda mais lentos)."""
+    cpu_cores = os.cpu_count() or 1
+    measurements, skipped = [], {}
+    for model_name in models:
+        if size_estimates_mb.get(model_name, 0) > budget_mb:
+            skipped[model_name] = "não cabe no orçamento de memória"
+            continue
+        results = []
+        for t in threads:
+            try:
+                results.append(measure(model_name, t, load_model, warmup, audio, transcribe_config, repeat))
+                # Memória já liberada por um modelo anterior é reaproveitada e some da diferença de RSS: vale a estimativa
+                results[-1]["rss_mb"] = max(results[-1]["rss_mb"], size_estimates_mb.get(model_name, 0))
+            except Exception as e:
+                skipped[f"{model_name}/{t}"] = str(e)
+                continue
+            if on_result: on_result(results[-1])
+        measurements.extend(results)
+        if not results or min(r["rtf"] for r in results) > target_rtf:
+            for rest in models[models.index(model_name) + 1:]: skipped.setdefault(rest, "modelo menor já não atingiu o RTF alvo")
+            break
+    if not measurements: raise RuntimeError(f"Nenhuma configuração pôde ser medida: {skipped}")
+    return {"version": CALIBRATION_VERSION, "created_at": time.time(), "fingerprint": fingerprint(), "device": device,
+            "target_rtf": target_rtf, "audio_s": round(len(audio) / SAMPLE_RATE, 1), "memory_budget_mb": round(budget_mb),
+            "selected": choose(measurements, models, target_rtf, budget_mb, cpu_cores), "measurements": measurements, "skipped": skipped}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Mede modelos e threads nesta máquina e grava a configuração escolhida.")
+    parser.add_argument("--models", type=lambda s: s.split(","), default=None, help="Modelos candidatos (padrão: todos os WHISPER_MODELS)")
+    parser.add_argument("--threads", type=lambda s: [int(x) for x in s.split(",")], default=None, help="Threads de CPU a testar (ex.: 2,4,8)")
+    parser.add_argument("--target-rtf", type=float, default=None, help=f"RTF máximo aceito (padrão: CALIBRATION_TARGET_RTF ou {DEFAULT_TARGET_RTF})")
+    parser.add_argument("--audio-s", type=float, default=30, help="Duração do áudio de teste em segundos")
+    parser.add_argument("--speech", help="Gravação de voz usada no lugar do áudio sintético")
+    parser.add_argument("--repeat", type=int, default=1, help="Transcrições por configuração (usa a mais rápida)")
+    parser.add_argument("--output", default=None, help="Arquivo de saída (padrão: CALIBRATION_PATH do app)")
+    args = parser.parse_args(argv)
+
+    import app  # Usa o mesmo dispositivo, parâmetros de decodificação e orçamento de memória do servidor
+    from model_pool import MODEL_SIZE_ESTIMATES_MB
+    device = app.get_device()
+    models = [m for m in (args.models or app.WHISPER_MODELS) if m in app.WHISPER_MODELS]
+    threads = [0] if device == "cuda" else (args.threads or thread_options(app.CPU_CORES))
+    target_rtf = args.target_rtf or app.CALIBRATION_TARGET_RTF
+    audio = speech_audio(args.speech, args.audio_s) if args.speech else synthetic_audio(args.audio_s)
+    budget_mb = app.model_pool.budget_bytes / (1024 ** 2)
+
+    def load_model(name: str, t: int):
+        from faster_whisper import WhisperModel
+        return WhisperModel(name, **app.get_model_config(t or None))
+
+    print(f"Calibrando em {device}: modelos {', '.join(models)}; threads {threads}; RTF alvo {target_rtf}; {args.audio_s:.0f}s de áudio")
+    # Sem VAD: o áudio inteiro passa pelo modelo, como numa fala contínua
+    config = {**{k: v for k, v in app.ULTRA_SPEED_CONFIG.items() if k != "vad_parameters"}, "vad_filter": False}
+    result = calibrate(models, threads, load_model, app.warmup_model, audio, config, target_rtf, budget_mb, device,
+                       MODEL_SIZE_ESTIMATES_MB, args.repeat,
+                       on_result=lambda r: print(f"  {r['model']:<10} {r['threads']:>3} threads  RTF {r['rtf']:.3f}  {r['rss_mb']:.0f} MB", flush=True))
+    output = args.output or app.CALIBRATION_PATH
+    save(output, result)
+    selected = result["selected"]
+    print(f"Escolhido: {selected['model']} com {selected['cpu_threads']} threads e {selected['workers']} workers "
+          f"(RTF {selected['rtf']}{'' if selected['meets_target'] else ', abaixo do alvo'}). Gravado em {output}; vale a partir do próximo início do servidor.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Transcrição paralela de mídias longas.
+
+O áudio de 16 kHz é dividido em trechos cortados em silêncio (VAD do faster-whisper,
+com fallback para o ponto de menor energia), e os trechos são transcritos ao mesmo tempo
+num pool de processos, cada um com o próprio modelo carregado. Como os cortes caem
+fora da fala, nenhuma palavra é partida ao meio e a junção só precisa deslocar os tempos.
+"""
+import concurrent.futures
+import contextlib
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+DEFAULT_ENGINE = "faster_whisper:WhisperModel"
+# Pool sem uso por mais que isso é encerrado, devolvendo a RAM do modelo carregado em cada processo
+POOL_IDLE_TIMEOUT_S = 300
+
+logger = logging.getLogger(__name__)
+
+
+class _PoolEntry:
+    def __init__(self, key: tuple, executor: concurrent.futures.ProcessPoolExecutor, on_close: Optional[Callable[[], None]]):
+        self.key = key
+        self.executor = executor
+        self.on_close = on_close
+        self.users = 0
+        self.last_used = time.time()
+        self.retired = False  # Fora de _pools: encerrado quando o último usuário o devolver
+
+
+_pools: Dict[tuple, _PoolEntry] = {}
+_pools_lock = threading.Lock()
+_reservations = itertools.count(1)
+_worker_model = None
+
+
+def _speech_spans(audio: np.ndarray) -> List[dict]:
+    try:
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+        return get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500))
+    except Exception:
+        return []
+
+
+def _quietest_point(audio: np.ndarray, start: int, end: int, frame: int = SAMPLE_RATE // 50) -> int:
+    """Amostra central do quadro de 20 ms com menor energia em [start, end)."""
+    n = (end - start) // frame
+    if n <= 0: return end
+    frames = audio[start:start + n * frame].reshape(n, frame)
+    return start + int(np.argmin((frames ** 2).mean(axis=1))) * frame + frame // 2
+
+
+def plan_chunks(audio: np.ndarray, chunk_s: float) -> List[Tuple[int, int]]:
+    """Divide o áudio em trechos de no máximo `chunk_s` segundos, cortando em silêncios."""
+    total, target = len(audio), int(chunk_s * SAMPLE_RATE)
+    if total <= target: return [(0, total)]
+    spans = _speech_spans(audio)
+    cuts = [(a["end"] + b["start"]) // 2 for a, b in zip(spans, spans[1:])]
+    bounds = [0]
+    while total - bounds[-1] > target:
+        start = bounds[-1]
+        low, high = start + target // 2, start + target
+        options = [c for c in cuts if low <= c <= high]
+        bounds.append(max(options) if options else _quietest_point(audio, low, high))
+    bounds.append(total)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _init_worker(model_name: str, model_kwargs: dict, engine: str):
+    global _worker_model
+    from inference_workers import load_engine
+    _worker_model = load_engine(engine)(model_name, **model_kwargs)
+
+
+def _transcribe_chunk(audio: np.ndarray, offset_s: float, language: str, config: dict) -> List[Tuple[float, float, str, list]]:
+    segments, _ = _worker_model.transcribe(audio, language=language, **config)
+    chunk_end = offset_s + len(audio) / SAMPLE_RATE
+    return [(offset_s + s.start, min(offset_s + s.end, chunk_end), s.text.strip(),
+             [(offset_s + w.start, offset_s + w.end, w.word, w.probability) for w in (s.words or [])]) for s in segments]
+
+
+def _close(entry: _PoolEntry):
+    processes = list((entry.executor._processes or {}).values())
+    entry.executor.shutdown(wait=False, cancel_futures=True)
+    for p in processes: p.terminate()  # shutdown() não interrompe os trechos que já estão decodificando
+    if entry.on_close: entry.on_close()
+
+
+def _retire(entry: _PoolEntry):
+    """Tira o pool de uso; chame com _pools_lock. Fecha já se ninguém o usa, senão no release."""
+    if _pools.get(entry.key) is entry: del _pools[entry.key]
+    entry.retired = True
+    if entry.users == 0: _close(entry)
+
+
+def _reap_idle():
+    with _pools_lock:
+        now = time.time()
+        for entry in [e for e in _pools.values() if e.users == 0 and now - e.last_used >= POOL_IDLE_TIMEOUT_S]:
+            logger.info(f"Encerrando o pool ocioso de mídia longa ({entry.key[0]}).")
+            _retire(entry)
+
+
+@contextlib.contextmanager
+def acquire_pool(model_name: str, model_kwargs: dict, workers: int, engine: str = DEFAULT_ENGINE, budget=None):
+    """Pool reutilizado entre requisições para não recarregar o modelo em cada processo.
+
+    Mantém no máximo um pool ocioso: pedir outra combinação encerra os pools sem uso, e um pool
+    parado por POOL_IDLE_TIMEOUT_S também é encerrado. Com `budget` (o ModelPool), os `workers`
+    modelos entram no orçamento de RAM enquanto o pool existir. Devolve a entrada; use `.executor`.
+    """
+    key = (model_name, workers, engine, tuple(sorted(model_kwargs.items())))
+    with _pools_lock:
+        for other in [e for k, e in _pools.items() if k != key and e.users == 0]: _retire(other)
+        entry = _pools.get(key)
+        if entry is None:
+            on_close = None
+            if budget is not None:
+                reservation = f"long-media:{model_name}:{next(_reservations)}"
+                budget.reserve(reservation, workers * budget.estimate(model_name))
+                on_close = lambda: budget.release(reservation)
+            entry = _pools[key] = _PoolEntry(key, concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(model_name, model_kwargs, engine)), on_close)
+        entry.users += 1
+    try:
+        yield entry
+    finally:
+        with _pools_lock:
+            entry.users -= 1
+            entry.last_used = time.time()
+            if entry.retired and entry.users == 0: _close(entry)
+        if not entry.retired:
+            timer = threading.Timer(POOL_IDLE_TIMEOUT_S, _reap_idle)
+            timer.daemon = True
+            timer.start()
+
+
+def recycle_pool(entry: _PoolEntry):
+    """Descarta o pool (cancelamento ou processo quebrado); os trechos em execução param assim que ninguém mais o usa."""
+    with _pools_lock:
+        if not entry.retired: _retire(entry)
+
+
+def shutdown_pools():
+    with _pools_lock:
+        for entry in list(_pools.values()): _retire(entry)
+
+
+def merge_chunks(chunks: List[List[Tuple[float, float, str, list]]], words: Optional[list] = None) -> List[dict]:
+    """Junta os resultados em ordem, com ids sequenciais e tempos monotônicos; as palavras dos segmentos mantidos vão para `words`."""
+    captions, last_start, last_end = [], 0.0, 0.0
+    for segments in chunks:
+        for start, end, text, segment_words in segments:
+            if not text: continue
+            # Segmento repetido na borda (mesmo texto sobreposto ao anterior) é descartado
+            if captions and start < last_end and text == captions[-1]["text"]: continue
+            start = max(start, last_start)
+            end = max(end, start)
+            captions.append({"id": len(captions) + 1, "start": start, "end": end, "text": text})
+            if words is not None: words.append(segment_words)
+            last_start, last_end = start, end
+    return captions
+
+
+def transcribe_chunked(audio, model_name: str, model_kwargs: dict, language: str, config: dict,
+                       chunk_s: float, workers: int, on_caption: Optional[Callable[[dict, float], None]] = None,
+                       cancel_event: Optional[threading.Event] = None, engine: str = DEFAULT_ENGINE, budget=None) -> Tuple[List[dict], float, list]:
+    """Transcreve em paralelo (caminho ou array float32 de 16 kHz) e devolve (legendas, duração, palavras de cada legenda).
+
+    `on_caption` recebe as legendas já em ordem. No cancelamento (ou falha), os trechos pendentes são
+    cancelados e o pool é reciclado, encerrando os processos que ainda decodificavam.
+    """
+    if isinstance(audio, str):
+        from faster_whisper.audio import decode_audio
+        audio = decode_audio(audio, sampling_rate=SAMPLE_RATE)
+    duration = len(audio) / SAMPLE_RATE
+    with acquire_pool(model_name, model_kwargs, workers, engine, budget) as entry:
+        futures = [entry.executor.submit(_transcribe_chunk, audio[a:b], a / SAMPLE_RATE, language, config) for a, b in plan_chunks(audio, chunk_s)]
+        results, emitted, completed = [None] * len(futures), 0, False
+        index = {f: i for i, f in enumerate(futures)}
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED)
+                if cancel_event is not None and cancel_event.is_set(): break
+                for f in done: results[index[f]] = f.result()
+                # Publica as legendas assim que o prefixo contíguo de trechos estiver pronto
+                ready = 0
+                while ready < len(results) and results[ready] is not None: ready += 1
+                if on_caption and ready:
+                    merged = merge_chunks(results[:ready])
+                    for caption in merged[emitted:]: on_caption(caption, duration)
+                    emitted = len(merged)
+            completed = not pending
+        finally:
+            if not completed:
+                for f in futures: f.cancel()
+                recycle_pool(entry)
+    if cancel_event is not None and cancel_event.is_set(): return [], duration, []
+    words = []
+    return merge_chunks(results, words), duration, words
@@ -0,0 +1,2 @@
+# test_api.py é um roteiro manual contra um servidor rodando (python test_api.py), não um teste unitário
+collect_ignore = ["test_api.py"]
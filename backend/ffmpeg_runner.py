@@ -0,0 +1,157 @@
+"""Execução assíncrona do FFmpeg com progresso, cancelamento e limite de codificações simultâneas.
+
+Os processos rodam no event loop da aplicação (asyncio.create_subprocess_exec); código
+em threads (fila de tarefas, renderização por segmentos) usa `run_sync`, que agenda a
+execução no mesmo loop, de modo que o limite de codificações vale para o servidor todo.
+"""
+import asyncio
+import functools
+import subprocess
+import threading
+from typing import Callable, List, Optional
+
+
+class FFmpegError(Exception):
+    def __init__(self, message: str, stderr: str = ""):
+        super().__init__(message)
+        self.stderr = stderr
+
+
+class FFmpegNotFound(FFmpegError):
+    pass
+
+
+class FFmpegTimeout(FFmpegError):
+    pass
+
+
+class FFmpegCancelled(FFmpegError):
+    pass
+
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_hwaccels() -> frozenset:
+    """Acelerações de hardware suportadas pelo FFmpeg instalado (consultado uma única vez)."""
+    try:
+        out = subprocess.run(["ffmpeg", "-hide_banner", "-hwaccels"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return frozenset()
+    return frozenset(line.strip() for line in out.splitlines()[1:] if line.strip())
+
+
+def parse_progress(block: dict, duration: Optional[float]) -> dict:
+    """Converte um bloco de `-progress` (chave=valor) em segundos processados, porcentagem, fps e velocidade."""
+    out_us = block.get("out_time_us") or block.get("out_time_ms")  # Ambos vêm em microssegundos
+    try:
+        out_time = max(0.0, int(out_us) / 1_000_000) if out_us not in (None, "N/A") else None
+    except ValueError:
+        out_time = None
+    try:
+        fps = float(block.get("fps", "")) if block.get("fps") not in (None, "N/A") else None
+    except ValueError:
+        fps = None
+    try:
+        speed = float(block.get("speed", "").rstrip("x")) if block.get("speed") not in (None, "N/A") else None
+    except ValueError:
+        speed = None
+    percent = None
+    if block.get("progress") == "end": percent = 100.0
+    elif out_time is not None and duration: percent = round(min(100.0, 100 * out_time / duration), 1)
+    return {"out_time": out_time, "percent": percent, "fps": fps, "speed": speed, "done": block.get("progress") == "end"}
+
+
+class FFmpegRunner:
+    def __init__(self, max_encodes: int):
+        self.max_encodes = max(1, max_encodes)
+        self.running = 0
+        self.waiting = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._encode_slots: Optional[asyncio.Semaphore] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Associa o runner ao event loop da aplicação (chamado na inicialização)."""
+        self._loop = loop
+        self._encode_slots = asyncio.Semaphore(self.max_encodes)
+
+    def stats(self) -> dict:
+        return {"max_encodes": self.max_encodes, "running": self.running, "waiting_encodes": self.waiting}
+
+    async def run(self, cmd: List[str], error_msg: str, timeout: float = 300, encode: bool = False, duration: Optional[float] = None,
+                  on_progress: Optional[Callable[[dict], None]] = None, cancel_event: Optional[threading.Event] = None) -> str:
+        """Executa o comando e devolve o stderr; `encode=True` ocupa um dos slots globais de codificação."""
+        slots = self._encode_slots if encode and asyncio.get_running_loop() is self._loop else None
+        if slots:
+            self.waiting += 1
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set(): raise FFmpegCancelled(error_msg)
+                    try:
+                        await asyncio.wait_for(slots.acquire(), 0.5)
+                        break
+                    except asyncio.TimeoutError:
+                        continue
+            finally:
+                self.waiting -= 1
+        try:
+            return await self._run(cmd, error_msg, timeout, duration, on_progress, cancel_event)
+        finally:
+            if slots: slots.release()
+
+    async def _run(self, cmd, error_msg, timeout, duration, on_progress, cancel_event) -> str:
+        full_cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+        try:
+            proc = await asyncio.create_subprocess_exec(*full_cmd, stdin=asyncio.subprocess.DEVNULL,
+                                                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except FileNotFoundError:
+            raise FFmpegNotFound(error_msg)
+        self.running += 1
+
+        async def read_progress():
+            block = {}
+            async for raw in proc.stdout:
+                key, _, value = raw.decode(errors="replace").strip().partition("=")
+                block[key] = value
+                if key == "progress":
+                    if on_progress:
+                        try:
+                            on_progress(parse_progress(block, duration))
+                        except Exception:
+                            pass  # Falha ao publicar progresso não deve derrubar o FFmpeg
+                    block = {}
+
+        progress_task = asyncio.create_task(read_progress())
+        stderr_task = asyncio.create_task(proc.stderr.read())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(proc.wait(), 0.5)
+                    break
+                except asyncio.TimeoutError:
+                    if cancel_event is not None and cancel_event.is_set(): raise FFmpegCancelled(error_msg)
+                    if loop.time() > deadline: raise FFmpegTimeout(error_msg)
+        except BaseException:
+            # Cancelamento, timeout ou a própria corrotina cancelada (cliente desconectou): encerra o processo
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        finally:
+            self.running -= 1
+            await progress_task
+            stderr = (await stderr_task).decode(errors="replace")
+        if proc.returncode != 0: raise FFmpegError(error_msg, stderr)
+        return stderr
+
+    def run_sync(self, cmd: List[str], error_msg: str, timeout: float = 300, **kwargs) -> str:
+        """Versão bloqueante para threads; usa o loop da aplicação quando disponível."""
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is loop: raise RuntimeError("run_sync não pode ser chamado de dentro do event loop; use await run().")
+            return asyncio.run_coroutine_threadsafe(self.run(cmd, error_msg, timeout, **kwargs), loop).result()
+        return asyncio.run(self.run(cmd, error_msg, timeout, **kwargs))
@@ -0,0 +1,422 @@
+"""Pool de processos dedicados à inferência, com o áudio entregue por memória compartilhada.
+
+Cada worker é um processo (spawn) com o próprio `ModelPool`: os modelos ficam residentes nele
+entre as tarefas, e uma falha ou estouro de memória do CTranslate2 derruba só aquele processo.
+O servidor escreve o PCM float32 de 16 kHz num bloco `SharedMemory` e manda pelo pipe apenas o
+nome e o tamanho; os segmentos voltam um a um pelo mesmo pipe, à medida que são decodificados.
+
+A tarefa vai para um worker ocioso que já tenha o modelo carregado. Se o modelo só está num worker
+ocupado (ou sendo carregado por uma tarefa em andamento), ela espera por ele em vez de carregar uma
+cópia noutro; só quando a fila desse modelo passa do número de workers que o têm é que um ocioso o carrega.
+Workers que morrem são substituídos (os que falham ao iniciar, com espera crescente entre as
+tentativas), e os que passam de `rss_limit_bytes` ao fim de uma tarefa
+são reciclados (reiniciados já carregando os mesmos modelos).
+"""
+import collections
+import importlib
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+import types
+import wave
+from multiprocessing import shared_memory
+from typing import Iterable, List, Optional
+
+import numpy as np
+import psutil
+
+from job_queue import JobCancelled
+from model_pool import ModelPool
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+class InferenceWorkerError(RuntimeError):
+    """O worker morreu ou falhou durante a transcrição."""
+
+
+def load_engine(spec: str):
+    """Classe do motor a partir de "módulo:atributo" (ex.: "faster_whisper:WhisperModel")."""
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr or "WhisperModel")
+
+
+# --- Lado do worker ---
+
+def _worker_state(pool: ModelPool) -> dict:
+    return {"rss": psutil.Process().memory_info().rss, "models": list(pool.stats()["models"])}
+
+
+def _warmup(model):
+    """Inferência curta em silêncio para inicializar kernels e alocações antes da primeira tarefa."""
+    segments, _ = model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), beam_size=1, vad_filter=False, without_timestamps=True)
+    list(segments)
+
+
+def _worker_main(conn, engine_spec: str, model_kwargs: dict, budget_bytes: int, preload: List[str]):
+    engine = load_engine(engine_spec)
+    pool = ModelPool(lambda name: engine(name, **model_kwargs), budget_bytes)
+    pool.preload(preload, _warmup)
+    conn.send({"type": "ready", **_worker_state(pool)})
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return  # Servidor encerrado
+        if message["op"] == "stop": return
+        if message["op"] == "transcribe": _worker_transcribe(conn, pool, message)
+        # "cancel" lido aqui chegou depois do fim da sua transcrição: é descartado
+
+
+def _worker_transcribe(conn, pool: ModelPool, message: dict):
+    block = shared_memory.SharedMemory(name=message["shm"])
+    audio = segments = None
+    try:
+        audio = np.ndarray((message["samples"],), dtype=np.float32, buffer=block.buf)
+        resident, started = pool.is_resident(message["model"]), time.perf_counter()
+        model = pool.get(message["model"])
+        load_s = time.perf_counter() - started
+        segments, info = model.transcribe(audio, language=message["language"], **message["options"])
+        conn.send({"type": "info", "duration": info.duration, "language": getattr(info, "language", message["language"]),
+                   "model_load_s": load_s, "resident": resident})
+        for s in segments:
+            if conn.poll() and conn.recv().get("task") == message["task"]:
+                conn.send({"type": "cancelled", **_worker_state(pool)})
+                return
+            conn.send({"type": "segment", "start": s.start, "end": s.end, "text": s.text,
+                       "words": [(w.start, w.end, w.word, w.probability) for w in (s.words or [])]})
+        conn.send({"type": "done", **_worker_state(pool)})
+    except Exception as e:
+        conn.send({"type": "error", "error": str(e), **_worker_state(pool)})
+    finally:
+        if segments is not None and hasattr(segments, "close"): segments.close()
+        audio = segments = None  # A visão do numpy precisa sumir antes de fechar o bloco
+        try:
+            block.close()
+        except BufferError:
+            pass  # Alguma referência ao áudio sobreviveu; o mapeamento é liberado quando o processo for reciclado
+
+
+# --- Lado do servidor ---
+
+class _Worker:
+    def __init__(self, index: int, process, conn, preload: List[str]):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.status = "starting"  # starting -> idle <-> busy; stopped ao ser substituído
+        self.models: List[str] = list(preload)
+        self.pending: Optional[str] = None  # Modelo que a tarefa atual pode estar carregando (ainda fora de `models`)
+        self.rss = 0
+        self.jobs = 0
+        self.task = 0
+        self.started_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {"index": self.index, "pid": self.process.pid, "status": self.status, "models": self.models, "loading": self.pending,
+                "rss_mb": round(self.rss / 1024 ** 2, 1), "jobs": self.jobs, "started_at": self.started_at}
+
+
+def read_audio(audio) -> tuple:
+    """Número de amostras e uma função que copia o PCM float32 para um destino (array ou WAV de 16 kHz)."""
+    if not isinstance(audio, str):
+        return len(audio), lambda out: np.copyto(out, audio, casting="same_kind")
+    with wave.open(audio, "rb") as w:
+        pcm16 = w.getsampwidth() == 2 and w.getnchannels() == 1 and w.getframerate() == SAMPLE_RATE
+        frames = w.getnframes()
+    if not pcm16:
+        from faster_whisper.audio import decode_audio
+        return read_audio(decode_audio(audio, sampling_rate=SAMPLE_RATE))
+
+    def fill(out: np.ndarray, block: int = 1 << 20):
+        with wave.open(audio, "rb") as w:
+            position = 0
+            while position < frames:
+                chunk = np.frombuffer(w.readframes(block), dtype=np.int16)
+                if not len(chunk): break
+                np.multiply(chunk, 1 / 32768.0, out=out[position:position + len(chunk)], casting="unsafe")
+                position += len(chunk)
+    return frames, fill
+
+
+class RemoteModel:
+    """Representa um modelo no pool com a mesma interface de `WhisperModel.transcribe`."""
+
+    def __init__(self, pool: "InferencePool", name: str, cancel_event: Optional[threading.Event] = None):
+        self.pool, self.name, self.cancel_event = pool, name, cancel_event
+
+    def transcribe(self, audio, language: Optional[str] = None, **options):
+        return self.pool.transcribe(audio, self.name, language, options, self.cancel_event)
+
+
+class InferencePool:
+    def __init__(self, size: int, engine: str, budget_bytes: int, rss_limit_bytes: int,
+                 cancel_grace_s: float = 5.0, start_timeout_s: float = 300.0, restart_backoff_s: float = 1.0, max_restart_backoff_s: float = 60.0):
+        self.size = size
+        self.engine = engine
+        self.model_kwargs: dict = {}
+        self.budget_bytes = budget_bytes
+        self.rss_limit_bytes = rss_limit_bytes
+        self.cancel_grace_s = cancel_grace_s
+        self.start_timeout_s = start_timeout_s
+        self.restart_backoff_s = restart_backoff_s
+        self.max_restart_backoff_s = max_restart_backoff_s
+        self.restarts = 0
+        self.recycles = 0
+        self.crashes = 0
+        self.routed_hits = 0
+        self.routed_misses = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._tasks = itertools.count(1)
+        self._workers: List[Optional[_Worker]] = [None] * size
+        self._start_failures = [0] * size  # Falhas seguidas na inicialização de cada lugar (define a espera até a próxima tentativa)
+        self._waiting: collections.Counter = collections.Counter()  # Tarefas aguardando worker, por modelo
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def start(self, model_kwargs: dict, preload: Iterable[str] = (), wait: bool = True) -> bool:
+        """Inicia os workers (o motor é construído com `model_kwargs`) carregando e aquecendo `preload`.
+
+        Com `wait`, aguarda todos ficarem prontos e devolve True se ficaram.
+        """
+        self.model_kwargs, preload = model_kwargs, list(preload)
+        for index in range(self.size):
+            if self._workers[index] is None: self._spawn(index, preload)
+        if not wait: return True
+        deadline = time.monotonic() + self.start_timeout_s
+        with self._cond:
+            while any(w.status == "starting" for w in self._workers) and time.monotonic() < deadline:
+                self._cond.wait(0.5)
+            return all(w.status == "idle" for w in self._workers)
+
+    def model(self, name: str, cancel_event: Optional[threading.Event] = None) -> RemoteModel:
+        return RemoteModel(self, name, cancel_event)
+
+    def is_resident(self, name: str) -> bool:
+        with self._cond:
+            return any(w is not None and w.status in ("idle", "busy") and name in w.models for w in self._workers)
+
+    def transcribe(self, audio, model: str, language: Optional[str], options: dict, cancel_event: Optional[threading.Event] = None):
+        """Transcreve num worker; devolve (gerador de segmentos, info) como `WhisperModel.transcribe`.
+
+        O worker fica reservado até o gerador terminar ou ser fechado (`close()`), o que o libera mesmo num cancelamento.
+        """
+        samples, fill = read_audio(audio)
+        block = shared_memory.SharedMemory(create=True, size=max(4, samples * 4))
+        worker = None
+        try:
+            fill(np.ndarray((samples,), dtype=np.float32, buffer=block.buf))
+            worker = self._acquire(model, cancel_event)
+            worker.task = next(self._tasks)
+            worker.conn.send({"op": "transcribe", "task": worker.task, "shm": block.name, "samples": samples,
+                              "model": model, "language": language, "options": options})
+            first = self._receive(worker, cancel_event)
+        except BaseException:
+            if worker is not None: self._release(worker, {}, abort=True)
+            self._free(block)
+            raise
+        if first["type"] != "info":
+            self._release(worker, first)
+            self._free(block)
+            self._finish_failed(worker, first)
+        # O modelo é carregado dentro do worker: o tempo medido lá vai junto, para a etapa model_load da sessão
+        info = types.SimpleNamespace(duration=first["duration"], language=first["language"],
+                                     model_load_s=first.get("model_load_s"), model_resident=first.get("resident"))
+        return self._segments(worker, block, cancel_event), info
+
+    def _segments(self, worker: _Worker, block, cancel_event: Optional[threading.Event]):
+        state, finished = {}, False
+        try:
+            while True:
+                message = self._receive(worker, cancel_event)
+                if message["type"] == "segment":
+                    words = [types.SimpleNamespace(start=s, end=e, word=w, probability=p) for s, e, w, p in message["words"]]
+                    yield types.SimpleNamespace(start=message["start"], end=message["end"], text=message["text"], words=words)
+                    continue
+                finished, state = True, message
+                if message["type"] != "done": self._finish_failed(worker, message)
+                return
+        finally:
+            self._release(worker, state, abort=not finished)
+            self._free(block)
+
+    def _finish_failed(self, worker: _Worker, message: dict):
+        if message["type"] == "cancelled": raise JobCancelled(f"worker {worker.index}")
+        raise InferenceWorkerError(message.get("error", f"resposta inesperada do worker: {message['type']}"))
+
+    def _receive(self, worker: _Worker, cancel_event: Optional[threading.Event]) -> dict:
+        """Próxima mensagem do worker, repassando o cancelamento; levanta InferenceWorkerError se o processo morrer."""
+        cancel_sent = None
+        while True:
+            try:
+                if worker.conn.poll(0.2): return worker.conn.recv()
+            except (EOFError, OSError):
+                pass
+            if not worker.process.is_alive():
+                worker.status = "crashed"
+                raise InferenceWorkerError(f"O worker de inferência {worker.index} encerrou inesperadamente (código {worker.process.exitcode}).")
+            if cancel_event is not None and cancel_event.is_set():
+                if cancel_sent is None:
+                    cancel_sent = time.monotonic()
+                    worker.conn.send({"op": "cancel", "task": worker.task})
+                elif time.monotonic() - cancel_sent > self.cancel_grace_s:
+                    # Preso num segmento longo: encerra o processo em vez de esperar
+                    worker.status = "crashed"
+                    raise JobCancelled(f"worker {worker.index}")
+
+    def _acquire(self, model: str, cancel_event: Optional[threading.Event]) -> _Worker:
+        """Reserva um worker ocioso, de preferência um que já tenha o modelo carregado."""
+        with self._cond:
+            self._waiting[model] += 1
+            try:
+                return self._acquire_locked(model, cancel_event)
+            finally:
+                self._waiting[model] -= 1
+                if not self._waiting[model]: del self._waiting[model]
+
+    def _acquire_locked(self, model: str, cancel_event: Optional[threading.Event]) -> _Worker:
+        while True:
+            if self._closed: raise InferenceWorkerError("Pool de inferência encerrado.")
+            for index, w in enumerate(self._workers):
+                if w is not None and w.status == "idle" and not w.process.is_alive(): self._replace_locked(index, "morreu ocioso")
+            # Antes de `start` os lugares estão vazios: a tarefa espera os workers subirem
+            if all(w is not None and w.status not in ("starting", "idle", "busy") for w in self._workers):
+                raise InferenceWorkerError("Nenhum worker de inferência disponível.")
+            idle = [w for w in self._workers if w is not None and w.status == "idle"]
+            warm = [w for w in idle if model in w.models]
+            if idle and not warm:
+                # O modelo já está (ou está sendo) carregado num worker ocupado: espera por ele em vez de carregar uma
+                # cópia num ocioso, a menos que a fila desse modelo já passe do número de workers que o têm
+                holders = sum(1 for w in self._workers if w is not None and w.status in ("starting", "busy") and (model in w.models or w.pending == model))
+                if holders and self._waiting[model] <= holders: idle = []
+            if idle:
+                if warm: self.routed_hits += 1
+                else: self.routed_misses += 1
+                worker = min(warm or idle, key=lambda w: (len(w.models), w.rss))
+                worker.status = "busy"
+                if model not in worker.models: worker.pending = model  # Conta como quem tem o modelo enquanto o carrega
+                return worker
+            if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("aguardando worker")
+            self._cond.wait(0.2)
+
+    def _release(self, worker: _Worker, state: dict, abort: bool = False):
+        """Devolve o worker ao pool, substituindo-o se morreu, não respondeu ao cancelamento ou passou do limite de memória."""
+        if abort and worker.status == "busy":
+            worker.status = self._drain(worker)
+        with self._cond:
+            worker.jobs += 1
+            worker.pending = None
+            if state.get("models") is not None: worker.models, worker.rss = state["models"], state["rss"]
+            if worker.status == "crashed":
+                self.crashes += 1
+                self._replace_locked(worker.index, "falhou")
+            elif self.rss_limit_bytes and worker.rss > self.rss_limit_bytes:
+                self.recycles += 1
+                self._replace_locked(worker.index, f"passou de {self.rss_limit_bytes / 1024 ** 2:.0f}MB ({worker.rss / 1024 ** 2:.0f}MB)")
+            elif worker.status == "busy":
+                worker.status = "idle"
+            self._cond.notify_all()
+
+    def _drain(self, worker: _Worker) -> str:
+        """Após um abandono (gerador fechado no meio), cancela e descarta as mensagens até o fim da tarefa."""
+        deadline = time.monotonic() + self.cancel_grace_s
+        try:
+            worker.conn.send({"op": "cancel", "task": worker.task})
+            while time.monotonic() < deadline:
+                if worker.conn.poll(0.1):
+                    message = worker.conn.recv()
+                    if message["type"] not in ("info", "segment"):
+                        if message.get("models") is not None: worker.models, worker.rss = message["models"], message["rss"]
+                        return "busy"
+                elif not worker.process.is_alive():
+                    break
+        except (EOFError, OSError):
+            pass
+        return "crashed"
+
+    def _spawn(self, index: int, preload: List[str]) -> _Worker:
+        """Inicia o processo do worker; ele fica "starting" até avisar que carregou os modelos."""
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, name=f"inference-worker-{index}", daemon=True,
+                                    args=(child_conn, self.engine, self.model_kwargs, self.budget_bytes, preload))
+        process.start()
+        child_conn.close()
+        worker = _Worker(index, process, parent_conn, preload)
+        with self._cond:
+            self._workers[index] = worker
+        threading.Thread(target=self._await_ready, args=(worker,), daemon=True).start()
+        return worker
+
+    def _await_ready(self, worker: _Worker):
+        ready = None
+        deadline = time.monotonic() + self.start_timeout_s
+        while ready is None and worker.process.is_alive() and time.monotonic() < deadline:
+            try:
+                if worker.conn.poll(0.5): ready = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+        with self._cond:
+            if worker.status != "starting": return
+            if ready is not None:
+                worker.status, worker.models, worker.rss = "idle", ready["models"], ready["rss"]
+                self._start_failures[worker.index] = 0
+                logger.info(f"Worker de inferência {worker.index} pronto (pid {worker.process.pid}, modelos: {', '.join(worker.models) or 'nenhum'}).")
+            else:
+                # Ex.: falta de memória ao pré-carregar; tenta de novo, com espera crescente, para o pool não encolher de vez
+                worker.status = "failed"
+                self._start_failures[worker.index] += 1
+                delay = min(self.max_restart_backoff_s, self.restart_backoff_s * 2 ** (self._start_failures[worker.index] - 1))
+                logger.error(f"Worker de inferência {worker.index} não iniciou (código {worker.process.exitcode}); nova tentativa em {delay:.0f}s.")
+                timer = threading.Timer(delay, self._restart_failed, args=(worker,))
+                timer.daemon = True
+                timer.start()
+            self._cond.notify_all()
+
+    def _restart_failed(self, worker: _Worker):
+        with self._cond:
+            if self._closed or self._workers[worker.index] is not worker or worker.status != "failed": return
+            self._replace_locked(worker.index, "não iniciou")
+
+    def _replace_locked(self, index: int, reason: str):
+        """Encerra o worker e inicia outro no lugar, já carregando os modelos que ele tinha (chamado com o lock)."""
+        old = self._workers[index]
+        old.status = "stopped"
+        logger.warning(f"Worker de inferência {index} (pid {old.process.pid}) {reason}; reiniciando.")
+        self.restarts += 1
+        threading.Thread(target=self._stop_process, args=(old,), daemon=True).start()
+        if not self._closed: self._spawn(index, list(old.models))
+
+    def _stop_process(self, worker: _Worker, timeout_s: float = 5.0):
+        try:
+            if worker.process.is_alive(): worker.conn.send({"op": "stop"})
+        except (EOFError, OSError):
+            pass
+        worker.process.join(timeout_s)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join(timeout_s)
+        worker.conn.close()
+
+    @staticmethod
+    def _free(block):
+        block.close()
+        block.unlink()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"size": self.size, "engine": self.engine, "rss_limit_mb": round(self.rss_limit_bytes / 1024 ** 2),
+                    "restarts": self.restarts, "recycles": self.recycles, "crashes": self.crashes,
+                    "routed_hits": self.routed_hits, "routed_misses": self.routed_misses,
+                    "workers": [w.to_dict() for w in self._workers if w is not None]}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            workers = [w for w in self._workers if w is not None]
+            for w in workers: w.status = "stopped"
+            self._cond.notify_all()
+        for w in workers: self._stop_process(w, timeout_s=2.0)
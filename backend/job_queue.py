@@ -0,0 +1,177 @@
+"""Fila de tarefas com prioridade, número limitado de slots de inferência e cancelamento.
+
+As tarefas são funções síncronas executadas em threads próprias, de modo que FFmpeg
+e Whisper nunca bloqueiam o event loop do FastAPI.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Intervalo da limpeza periódica de tarefas concluídas há mais de result_ttl_s
+PRUNE_INTERVAL_S = 60
+
+
+class QueueFullError(Exception):
+    """A fila atingiu o limite de tarefas em espera."""
+
+
+class JobCancelled(Exception):
+    """A tarefa foi cancelada enquanto executava."""
+
+
+@dataclass
+class Job:
+    id: str
+    priority: int
+    fn: Optional[Callable[["Job"], Any]]
+    seq: int = 0
+    status: str = "queued"  # queued, running, done, error, cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    error_status: int = 500
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Optional[asyncio.Future] = None
+    meta: dict = field(default_factory=dict)
+
+    def check_cancelled(self):
+        """Chamado pelo trabalho em andamento entre etapas para interromper cedo."""
+        if self.cancel_event.is_set(): raise JobCancelled(self.id)
+
+    def to_dict(self, position: Optional[int] = None) -> dict:
+        data = {"job_id": self.id, "status": self.status, "priority": self.priority, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at, **self.meta}
+        if position is not None: data["queue_position"] = position
+        if self.status == "done": data["result"] = self.result
+        if self.error: data["error"] = self.error
+        return data
+
+
+class JobScheduler:
+    """Distribui tarefas entre `slots` workers; maior prioridade primeiro, FIFO entre iguais."""
+
+    def __init__(self, slots: int, max_queue: int, result_ttl_s: float = 3600, on_change: Optional[Callable[[Job], None]] = None):
+        self.slots = max(1, slots)
+        self.max_queue = max_queue
+        self.result_ttl_s = result_ttl_s
+        self.on_change = on_change  # Chamado a cada mudança de status (ex.: para espelhar a tarefa no estado compartilhado)
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._workers = []
+        self._pruner: Optional[asyncio.Task] = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="job")
+
+    def start(self):
+        if self._workers: return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.slots)]
+        self._pruner = asyncio.create_task(self._prune_loop())
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.status in ("queued", "running"): job.cancel_event.set()
+        for w in self._workers: w.cancel()
+        if self._pruner: self._pruner.cancel()
+        self._workers, self._pruner = [], None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for j in self.jobs.values() if j.status == "queued")
+
+    @property
+    def running(self) -> int:
+        return sum(1 for j in self.jobs.values() if j.status == "running")
+
+    def submit(self, fn: Callable[[Job], Any], priority: int = 0, job_id: Optional[str] = None, **meta) -> Job:
+        """Enfileira uma tarefa; levanta QueueFullError se a fila estiver cheia."""
+        self.start()
+        self._prune()
+        if self.queued >= self.max_queue: raise QueueFullError(f"{self.queued} tarefas em espera")
+        job = Job(id=job_id or str(uuid.uuid4()), priority=priority, fn=fn, seq=next(self._seq), meta=meta)
+        job.future = asyncio.get_running_loop().create_future()
+        self.jobs[job.id] = job
+        self._queue.put_nowait((-priority, job.seq, job.id))
+        self._changed(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if not job or job.status not in ("queued", "running"): return job
+        job.cancel_event.set()
+        if job.status == "queued": self._finish(job, "cancelled", error="Cancelada")
+        return job
+
+    def position(self, job: Job) -> Optional[int]:
+        """Posição (1 = próxima) de uma tarefa ainda em espera."""
+        if job.status != "queued": return None
+        key = (-job.priority, job.seq)
+        return 1 + sum(1 for j in self.jobs.values() if j.status == "queued" and (-j.priority, j.seq) < key)
+
+    async def wait(self, job: Job) -> Any:
+        """Aguarda o fim da tarefa, devolvendo o resultado ou levantando o erro original."""
+        return await asyncio.shield(job.future)
+
+    def stats(self) -> dict:
+        return {"slots": self.slots, "max_queue": self.max_queue, "queued": self.queued, "running": self.running}
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None, exc: Optional[BaseException] = None):
+        job.status, job.result, job.error, job.finished_at = status, result, error, time.time()
+        job.fn = None  # A closure costuma prender o áudio decodificado; só o resultado precisa sobreviver até o TTL
+        if job.future and not job.future.done():
+            if exc is not None: job.future.set_exception(exc)
+            elif status == "cancelled": job.future.set_exception(JobCancelled(job.id))
+            else: job.future.set_result(result)
+            job.future.exception()  # Evita aviso de exceção nunca recuperada quando ninguém aguarda
+        self._changed(job)
+
+    def _changed(self, job: Job):
+        if not self.on_change: return
+        try:
+            self.on_change(job)
+        except Exception as e:
+            logger.warning(f"Falha ao propagar o estado da tarefa {job.id}: {e}")
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and now - j.finished_at > self.result_ttl_s]:
+            del self.jobs[job_id]
+
+    async def _prune_loop(self):
+        while True:
+            await asyncio.sleep(PRUNE_INTERVAL_S)
+            self._prune()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if not job or job.status != "queued": continue
+            job.status, job.started_at = "running", time.time()
+            self._changed(job)
+            try:
+                result = await loop.run_in_executor(self._executor, job.fn, job)
+                if job.cancel_event.is_set(): self._finish(job, "cancelled", error="Cancelada")
+                else: self._finish(job, "done", result=result)
+            except JobCancelled as e:
+                self._finish(job, "cancelled", error="Cancelada", exc=e)
+            except Exception as e:
+                logger.error(f"Erro na tarefa {job.id}: {e}")
+                job.error_status = getattr(e, "status_code", 500)
+                self._finish(job, "error", error=str(getattr(e, "detail", e)), exc=e)
@@ -0,0 +1,542 @@
+"""Teste de carga da camada HTTP/SSE, com motor de inferência e FFmpeg simulados.
+
+Uso (a partir de backend/):
+
+    python loadtest.py                                        # 60 s com as taxas padrão, grava loadtest-results.json
+    python loadtest.py --duration 120 --rate upload=2,metadata=20,render=0.2,health=50 --fanout 3
+    python loadtest.py --env INFERENCE_WORKERS=2 --env JOB_SLOTS=4 --rtf 0.1 --segment-s 2
+    python loadtest.py --url http://localhost:8000 --rate metadata=50,health=100   # instância já rodando, sem simulação
+
+Sem `--url`, o servidor sobe num diretório temporário com WHISPER_ENGINE=loadtest:FakeWhisperModel
+(tempo de carga, RTF e duração dos segmentos configuráveis), um `ffmpeg` falso à frente no PATH (gera
+WAV/PCM de silêncio e vídeos vazios na velocidade pedida) e metadados do YouTube simulados: mede-se só a
+API (upload, fila, SSE, caches), separada do custo da inferência. As chegadas de cada cenário seguem um
+processo de Poisson na taxa pedida; quando um cenário atinge `--max-inflight`, as chegadas são descartadas
+e contadas como `skipped`.
+
+O relatório traz, por cenário, latência p50/p95/p99 e vazão; no SSE, o tempo até a primeira legenda e
+até o status final; do servidor, o atraso do event loop (histograma do /metrics) e a memória (RSS da API
+e dos processos filhos). O FFmpeg falso precisa de um shell POSIX; no Windows, use --real-ffmpeg.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import uuid
+import wave
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_RATE = 16000
+DEFAULT_RATES = {"upload": 1.0, "metadata": 5.0, "render": 0.1, "health": 10.0}
+
+# Parâmetros da simulação, passados ao servidor (e aos processos que ele cria) por variáveis de ambiente
+SIMULATION_ENV = {
+    "load_s": ("LOADTEST_LOAD_S", 0.5, "Tempo de carregamento de um modelo (s)"),
+    "rtf": ("LOADTEST_RTF", 0.05, "Segundos de decodificação por segundo de áudio"),
+    "segment_s": ("LOADTEST_SEGMENT_S", 3.0, "Duração de áudio de cada segmento (define o ritmo dos eventos)"),
+    "media_s": ("LOADTEST_MEDIA_S", 30.0, "Duração do áudio que o FFmpeg falso \"extrai\" de qualquer mídia"),
+    "ffmpeg_speed": ("LOADTEST_FFMPEG_SPEED", 200.0, "Velocidade da extração simulada (x tempo real)"),
+    "render_speed": ("LOADTEST_RENDER_SPEED", 20.0, "Velocidade da renderização simulada (x tempo real)"),
+    "render_kb": ("LOADTEST_RENDER_KB", 512.0, "Tamanho do vídeo renderizado simulado (KB)"),
+    "metadata_s": ("LOADTEST_METADATA_S", 0.3, "Latência da consulta simulada de metadados do YouTube (s)"),
+}
+
+
+def _setting(key: str) -> float:
+    name, default, _ = SIMULATION_ENV[key]
+    return float(os.environ.get(name, default))
+
+
+def _busy_wait(seconds: float, spin: bool):
+    """Espera dormindo (como o CTranslate2, que solta o GIL) ou girando em Python (segurando o GIL)."""
+    if seconds <= 0: return
+    if not spin: return time.sleep(seconds)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline: pass
+
+
+# --- Motor simulado ---
+
+class FakeWhisperModel:
+    """Motor com a interface do WhisperModel que devolve legendas fixas no ritmo configurado.
+
+    LOADTEST_LOAD_S, LOADTEST_RTF e LOADTEST_SEGMENT_S controlam carga e decodificação;
+    LOADTEST_SPIN=1 gasta o tempo de decodificação em Python, competindo pelo GIL com a API.
+    """
+
+    def __init__(self, model_size_or_path: str, **kwargs):
+        self.name = model_size_or_path
+        self.rtf, self.segment_s = _setting("rtf"), max(0.1, _setting("segment_s"))
+        self.spin = os.environ.get("LOADTEST_SPIN", "0") == "1"
+        _busy_wait(_setting("load_s"), self.spin)
+
+    def transcribe(self, audio, language: Optional[str] = None, word_timestamps: bool = False, **kwargs):
+        if isinstance(audio, str):
+            with wave.open(audio, "rb") as w:
+                duration = w.getnframes() / w.getframerate()
+        else:
+            duration = len(audio) / SAMPLE_RATE
+
+        def generate():
+            start, index = 0.0, 1
+            while start < duration:
+                end = min(duration, start + self.segment_s)
+                _busy_wait((end - start) * self.rtf, self.spin)
+                texts = [" Legenda", " simulada", f" {index}"]
+                step = (end - start) / len(texts)
+                words = [types.SimpleNamespace(start=start + i * step, end=start + (i + 1) * step, word=t, probability=1.0)
+                         for i, t in enumerate(texts)] if word_timestamps else None
+                yield types.SimpleNamespace(start=start, end=end, text="".join(texts), words=words)
+                start, index = end, index + 1
+        return generate(), types.SimpleNamespace(duration=duration, language=language or "pt", language_probability=1.0)
+
+
+def fake_metadata(url: str) -> dict:
+    from youtube_source import video_key
+    time.sleep(_setting("metadata_s"))
+    key = video_key(url) or url
+    return {"id": key, "title": f"Vídeo simulado {key}", "thumbnail": "", "duration": 60, "duration_formatted": "01:00", "author": "loadtest"}
+
+
+# --- FFmpeg simulado ---
+
+def stub_ffmpeg(args: List[str]) -> int:
+    """Imita as chamadas do servidor ao FFmpeg: extração para WAV/pipe, sondagem e renderização."""
+    if "-version" in args:
+        print("ffmpeg version loadtest-stub")
+        return 0
+    if "-hwaccels" in args:
+        print("Hardware acceleration methods:")
+        return 0
+    if "showinfo" in args:
+        sys.stderr.write("loadtest: sem keyframes simulados\n")  # A renderização cai no caminho de passo único
+        return 1
+    output, media_s = args[-1], _setting("media_s")
+    if "pipe:0" in args:
+        while sys.stdin.buffer.read(1 << 16): pass
+    encode = "libx264" in args
+    seconds = media_s / max(0.001, _setting("render_speed" if encode else "ffmpeg_speed"))
+    progress = "-progress" in args and output != "pipe:1"
+    started = time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - started
+        done = elapsed >= seconds
+        if progress:
+            out_us = int(media_s * 1_000_000 * min(1.0, elapsed / seconds if seconds else 1.0))
+            sys.stdout.write(f"out_time_us={out_us}\nspeed={media_s / seconds if seconds else 0:.1f}x\nprogress={'end' if done else 'continue'}\n")
+            sys.stdout.flush()
+        if done: break
+        time.sleep(min(0.5, seconds - elapsed))
+    silence = bytes(int(media_s * SAMPLE_RATE) * 2)
+    if output == "pipe:1":
+        sys.stdout.buffer.write(silence)
+    elif output.endswith(".wav"):
+        with wave.open(output, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(silence)
+    elif output != "-":
+        with open(output, "wb") as f:
+            f.write(bytes(int(_setting("render_kb") * 1024)))
+    return 0
+
+
+def install_stub_ffmpeg(directory: str) -> str:
+    """Cria um `ffmpeg` em `directory` que reexecuta este arquivo; devolve o diretório para o PATH."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "ffmpeg")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" ffmpeg "$@"\n')
+    os.chmod(path, 0o755)
+    return directory
+
+
+def serve(argv: List[str]):
+    """Servidor com metadados simulados (o motor e o FFmpeg vêm do ambiente preparado por `start_server`)."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, HERE)
+    import uvicorn
+    import app
+    app.youtube_metadata.fetch = fake_metadata
+    uvicorn.run(app.app, host=args.host, port=args.port, log_level="warning")
+
+
+# --- Medição ---
+
+def percentiles(values: List[float]) -> dict:
+    if not values: return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[max(0, math.ceil(q * len(ordered)) - 1)]  # Posto mais próximo
+    return {"p50": round(pick(0.50), 4), "p95": round(pick(0.95), 4), "p99": round(pick(0.99), 4),
+            "max": round(ordered[-1], 4), "mean": round(sum(ordered) / len(ordered), 4)}
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"): continue
+        name, _, value = line.rpartition(" ")
+        try:
+            samples[name] = float(value)
+        except ValueError:
+            pass
+    return samples
+
+
+def histogram_quantiles(before: Dict[str, float], after: Dict[str, float], name: str, qs=(0.5, 0.95, 0.99)) -> dict:
+    """Quantis de um histograma do Prometheus no intervalo entre duas coletas (interpolação linear nos buckets)."""
+    prefix = f'{name}_bucket{{le="'
+    buckets = sorted((float(key[len(prefix):-2]), after[key] - before.get(key, 0.0)) for key in after if key.startswith(prefix))
+    if not buckets or not buckets[-1][1]: return {}
+    total, result = buckets[-1][1], {}
+    for q in qs:
+        rank, previous_bound, previous_count = q * total, 0.0, 0.0
+        for bound, count in buckets:
+            if count >= rank:
+                value = previous_bound if bound == float("inf") else \
+                    previous_bound + (bound - previous_bound) * (rank - previous_count) / max(1e-9, count - previous_count)
+                break
+            previous_bound, previous_count = bound, count
+        result[f"p{int(q * 100)}"] = round(value, 4)
+    return result
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.skipped: Counter = Counter()
+        self.started: Counter = Counter()
+
+    def ok(self, name: str, seconds: float):
+        self.latencies[name].append(seconds)
+
+    def error(self, name: str, kind: str):
+        self.errors[name][kind] += 1
+
+    def summary(self, name: str, elapsed_s: float) -> dict:
+        ok = len(self.latencies[name])
+        return {"started": self.started[name], "ok": ok, "errors": dict(self.errors[name]), "skipped": self.skipped[name],
+                "throughput_rps": round(ok / elapsed_s, 3) if elapsed_s else None, "latency_s": percentiles(self.latencies[name])}
+
+
+class MemorySampler:
+    """RSS do servidor (e dos filhos: workers de inferência, FFmpeg) ou, com --url, o do /metrics."""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.api: List[float] = []
+        self.total: List[float] = []
+
+    def sample_process(self):
+        import psutil
+        try:
+            process = psutil.Process(self.pid)
+            api = process.memory_info().rss
+            children = 0
+            for child in process.children(recursive=True):
+                try:
+                    children += child.memory_info().rss
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            return
+        self.api.append(api / 1024 ** 2)
+        self.total.append((api + children) / 1024 ** 2)
+
+    def sample_metrics(self, samples: Dict[str, float]):
+        if "process_resident_memory_bytes" in samples: self.api.append(samples["process_resident_memory_bytes"] / 1024 ** 2)
+
+    def summary(self) -> dict:
+        result = {}
+        for name, values in (("api_mb", self.api), ("total_mb", self.total)):
+            if values: result[name] = {"start": round(values[0], 1), "peak": round(max(values), 1), "end": round(values[-1], 1)}
+        return result
+
+
+class LoadTest:
+    def __init__(self, client, args, pid: Optional[int]):
+        self.client = client
+        self.args = args
+        self.recorder = Recorder()
+        self.memory = MemorySampler(pid)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.payload = bytearray(int(args.upload_kb * 1024))
+        self.asset_id: Optional[str] = None
+        self.sse_events = 0
+        self.sse_timeouts = 0
+
+    async def setup(self):
+        if self.args.rates.get("render"):
+            r = await self.client.post("/api/assets", files={"file": ("loadtest-render.mp4", bytes(self.payload), "video/mp4")})
+            r.raise_for_status()
+            self.asset_id = r.json()["asset_id"]
+
+    async def upload(self, i: int):
+        """Upload + transcrição, com `fanout` assinantes SSE na sessão (o primeiro mede os tempos)."""
+        session_id = f"loadtest-{self.run_id}-{i}"
+        # Conteúdo único por upload (hash diferente): nenhuma resposta sai do cache de transcrições
+        body = f"{session_id}:".encode() + bytes(self.payload)
+        started = time.perf_counter()
+        followers = [asyncio.create_task(self.follow(session_id, started, measure=(k == 0))) for k in range(self.args.fanout)]
+        try:
+            return await self.client.post("/api/transcribe", files={"file": ("loadtest.mp4", body, "video/mp4")},
+                                          data={"model": self.args.model, "session_id": session_id})
+        finally:
+            await asyncio.gather(*followers, return_exceptions=True)
+
+    async def follow(self, session_id: str, started: float, measure: bool):
+        try:
+            await asyncio.wait_for(self._follow(session_id, started, measure), self.args.sse_timeout)
+        except asyncio.TimeoutError:
+            self.sse_timeouts += 1
+            if measure: self.recorder.error("sse.final", "timeout")
+        except Exception as e:
+            if measure: self.recorder.error("sse.final", type(e).__name__)
+
+    async def _follow(self, session_id: str, started: float, measure: bool):
+        first = True
+        async with self.client.stream("GET", "/api/transcribe-status", params={"session_id": session_id}) as r:
+            async for line in r.aiter_lines():
+                if line.startswith("event: segment") and first:
+                    first = False
+                    if measure: self.recorder.ok("sse.first_caption", time.perf_counter() - started)
+                if not line.startswith("data:"): continue
+                self.sse_events += 1
+                event = json.loads(line[5:])
+                if event.get("type", "status") == "status" and event.get("stepId") in (0, 10):
+                    if measure:
+                        if event["stepId"] == 10: self.recorder.ok("sse.final", time.perf_counter() - started)
+                        else: self.recorder.error("sse.final", event.get("status", "erro"))
+                    return
+
+    async def metadata(self, i: int):
+        video = f"lt{random.randrange(self.args.metadata_videos):09d}"
+        return await self.client.post("/api/youtube-metadata", json={"url": f"https://www.youtube.com/watch?v={video}"})
+
+    async def render(self, i: int):
+        captions = json.dumps([{"id": 1, "start": 0.0, "end": 2.0, "text": f"Legenda {i}"}]).encode()
+        return await self.client.post("/api/render", files={"captions": ("captions.json", captions, "application/json")},
+                                      data={"asset_id": self.asset_id, "session_id": f"loadtest-render-{self.run_id}-{i}"})
+
+    async def health(self, i: int):
+        return await self.client.get("/api/health")
+
+    async def timed(self, name: str, i: int):
+        started = time.perf_counter()
+        try:
+            r = await getattr(self, name)(i)
+            if r.status_code < 400: self.recorder.ok(name, time.perf_counter() - started)
+            else: self.recorder.error(name, f"HTTP {r.status_code}")
+        except Exception as e:
+            self.recorder.error(name, type(e).__name__)
+
+    async def drive(self, name: str, rate: float, deadline: float):
+        """Chegadas de Poisson na taxa `rate` até `deadline`; depois espera as requisições em curso."""
+        inflight, i = set(), 0
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            if time.perf_counter() >= deadline: break
+            if len(inflight) >= self.args.max_inflight:
+                self.recorder.skipped[name] += 1
+                continue
+            self.recorder.started[name] += 1
+            task = asyncio.create_task(self.timed(name, i))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+            i += 1
+        if inflight: await asyncio.wait(inflight, timeout=self.args.drain)
+
+    async def sample(self, stop: asyncio.Event):
+        while not stop.is_set():
+            if self.memory.pid: self.memory.sample_process()
+            else:
+                try:
+                    self.memory.sample_metrics(parse_metrics((await self.client.get("/metrics")).text))
+                except Exception:
+                    pass
+            try:
+                await asyncio.wait_for(stop.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> dict:
+        await self.setup()
+        before = parse_metrics((await self.client.get("/metrics")).text)
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self.sample(stop))
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(self.drive(name, rate, deadline) for name, rate in self.args.rates.items() if rate > 0))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+        after_text = (await self.client.get("/metrics")).text
+        after = parse_metrics(after_text)
+        jobs = (await self.client.get("/api/jobs")).json()
+        # Os quantis interpolam dentro dos buckets; o máximo observado é um limite superior exato
+        lag_max = round(after.get("noxsub_event_loop_lag_max_seconds", float("inf")), 4)
+        names = [n for n, rate in self.args.rates.items() if rate > 0]
+        if self.args.rates.get("upload"): names += ["sse.first_caption", "sse.final"]
+        return {"elapsed_s": round(elapsed, 2), "scenarios": {name: self.recorder.summary(name, elapsed) for name in names},
+                "sse": {"subscribers": self.recorder.started["upload"] * self.args.fanout, "events": self.sse_events, "timeouts": self.sse_timeouts},
+                "server": {"loop_lag_s": {**{q: min(v, lag_max) for q, v in histogram_quantiles(before, after, "noxsub_event_loop_lag_seconds").items()},
+                                          "max_since_start": lag_max},
+                           "memory_mb": self.memory.summary(), "jobs": jobs}}
+
+
+# --- Servidor e relatório ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir: str):
+    """Sobe o servidor simulado num diretório de trabalho próprio e aguarda o /api/ready.
+
+    Devolve o processo, a URL e o arquivo de log do servidor, que quem chamou fecha ao encerrar o processo.
+    """
+    import httpx
+    env = {**os.environ, "WHISPER_ENGINE": "loadtest:FakeWhisperModel", "STATE_BACKEND": os.environ.get("STATE_BACKEND", "memory"),
+           "PYTHONPATH": os.pathsep.join(filter(None, [HERE, os.environ.get("PYTHONPATH")]))}
+    for key, (name, _, _) in SIMULATION_ENV.items(): env[name] = str(getattr(args, key))
+    if args.spin: env["LOADTEST_SPIN"] = "1"
+    if not args.real_ffmpeg:
+        env["PATH"] = os.pathsep.join([install_stub_ffmpeg(os.path.join(workdir, "bin")), env.get("PATH", "")])
+    env.update(args.env)
+    port = free_port()
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", str(port)], cwd=workdir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None: break
+        try:
+            if httpx.get(f"{url}/api/ready", timeout=2).status_code == 200: return proc, url, log
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    proc.kill()
+    log.close()
+    with open(os.path.join(workdir, "server.log"), "r", encoding="utf-8", errors="replace") as f:
+        tail = f.read()[-3000:]
+    raise RuntimeError(f"O servidor não ficou pronto em {args.startup_timeout:.0f}s:\n{tail}")
+
+
+def print_report(results: dict):
+    print(f"\nDuração: {results['elapsed_s']}s")
+    print(f"  {'cenário':<20} {'ok':>7} {'erros':>7} {'desc.':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8}")
+    for name, row in results["scenarios"].items():
+        lat = row["latency_s"]
+        cells = [f"{lat[k]:>8.3f}" if k in lat else f"{'-':>8}" for k in ("p50", "p95", "p99", "max")]
+        print(f"  {name:<20} {row['ok']:>7} {sum(row['errors'].values()):>7} {row['skipped']:>6} {row['throughput_rps'] or 0:>8.2f} {' '.join(cells)}")
+        if row["errors"]: print(f"  {'':<20} erros: {row['errors']}")
+    server = results["server"]
+    lag = server["loop_lag_s"]
+    print(f"Event loop: p50 {lag.get('p50', '-')}s, p95 {lag.get('p95', '-')}s, p99 {lag.get('p99', '-')}s, máx {lag.get('max_since_start', '-')}s")
+    for name, memory in server["memory_mb"].items():
+        print(f"Memória ({name}): início {memory['start']} MB, pico {memory['peak']} MB, fim {memory['end']} MB")
+    print(f"SSE: {results['sse']['subscribers']} assinantes, {results['sse']['events']} eventos, {results['sse']['timeouts']} timeouts")
+
+
+def parse_rates(text: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, text.split(",")):
+        name, _, value = item.partition("=")
+        if name not in DEFAULT_RATES: raise argparse.ArgumentTypeError(f"cenário desconhecido: {name}")
+        rates[name] = float(value)
+    return rates
+
+
+def parse_env(item: str):
+    key, sep, value = item.partition("=")
+    if not sep: raise argparse.ArgumentTypeError("use CHAVE=valor")
+    return key, value
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["ffmpeg"]: sys.exit(stub_ffmpeg(argv[1:]))
+    if argv[:1] == ["serve"]: return serve(argv[1:])
+
+    parser = argparse.ArgumentParser(description="Teste de carga da API (uploads, SSE, metadados, renderizações) com inferência simulada.")
+    parser.add_argument("--url", help="Instância já rodando (sem motor/FFmpeg simulados)")
+    parser.add_argument("--duration", type=float, default=60, help="Duração da fase de chegadas (s)")
+    parser.add_argument("--rate", dest="rates", type=parse_rates, default=dict(DEFAULT_RATES),
+                        help="Chegadas por segundo por cenário (upload, metadata, render, health); ex.: upload=2,health=0")
+    parser.add_argument("--fanout", type=int, default=2, help="Assinantes SSE por upload")
+    parser.add_argument("--max-inflight", type=int, default=200, help="Requisições simultâneas por cenário antes de descartar chegadas")
+    parser.add_argument("--upload-kb", type=float, default=256, help="Tamanho de cada upload (KB)")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--metadata-videos", type=int, default=50, help="Vídeos distintos consultados (menos vídeos, mais acertos de cache)")
+    parser.add_argument("--sse-timeout", type=float, default=300)
+    parser.add_argument("--drain", type=float, default=120, help="Espera pelas requisições em curso ao fim das chegadas (s)")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    for key, (_, default, help_text) in SIMULATION_ENV.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=float, default=default, help=help_text)
+    parser.add_argument("--spin", action="store_true", help="Decodificação simulada segura o GIL (em vez de dormir)")
+    parser.add_argument("--real-ffmpeg", action="store_true", help="Usa o FFmpeg do sistema em vez do simulado")
+    parser.add_argument("--env", type=parse_env, action="append", default=[], help="Variável do servidor (ex.: INFERENCE_WORKERS=2); repetível")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="loadtest-results.json")
+    args = parser.parse_args(argv)
+    args.env = dict(args.env)
+    random.seed(args.seed)
+
+    import httpx
+    workdir = None if args.url else tempfile.mkdtemp(prefix="noxsub-loadtest-")
+    proc = log = None
+    try:
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            proc, url, log = start_server(args, workdir)
+
+        async def go():
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+            async with httpx.AsyncClient(base_url=url, timeout=httpx.Timeout(600, connect=10), limits=limits) as client:
+                return await LoadTest(client, args, proc.pid if proc else None).run()
+        results = asyncio.run(go())
+    finally:
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if log: log.close()
+        if workdir: shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {"environment": {"timestamp": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+                               "url": args.url, "simulated": not args.url},
+               "config": {"duration_s": args.duration, "rates": args.rates, "fanout": args.fanout, "upload_kb": args.upload_kb,
+                          "model": args.model, "spin": args.spin, "server_env": args.env,
+                          "simulation": {key: getattr(args, key) for key in SIMULATION_ENV}},
+               **results}
+    print_report(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"Resultados gravados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
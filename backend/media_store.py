@@ -0,0 +1,283 @@
+"""Armazenamento de mídias no servidor, endereçado pelo SHA-256 do conteúdo.
+
+Um vídeo enviado uma vez recebe um `asset_id` (o próprio hash) que pode ser usado
+tanto na transcrição quanto na renderização. Uploads podem ser feitos em pedaços e
+retomados a partir do último offset gravado; conteúdo repetido não é armazenado duas vezes.
+Arquivos derivados (ex.: o áudio extraído) ficam na pasta do asset e são reaproveitados.
+"""
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_ASSET_ID = re.compile(r"^[0-9a-f]{64}$")
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class MediaStoreError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size): hasher.update(block)
+    return hasher.hexdigest()
+
+
+class MediaStore:
+    def __init__(self, root: str, ttl_s: float, quota_bytes: int, max_file_size: int):
+        self.root = root
+        self.ttl_s = ttl_s
+        self.quota_bytes = quota_bytes
+        self.max_file_size = max_file_size
+        self.assets_dir = os.path.join(root, "assets")
+        self.uploads_dir = os.path.join(root, "uploads")
+        os.makedirs(self.assets_dir, exist_ok=True)
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._pins = collections.Counter()  # Assets em uso por tarefas: a limpeza não os remove
+        self._upload_locks = {}
+
+    # --- Assets ---
+
+    def _asset_dir(self, asset_id: str) -> str:
+        if not _ASSET_ID.match(asset_id or ""): raise MediaStoreError("asset_id inválido.")
+        return os.path.join(self.assets_dir, asset_id)
+
+    def _read_meta(self, directory: str) -> dict:
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, directory: str, meta: dict):
+        tmp = os.path.join(directory, f"meta.json.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(directory, "meta.json"))
+
+    def get(self, asset_id: str, pin: bool = False) -> dict:
+        """Retorna os metadados do asset (com o caminho local) e renova seu prazo de expiração.
+
+        Com `pin`, o asset já volta fixado (ver `pin`), sem intervalo em que a limpeza possa removê-lo.
+        """
+        directory = self._asset_dir(asset_id)
+        with self._lock:
+            try:
+                meta = self._read_meta(directory)
+            except OSError:
+                raise MediaStoreError("Asset não encontrado.", 404)
+            meta["last_access"] = time.time()
+            self._write_meta(directory, meta)
+            if pin: self._pins[asset_id] += 1
+        return {**meta, "path": os.path.join(directory, meta["media"])}
+
+    def exists(self, asset_id: str) -> bool:
+        try:
+            return os.path.exists(os.path.join(self._asset_dir(asset_id), "meta.json"))
+        except MediaStoreError:
+            return False
+
+    def derived_path(self, asset_id: str, name: str) -> str:
+        """Caminho de um arquivo derivado do asset (pode ainda não existir)."""
+        return os.path.join(self._asset_dir(asset_id), name)
+
+    def add_file(self, path: str, filename: str, asset_id: Optional[str] = None, pin: bool = False) -> dict:
+        """Move um arquivo para o armazenamento; se o conteúdo já existir, descarta a cópia nova.
+
+        O asset devolvido leva o `filename` deste envio, não o de quem enviou o conteúdo primeiro.
+        Ele fica fixado durante a limpeza que segue a gravação (e, com `pin`, também depois, até o unpin de quem chamou).
+        """
+        size = os.path.getsize(path)
+        if size > self.quota_bytes:
+            raise MediaStoreError(f"Arquivo maior que a cota do armazenamento ({self.quota_bytes/(1024*1024):.0f}MB).", 413)
+        asset_id = asset_id or hash_file(path)
+        directory = self._asset_dir(asset_id)
+        with self._lock:
+            if self.exists(asset_id):
+                os.remove(path)
+                return {**self.get(asset_id, pin), "filename": filename}
+            os.makedirs(directory, exist_ok=True)
+            media = f"media{Path(filename).suffix.lower()}"
+            shutil.move(path, os.path.join(directory, media))
+            now = time.time()
+            self._write_meta(directory, {"asset_id": asset_id, "filename": filename, "media": media, "size": size,
+                                         "created_at": now, "last_access": now})
+            self._pins[asset_id] += 1
+        try:
+            self.cleanup()
+            return self.get(asset_id, pin)
+        finally:
+            self.unpin(asset_id)
+
+    def staging_path(self) -> str:
+        """Arquivo temporário no mesmo disco do armazenamento, para que `add_file` só precise renomeá-lo."""
+        return os.path.join(self.uploads_dir, f"direct-{uuid.uuid4().hex}.part")
+
+    def pin(self, asset_id: str):
+        """Protege o asset da limpeza enquanto uma tarefa o usa; cada pin precisa de um unpin."""
+        with self._lock:
+            self._pins[asset_id] += 1
+
+    def unpin(self, asset_id: str):
+        with self._lock:
+            self._pins[asset_id] -= 1
+            if self._pins[asset_id] <= 0: del self._pins[asset_id]
+
+    @contextlib.contextmanager
+    def pinned(self, asset_id: str):
+        self.pin(asset_id)
+        try:
+            yield
+        finally:
+            self.unpin(asset_id)
+
+    def delete(self, asset_id: str) -> bool:
+        directory = self._asset_dir(asset_id)
+        with self._lock:
+            if not os.path.isdir(directory): return False
+            if self._pins[asset_id]: raise MediaStoreError("Asset em uso por uma tarefa.", 409)
+            shutil.rmtree(directory, ignore_errors=True)
+            return True
+
+    # --- Uploads retomáveis ---
+
+    def _upload_dir(self, upload_id: str) -> str:
+        if not _UPLOAD_ID.match(upload_id or ""): raise MediaStoreError("upload_id inválido.")
+        directory = os.path.join(self.uploads_dir, upload_id)
+        if not os.path.isdir(directory): raise MediaStoreError("Upload não encontrado.", 404)
+        return directory
+
+    def create_upload(self, filename: str, size: Optional[int] = None, sha256: Optional[str] = None) -> dict:
+        """Inicia um upload em pedaços.
+
+        O `sha256` informado só serve para conferir o conteúdo no fim: o hash sozinho não prova a
+        posse do arquivo, então a deduplicação acontece em `complete_upload`, depois de receber os bytes.
+        """
+        if size is not None and size > self.max_file_size:
+            raise MediaStoreError(f"Arquivo muito grande. Máximo: {self.max_file_size/(1024*1024):.0f}MB", 413)
+        if size is not None and size > self.quota_bytes:
+            raise MediaStoreError(f"Arquivo maior que a cota do armazenamento ({self.quota_bytes/(1024*1024):.0f}MB).", 413)
+        upload_id = uuid.uuid4().hex
+        directory = os.path.join(self.uploads_dir, upload_id)
+        os.makedirs(directory)
+        open(os.path.join(directory, "data.part"), "wb").close()
+        meta = {"upload_id": upload_id, "filename": filename, "size": size, "sha256": sha256, "created_at": time.time()}
+        self._write_meta(directory, meta)
+        return {**meta, "offset": 0}
+
+    def upload_status(self, upload_id: str) -> dict:
+        directory = self._upload_dir(upload_id)
+        return {**self._read_meta(directory), "offset": os.path.getsize(os.path.join(directory, "data.part"))}
+
+    @contextlib.contextmanager
+    def open_chunk(self, upload_id: str, offset: int):
+        """Abre o arquivo parcial para anexar a partir de `offset`, que deve coincidir com o que já foi gravado.
+
+        Um único pedaço por upload é gravado de cada vez; um PUT concorrente recebe 409 em vez de
+        passar pela conferência do offset e anexar os mesmos bytes duas vezes.
+        """
+        directory = self._upload_dir(upload_id)
+        with self._lock:
+            lock = self._upload_locks.setdefault(upload_id, threading.Lock())
+        if not lock.acquire(blocking=False): raise MediaStoreError("Outro pedaço deste upload está sendo gravado.", 409)
+        try:
+            part = os.path.join(directory, "data.part")
+            current = os.path.getsize(part)
+            if offset != current: raise MediaStoreError(f"Offset incorreto: esperado {current}.", 409)
+            with open(part, "ab") as f:
+                yield f
+        finally:
+            lock.release()
+
+    def complete_upload(self, upload_id: str) -> dict:
+        """Valida tamanho e hash, e transforma o upload num asset (deduplicado pelo conteúdo)."""
+        directory = self._upload_dir(upload_id)
+        meta = self._read_meta(directory)
+        part = os.path.join(directory, "data.part")
+        size = os.path.getsize(part)
+        if meta.get("size") is not None and size != meta["size"]:
+            raise MediaStoreError(f"Upload incompleto: {size} de {meta['size']} bytes.", 409)
+        asset_id = hash_file(part)
+        if meta.get("sha256") and meta["sha256"].lower() != asset_id:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise MediaStoreError("O hash do conteúdo não confere com o informado.", 422)
+        try:
+            asset = self.add_file(part, meta["filename"], asset_id)
+        except MediaStoreError as e:
+            if e.status_code == 413: shutil.rmtree(directory, ignore_errors=True)  # Nunca vai caber: não adianta retomar
+            raise
+        shutil.rmtree(directory, ignore_errors=True)
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+        return asset
+
+    # --- Limpeza ---
+
+    def _dir_size(self, directory: str) -> int:
+        total = 0
+        for base, _, names in os.walk(directory):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(base, name))
+                except OSError:
+                    pass
+        return total
+
+    def cleanup(self) -> dict:
+        """Remove assets e uploads sem acesso há mais de `ttl_s` e, depois, os menos usados até caber na cota.
+
+        Assets fixados por tarefas em andamento (`pin`) não são removidos nem contam para a cota.
+        """
+        removed, now = 0, time.time()
+        with self._lock:
+            for name in os.listdir(self.uploads_dir):
+                path = os.path.join(self.uploads_dir, name)
+                try:
+                    # Num upload retomável, quem muda a cada pedaço é o data.part, não o diretório
+                    part = os.path.join(path, "data.part")
+                    written = os.path.getmtime(part if os.path.exists(part) else path)
+                    if now - written > self.ttl_s:
+                        shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.remove(path)
+                        self._upload_locks.pop(name, None)
+                except OSError:
+                    pass
+            assets = []
+            for asset_id in os.listdir(self.assets_dir):
+                directory = os.path.join(self.assets_dir, asset_id)
+                try:
+                    meta = self._read_meta(directory)
+                except (OSError, ValueError):
+                    continue
+                if self._pins[asset_id]: continue
+                if now - meta.get("last_access", 0) > self.ttl_s:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    removed += 1
+                else:
+                    assets.append((meta.get("last_access", 0), self._dir_size(directory), directory))
+            total = sum(size for _, size, _ in assets)
+            for _, size, directory in sorted(assets):
+                if total <= self.quota_bytes: break
+                shutil.rmtree(directory, ignore_errors=True)
+                total -= size
+                removed += 1
+        if removed: logger.info(f"Armazenamento de mídia: {removed} asset(s) removido(s).")
+        return {"removed": removed, "size_bytes": total, "quota_bytes": self.quota_bytes}
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [self._dir_size(os.path.join(self.assets_dir, a)) for a in os.listdir(self.assets_dir)]
+            return {"assets": len(sizes), "size_bytes": sum(sizes), "quota_bytes": self.quota_bytes, "ttl_s": self.ttl_s,
+                    "pending_uploads": len(os.listdir(self.uploads_dir))}
@@ -0,0 +1,257 @@
+"""Métricas no formato de texto do Prometheus e tempos por etapa de cada sessão.
+
+Implementação própria e mínima (contadores, gauges e histogramas com rótulos), sem depender
+do prometheus_client. Valores que já existem em outros objetos (fila, pool de modelos, caches)
+são lidos na hora da coleta por funções registradas com `counter_fn`/`gauge_fn`.
+"""
+import abc
+import asyncio
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value): return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs: return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Linhas de amostra no formato de texto, sem HELP/TYPE."""
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class CallbackMetric(_Metric):
+    """Valor lido na coleta; `fn` devolve um número ou um dict {valor do rótulo: número} (um único rótulo)."""
+
+    def __init__(self, name, help_text, fn: Callable[[], object], kind: str = "gauge", labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_format_labels(self.labelnames, (k,))} {_format_value(v)}" for k, v in sorted(value.items())]
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[tuple, list] = {}  # rótulos -> [contagens por bucket..., soma, total]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: series[i] += 1  # Buckets cumulativos, como o Prometheus espera
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_fn(self, name, help_text, fn, labelnames=()):
+        return self._add(CallbackMetric(name, help_text, fn, "gauge", labelnames))
+
+    def counter_fn(self, name, help_text, fn, labelnames=()):
+        return self._add(CallbackMetric(name, help_text, fn, "counter", labelnames))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+class SessionTimings:
+    """Etapas (início, duração, resultado) de cada sessão, descartadas após `retention_s`."""
+
+    def __init__(self, retention_s: float = 3600, max_sessions: int = 5000):
+        self.retention_s = retention_s
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, stage: str, started_at: float, duration_s: float, ok: bool = True, **extra):
+        with self._lock:
+            if session_id not in self._sessions: self._prune()
+            session = self._sessions.setdefault(session_id, {"stages": [], "updated_at": 0.0})
+            session["stages"].append({"stage": stage, "started_at": started_at, "duration_s": round(duration_s, 4), "ok": ok, **extra})
+            session["updated_at"] = time.time()
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session: return None
+            stages = list(session["stages"])
+        totals: Dict[str, float] = {}
+        for s in stages: totals[s["stage"]] = round(totals.get(s["stage"], 0.0) + s["duration_s"], 4)
+        span = max(s["started_at"] + s["duration_s"] for s in stages) - min(s["started_at"] for s in stages)
+        return {"session_id": session_id, "stages": stages, "totals": totals, "wall_s": round(span, 4)}
+
+    def _prune(self):
+        now = time.time()
+        expired = [sid for sid, s in self._sessions.items() if now - s["updated_at"] > self.retention_s]
+        for sid in expired: del self._sessions[sid]
+        if len(self._sessions) >= self.max_sessions:
+            for sid, _ in sorted(self._sessions.items(), key=lambda item: item[1]["updated_at"])[:len(self._sessions) - self.max_sessions + 1]:
+                del self._sessions[sid]
+
+
+class StageTracer:
+    """Mede etapas do pipeline: cada uma alimenta o histograma por etapa e os tempos da sessão."""
+
+    def __init__(self, histogram: Histogram, timings: SessionTimings):
+        self.histogram = histogram
+        self.timings = timings
+
+    def observe(self, session_id: Optional[str], stage: str, duration_s: float, started_at: Optional[float] = None, ok: bool = True, **extra):
+        self.histogram.observe(duration_s, stage=stage)
+        if session_id: self.timings.record(session_id, stage, started_at if started_at is not None else time.time() - duration_s, duration_s, ok, **extra)
+
+    @contextlib.contextmanager
+    def stage(self, session_id: Optional[str], stage: str, **extra):
+        started_at, t0, ok = time.time(), time.perf_counter(), False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(session_id, stage, time.perf_counter() - t0, started_at, ok, **extra)
+
+
+class LoopLagMonitor:
+    """Atraso do event loop: quanto um `sleep(interval_s)` demora além do pedido (tempo em que o loop esteve ocupado)."""
+
+    def __init__(self, histogram: Histogram, interval_s: float = 0.1):
+        self.histogram = histogram
+        self.interval_s = interval_s
+        self.last_s = 0.0
+        self.max_s = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task: self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.last_s = max(0.0, loop.time() - t0 - self.interval_s)
+            self.max_s = max(self.max_s, self.last_s)
+            self.histogram.observe(self.last_s)
+
+
+class RequestLatencyMiddleware:
+    """Middleware ASGI que mede cada requisição HTTP até o início da resposta, rotulada pelo padrão da rota."""
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        t0, observed = time.perf_counter(), False
+
+        def observe(status: int):
+            nonlocal observed
+            if observed: return
+            observed = True
+            # O roteador do FastAPI grava a rota no scope; o padrão (ex.: /api/jobs/{job_id}) evita uma série por id
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.histogram.observe(time.perf_counter() - t0, method=scope["method"], route=route, status=status)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start": observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            observe(500)
@@ -0,0 +1,134 @@
+"""Pool de modelos Whisper com carregamento único, expulsão LRU por orçamento de RAM e estatísticas.
+
+Requisições simultâneas por um modelo frio esperam o mesmo carregamento em vez de
+carregá-lo várias vezes; antes de carregar, os modelos menos usados são descartados
+até que a estimativa do novo caiba no orçamento.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Memória residente aproximada (MB) de cada modelo em int8/float16; corrigida pela medição real após o carregamento
+MODEL_SIZE_ESTIMATES_MB = {"tiny": 150, "base": 250, "small": 600, "medium": 1600, "large-v2": 3200, "large-v3": 3200}
+
+
+class _Entry:
+    def __init__(self, model: Any, size_bytes: int, load_time_s: float):
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_time_s = load_time_s
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self.hits = 0
+
+
+class ModelPool:
+    def __init__(self, loader: Callable[[str], Any], budget_bytes: int, min_free_bytes: int = 512 * 1024 * 1024):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._models: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        self._measured: Dict[str, int] = {}
+        self._reserved: Dict[str, int] = {}  # Modelos mantidos fora do pool (ex.: processos da mídia longa)
+        self._lock = threading.Lock()
+
+    def estimate(self, name: str) -> int:
+        return self._measured.get(name) or MODEL_SIZE_ESTIMATES_MB.get(name, 1000) * 1024 * 1024
+
+    def get(self, name: str) -> Any:
+        """Retorna o modelo residente ou o carrega (uma única vez, mesmo sob concorrência)."""
+        while True:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry:
+                    self._models.move_to_end(name)
+                    entry.hits += 1
+                    entry.last_used = time.time()
+                    self.hits += 1
+                    return entry.model
+                pending = self._loading.get(name)
+                if pending is None:
+                    self._loading[name] = threading.Event()
+                    break
+            pending.wait()  # Outro thread está carregando; ao terminar, tenta de novo (ou assume, se falhou)
+        try:
+            return self._load(name)
+        finally:
+            with self._lock:
+                self._loading.pop(name).set()
+
+    def _load(self, name: str) -> Any:
+        self._make_room(self.estimate(name))
+        logger.info(f"Carregando modelo Whisper: {name}...")
+        rss_before = psutil.Process().memory_info().rss
+        started = time.perf_counter()
+        model = self.loader(name)
+        load_time = time.perf_counter() - started
+        measured = psutil.Process().memory_info().rss - rss_before
+        size = measured if measured > 0 else self.estimate(name)
+        with self._lock:
+            if measured > 0: self._measured[name] = measured
+            self._models[name] = _Entry(model, size, load_time)
+            self.loads += 1
+        logger.info(f"Modelo {name} carregado em {load_time:.1f}s (~{size / 1024 ** 2:.0f}MB).")
+        return model
+
+    def _make_room(self, needed: int):
+        """Descarta modelos LRU até o novo caber no orçamento e na memória livre do sistema."""
+        with self._lock:
+            while self._models:
+                resident = sum(e.size_bytes for e in self._models.values()) + sum(self._reserved.values())
+                available = psutil.virtual_memory().available
+                if resident + needed <= self.budget_bytes and needed + self.min_free_bytes <= available: break
+                name, _ = self._models.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Modelo {name} descartado do pool para liberar memória.")
+
+    def reserve(self, key: str, size_bytes: int):
+        """Conta no orçamento memória ocupada fora do pool, descartando modelos LRU para abrir espaço."""
+        self._make_room(size_bytes)
+        with self._lock:
+            self._reserved[key] = size_bytes
+
+    def release(self, key: str):
+        with self._lock:
+            self._reserved.pop(key, None)
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            return self._models.pop(name, None) is not None
+
+    def preload(self, names: Iterable[str], warmup: Optional[Callable[[Any], None]] = None):
+        """Carrega (e opcionalmente aquece) os modelos informados; falhas só são registradas."""
+        for name in names:
+            try:
+                model = self.get(name)
+                if warmup:
+                    started = time.perf_counter()
+                    warmup(model)
+                    logger.info(f"Modelo {name} aquecido em {time.perf_counter() - started:.1f}s.")
+            except Exception as e:
+                logger.error(f"Falha ao pré-carregar o modelo {name}: {e}")
+
+    def is_resident(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {name: {"size_mb": round(e.size_bytes / 1024 ** 2, 1), "load_time_s": round(e.load_time_s, 2),
+                             "hits": e.hits, "loaded_at": e.loaded_at, "last_used": e.last_used}
+                      for name, e in self._models.items()}
+            return {"budget_mb": round(self.budget_bytes / 1024 ** 2), "resident_mb": round(sum(e.size_bytes for e in self._models.values()) / 1024 ** 2, 1),
+                    "reserved_mb": round(sum(self._reserved.values()) / 1024 ** 2, 1),
+                    "loading": list(self._loading), "loads": self.loads, "hits": self.hits, "evictions": self.evictions, "models": models}
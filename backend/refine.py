@@ -0,0 +1,74 @@
+"""Transcrição em duas passadas: rascunho com um modelo pequeno, refinamento com o modelo pedido.
+
+O rascunho chega ao cliente em segundos; o refinamento não troca a lista de legendas inteira (o
+usuário pode estar lendo ou editando): as palavras do modelo maior são distribuídas entre as
+legendas do rascunho pelo tempo, e cada legenda alterada vira uma operação de diff com o mesmo id:
+
+    {"op": "update", "id": 3, "start": 4.2, "end": 6.9, "text": "texto refinado"}
+    {"op": "remove", "id": 7}                       # o modelo maior não ouviu fala ali
+    {"op": "add", "caption": {"id": 12, ...}}        # só quando o rascunho não tinha legendas
+"""
+import bisect
+from typing import List, Optional, Sequence, Tuple
+
+Word = Tuple[float, float, str, float]
+
+# Diferença de tempo abaixo da qual uma legenda com o mesmo texto não gera diff
+TIME_TOLERANCE_S = 0.05
+
+
+class RefineAligner:
+    """Distribui as palavras do refinamento entre as legendas do rascunho, na ordem em que são decodificadas.
+
+    A legenda i recebe as palavras cujo ponto médio fica entre o seu início e o início da seguinte
+    (a primeira também recebe as anteriores a ela); quando a decodificação passa do início da
+    legenda i+1, a legenda i está completa e seu diff é emitido.
+    """
+
+    def __init__(self, draft: Sequence[dict]):
+        self.draft = sorted(draft, key=lambda c: c["start"])
+        self.bounds = [c["start"] for c in self.draft[1:]] + [float("inf")]
+        self.buckets: List[List[Word]] = [[] for _ in self.draft]
+        self.refined: List[Optional[dict]] = [None] * len(self.draft)
+        self.added: List[dict] = []
+        self.next_id = max((c["id"] for c in self.draft), default=0) + 1
+        self._emitted = 0
+
+    def feed(self, words: Sequence[Word], until: float) -> List[dict]:
+        """Acrescenta as palavras de um segmento decodificado (que termina em `until`) e devolve os diffs já definitivos."""
+        if not self.draft:
+            text = "".join(w[2] for w in words).strip()
+            if not text: return []
+            caption = {"id": self.next_id, "start": words[0][0], "end": words[-1][1], "text": text}
+            self.next_id += 1
+            self.added.append(caption)
+            return [{"op": "add", "caption": caption}]
+        for word in words:
+            self.buckets[bisect.bisect_right(self.bounds, (word[0] + word[1]) / 2)].append(word)
+        ops = []
+        while self._emitted < len(self.draft) and self.bounds[self._emitted] <= until:
+            ops.extend(self._emit(self._emitted))
+            self._emitted += 1
+        return ops
+
+    def finish(self) -> List[dict]:
+        """Diffs das legendas restantes, ao fim da decodificação."""
+        ops = []
+        while self._emitted < len(self.draft):
+            ops.extend(self._emit(self._emitted))
+            self._emitted += 1
+        return ops
+
+    def captions(self) -> List[dict]:
+        """Legendas finais: ids do rascunho com o texto refinado (sem as removidas), mais as adicionadas."""
+        return [c for c in self.refined if c is not None] + self.added
+
+    def _emit(self, i: int) -> List[dict]:
+        draft, words = self.draft[i], self.buckets[i]
+        text = "".join(w[2] for w in words).strip()
+        if not text: return [{"op": "remove", "id": draft["id"]}]
+        caption = {"id": draft["id"], "start": min(w[0] for w in words), "end": max(w[1] for w in words), "text": text}
+        self.refined[i] = caption
+        unchanged = text == draft["text"] and abs(caption["start"] - draft["start"]) < TIME_TOLERANCE_S \
+            and abs(caption["end"] - draft["end"]) < TIME_TOLERANCE_S
+        return [] if unchanged else [{"op": "update", **caption}]
@@ -0,0 +1,283 @@
+"""Renderização de legendas em paralelo por segmentos.
+
+O vídeo é dividido em keyframes (cópia sem recodificar), cada segmento com legendas
+é recodificado com o filtro `subtitles` num FFmpeg próprio, segmentos sem legendas
+passam adiante intactos e tudo é concatenado sem perdas, com o áudio original.
+
+Segmentos copiados e recodificados trazem SPS/PPS diferentes; para que o fluxo concatenado
+decodifique além da primeira troca, cada keyframe leva os seus parâmetros no próprio fluxo
+(`repeat-headers` no libx264 e `auto_convert` do concat, que aplica o h264_mp4toannexb a cada
+arquivo), e o perfil, a resolução e a base de tempo da origem são mantidos. Origens fora
+desses limites (outro codec, 10 bits, 4:2:2, entrelaçadas) são recodificadas por inteiro.
+
+Com um `SegmentCache`, cada segmento recodificado é guardado pela combinação de mídia,
+intervalo, legendas que o afetam e estilo; numa nova renderização após uma edição,
+só os segmentos cujas legendas mudaram são recodificados.
+"""
+import concurrent.futures
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+
+SUBTITLE_STYLE = "Fontsize=16,Outline=1,Shadow=0.5,BorderStyle=1,PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&"
+# Perfis H.264 da origem que o libx264 reproduz em 8 bits 4:2:0; só com eles segmentos copiados e recodificados se misturam
+_X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+# Versão do resultado de probe_keyframes; análises gravadas com outra versão devem ser refeitas
+PROBE_VERSION = 2
+
+
+class ProbeError(Exception):
+    pass
+
+
+class SegmentCache:
+    """Segmentos já renderizados, com expulsão LRU quando o total passa de `max_bytes`."""
+
+    def __init__(self, directory: str, max_bytes: int, min_age_s: float = 600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age_s = min_age_s  # Segmentos usados há pouco (talvez numa renderização em curso) não são removidos
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mkv")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            if not os.path.exists(path):
+                self.misses += 1
+                return None
+            os.utime(path)
+            self.hits += 1
+            return path
+
+    def put(self, key: str, src: str) -> str:
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src, tmp)
+        with self._lock:
+            os.replace(tmp, path)
+            self._evict()
+        return path
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".mkv"): continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes or now - mtime < self.min_age_s: break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [os.path.getsize(os.path.join(self.directory, n)) for n in os.listdir(self.directory) if n.endswith(".mkv")]
+            return {"entries": len(sizes), "size_bytes": sum(sizes), "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+def segment_key(source_id: str, start: float, end: float, captions: List[dict], style: str, preset: str, crf: int,
+                profile: Optional[str] = None) -> str:
+    """Chave do segmento renderizado: só muda se a mídia, o intervalo, as legendas que o tocam ou o estilo mudarem."""
+    visible = [(round(c["start"], 3), round(c["end"], 3), str(c["text"]).replace("\n", " ").strip()) for c in captions]
+    payload = json.dumps({"source": source_id, "range": [round(start, 3), round(end, 3)], "captions": visible,
+                          "style": style, "preset": preset, "crf": crf, "encoder": "libx264", "profile": profile,
+                          "headers": "repeat"}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def probe_keyframes(src: str) -> dict:
+    """Duração, codec e instantes (s) dos keyframes do primeiro stream de vídeo, usando só o FFmpeg."""
+    cmd = ["ffmpeg", "-hide_banner", "-skip_frame", "nokey", "-i", src, "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise ProbeError(str(e))
+    out = proc.stderr
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", out)
+    video = re.search(r"Stream #\d+:\d+.*?: Video: (\w+)[^\n]*", out)
+    if proc.returncode != 0 or not duration or not video: raise ProbeError(out[-2000:])
+    h, m, sec = duration.groups()
+    keyframes = sorted({float(t) for t in re.findall(r"pts_time:\s*(-?\d+(?:\.\d+)?)", out)})
+    return {"version": PROBE_VERSION, "duration": int(h) * 3600 + int(m) * 60 + float(sec), "codec": video.group(1),
+            **parse_video_stream(video.group(0)), "keyframes": keyframes}
+
+
+def parse_video_stream(line: str) -> dict:
+    """Perfil, formato de pixel, varredura e base de tempo da linha `Stream ... Video:` do FFmpeg."""
+    fmt = re.search(r"Video: \w+(?: \(([^)]*)\))?(?: \([^)]*\))*, (\w+)(?:\(([^)]*)\))?", line)
+    tbn = re.search(r"([\d.]+)(k?) tbn", line)
+    flags = (fmt.group(3) or "") if fmt else ""
+    return {"profile": fmt.group(1) if fmt else None, "pix_fmt": fmt.group(2) if fmt else None,
+            "interlaced": any(order in flags for order in ("top first", "bottom first", "top coded first", "bottom coded first")),
+            "timescale": int(float(tbn.group(1)) * (1000 if tbn.group(2) else 1)) if tbn else None}
+
+
+def copy_profile(probe: dict) -> Optional[str]:
+    """Perfil do libx264 que reproduz a origem, ou None se segmentos copiados não podem ser intercalados com recodificados."""
+    if probe.get("version") != PROBE_VERSION or probe["codec"] != "h264" or probe["pix_fmt"] not in ("yuv420p", "yuvj420p"): return None
+    if probe["interlaced"]: return None
+    return _X264_PROFILES.get(probe["profile"])
+
+
+def plan_split_times(keyframes: List[float], duration: float, segment_s: float) -> List[float]:
+    """Escolhe keyframes a cada ~`segment_s` segundos como pontos de corte."""
+    times, next_target = [], segment_s
+    for kf in keyframes:
+        if kf >= next_target and duration - kf >= segment_s / 4:
+            times.append(kf)
+            next_target = kf + segment_s
+    return times
+
+
+def captions_for_range(captions: List[dict], start: float, end: float) -> List[dict]:
+    """Legendas que aparecem em [start, end), com tempos relativos ao início do segmento."""
+    selected = []
+    for c in captions:
+        try:
+            c_start, c_end = float(c["start"]), float(c["end"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if c_end <= start or c_start >= end or not str(c.get("text", "")).strip(): continue
+        selected.append({**c, "start": max(0.0, c_start - start), "end": min(end, c_end) - start})
+    return selected
+
+
+def subtitles_filter(srt_path: str, style: str = SUBTITLE_STYLE) -> str:
+    srt_escaped = srt_path.replace('\\', '/').replace(':', '\\:')
+    return f"subtitles='{srt_escaped}':force_style='{style}'"
+
+
+_split_locks = {}
+_split_locks_lock = threading.Lock()
+
+
+def split_segments(src: str, split_times: List[float], directory: str, run: Callable[..., None]) -> List[tuple]:
+    """Divide o vídeo (sem recodificar) e devolve [(caminho, início, fim)]; reaproveita uma divisão já feita em `directory`.
+
+    A divisão é gravada numa pasta temporária e publicada com um único rename, de modo que
+    outra renderização nunca vê (nem apaga) uma pasta em uso. Neste processo, renderizações
+    simultâneas da mesma divisão esperam a primeira em vez de repetir o trabalho.
+    """
+    seg_list = os.path.join(directory, "segments.csv")
+    with _split_locks_lock:
+        lock = _split_locks.setdefault(directory, threading.Lock())
+    with lock:
+        if not os.path.exists(seg_list):
+            staging = f"{directory}.{uuid.uuid4().hex}.tmp"
+            os.makedirs(staging)
+            try:
+                split_cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", src, "-map", "0:v:0", "-c", "copy", "-f", "segment",
+                             "-segment_format", "matroska", "-segment_list", os.path.join(staging, "segments.csv"),
+                             "-segment_list_type", "csv", "-reset_timestamps", "1"]
+                if split_times: split_cmd += ["-segment_times", ",".join(f"{t:.6f}" for t in split_times)]
+                run(split_cmd + ["-y", os.path.join(staging, "seg_%05d.mkv")], "Erro ao dividir o vídeo", timeout=600)
+                try:
+                    os.replace(staging, directory)
+                except OSError:
+                    # Outro processo publicou a mesma divisão primeiro: a dele vale e a nossa é descartada
+                    if not os.path.exists(seg_list): raise
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+    with open(seg_list, newline="") as f:
+        return [(os.path.join(directory, row[0]), float(row[1]), float(row[2])) for row in csv.reader(f) if row]
+
+
+def render_segmented(src: str, captions: List[dict], output: str, workdir: str, write_srt: Callable[[List[dict], str], None],
+                     run: Callable[..., None], workers: int, preset: str, crf: int, segment_s: float,
+                     threads_per_worker: int = 0, probe: Optional[dict] = None, split_root: Optional[str] = None,
+                     segment_cache: Optional[SegmentCache] = None, source_id: str = "", style: str = SUBTITLE_STYLE,
+                     on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Renderiza `captions` em `src` e grava `output`; devolve estatísticas dos segmentos.
+
+    `run(cmd, error_msg, timeout=..., encode=..., duration=..., on_progress=...)` executa o FFmpeg (e levanta erro
+    em falha); `write_srt` gera o .srt. Com `split_root` a divisão em keyframes é guardada e reaproveitada; com
+    `segment_cache` (e o `source_id` da mídia) os segmentos recodificados também são, e só os segmentos alterados
+    passam pelo libx264. `on_progress` recebe o progresso somado de todos os segmentos em recodificação.
+    """
+    probe = probe or probe_keyframes(src)
+    duration = probe["duration"]
+    segment_s = max(10.0, min(segment_s, duration / max(1, workers)))
+    split_times = plan_split_times(probe["keyframes"], duration, segment_s)
+    profile = copy_profile(probe)
+    can_copy = profile is not None
+
+    plan_id = hashlib.sha256(json.dumps(split_times).encode()).hexdigest()[:16]
+    split_dir = os.path.join(split_root, f"segments-{plan_id}") if split_root else os.path.join(workdir, "segments")
+    segments = split_segments(src, split_times, split_dir, run)
+
+    # Decide antes de recodificar o que é copiado, o que vem do cache e o que precisa do libx264
+    parts, pending, reused = [None] * len(segments), [], 0
+    for index, (path, start, end) in enumerate(segments):
+        # O último segmento vai até o fim, mesmo que a lista informe um fim menor por arredondamento
+        selected = captions_for_range(captions, start, end if index < len(segments) - 1 else float("inf"))
+        if not selected and can_copy:
+            parts[index] = path
+            continue
+        key = segment_key(source_id, start, end, selected, style, preset, crf, profile) if segment_cache and source_id else None
+        if key and (cached := segment_cache.get(key)):
+            parts[index] = cached
+            reused += 1
+            continue
+        pending.append((index, path, end - start, selected, key))
+
+    total_s = sum(seconds for _, _, seconds, _, _ in pending) or 1.0
+    done_s, fps, finished, progress_lock = {}, {}, set(), threading.Lock()
+
+    def segment_progress(index: int, seconds: float, p: dict):
+        with progress_lock:
+            done_s[index] = seconds if p["done"] else min(seconds, p["out_time"] or 0.0)
+            fps[index] = 0.0 if p["done"] else (p["fps"] or 0.0)
+            if p["done"]: finished.add(index)
+            event = {"percent": round(min(100.0, 100 * sum(done_s.values()) / total_s), 1), "fps": round(sum(fps.values()), 1),
+                     "segments_done": len(finished), "segments_total": len(pending)}
+        on_progress(event)
+
+    def render_one(index: int, path: str, seconds: float, selected: List[dict], key: Optional[str]) -> str:
+        srt_path = os.path.join(workdir, f"seg_{index:05d}.srt")
+        write_srt(selected, srt_path)
+        encoded = os.path.join(workdir, f"enc_{index:05d}.mkv")
+        vf = subtitles_filter(srt_path, style) if selected else "null"
+        # SPS/PPS em cada keyframe e o mesmo perfil da origem: o segmento pode ficar entre segmentos copiados
+        match = ["-profile:v", profile] if profile else []
+        run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path, "-vf", vf, "-an", "-c:v", "libx264", "-preset", preset,
+             "-crf", str(crf), "-pix_fmt", "yuv420p", *match, "-x264-params", "repeat-headers=1", "-threads", str(threads_per_worker),
+             "-f", "matroska", "-y", encoded],
+            "Erro ao renderizar vídeo", timeout=600, encode=True, duration=seconds,
+            on_progress=(lambda p: segment_progress(index, seconds, p)) if on_progress else None)
+        return segment_cache.put(key, encoded) if key else encoded
+
+    if pending:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (index, *_), part in zip(pending, pool.map(lambda args: render_one(*args), pending)): parts[index] = part
+
+    concat_list = os.path.join(workdir, "concat.txt")
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for part in parts: f.write(f"file '{part}'\n")
+    timescale = ["-video_track_timescale", str(probe["timescale"])] if probe.get("timescale") else []
+    run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0", "-auto_convert", "1", "-i", concat_list, "-i", src,
+         "-map", "0:v:0", "-map", "1:a?", "-c", "copy", *timescale, "-movflags", "+faststart", "-y", output],
+        "Erro ao concatenar o vídeo", timeout=600)
+    copied = sum(1 for part, seg in zip(parts, segments) if part == seg[0])
+    return {"segments": len(segments), "encoded": len(pending), "reused": reused, "copied": copied}
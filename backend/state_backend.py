@@ -0,0 +1,474 @@
+"""Estado compartilhado entre processos: eventos de cada sessão (status, segmentos, progresso) e o último
+estado de cada tarefa (status e resultado).
+
+Com vários workers do uvicorn (ou réplicas atrás de um balanceador), a requisição que consulta uma
+tarefa ou assina o SSE de uma sessão pode cair num processo diferente daquele que a executa. Os
+backends guardam esse estado fora do processo:
+
+- `SQLiteBackend` (padrão): um arquivo SQLite em modo WAL, para workers na mesma máquina; os
+  outros processos descobrem eventos novos por uma consulta leve a cada `poll_s`.
+- `RedisBackend`: qualquer servidor que fale o protocolo do Redis (RESP), para réplicas em máquinas
+  diferentes; eventos novos e pedidos de cancelamento chegam por PUBLISH/SUBSCRIBE.
+- `MemoryBackend`: o comportamento de um processo só, sem nada persistido.
+
+Cada evento recebe um número de sequência que cresce dentro da sessão; quem assina guarda o último
+número lido e pede só o que veio depois (`events_since`). No Redis e na memória a sequência é a
+posição do evento na sessão (1, 2, 3...); no SQLite é um contador global do arquivo, então os números
+de uma sessão crescem com saltos.
+"""
+import abc
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+EventCallback = Callable[[str], None]
+
+
+def is_terminal(event: dict) -> bool:
+    """Status final de uma sessão: concluído (10) ou erro/cancelado (0)."""
+    return event.get("type", "status") == "status" and event.get("stepId") in (0, 10)
+
+
+class StateBackend(abc.ABC):
+    name = "base"
+
+    def __init__(self, retention_s: float = 600, job_ttl_s: float = 3600):
+        self.retention_s = retention_s
+        self.job_ttl_s = job_ttl_s
+        self._on_events: Optional[EventCallback] = None
+        self._on_cancel: Optional[EventCallback] = None
+
+    @abc.abstractmethod
+    def append(self, session_id: str, event: dict) -> Optional[int]:
+        """Grava o evento e devolve seu número de sequência na sessão (None se a gravação ficou para depois)."""
+
+    @abc.abstractmethod
+    def events_since(self, session_id: str, after: int = 0) -> List[Tuple[int, dict]]:
+        """Eventos com sequência maior que `after`; se a sessão foi reiniciada desde então, todos os atuais."""
+
+    @abc.abstractmethod
+    def reset(self, session_id: str):
+        """Descarta os eventos da sessão."""
+
+    @abc.abstractmethod
+    def put_job(self, job_id: str, record: dict):
+        """Grava o último estado da tarefa."""
+
+    @abc.abstractmethod
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Último estado gravado da tarefa, ou None."""
+
+    @abc.abstractmethod
+    def request_cancel(self, job_id: str):
+        """Pede ao processo dono da tarefa que a cancele."""
+
+    def listen(self, on_events: EventCallback, on_cancel: EventCallback):
+        """Passa a avisar `on_events(session_id)` sobre eventos gravados por outros processos e
+        `on_cancel(job_id)` sobre pedidos de cancelamento; os avisos podem vir de outra thread."""
+        self._on_events, self._on_cancel = on_events, on_cancel
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class MemoryBackend(StateBackend):
+    """Estado só deste processo (um único worker)."""
+    name = "memory"
+
+    def __init__(self, retention_s: float = 600, job_ttl_s: float = 3600, max_events: int = 10000):
+        super().__init__(retention_s, job_ttl_s)
+        self.max_events = max_events
+        self._sessions: Dict[str, Tuple[float, list]] = {}
+        self._jobs: Dict[str, Tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def append(self, session_id, event):
+        with self._lock:
+            self._prune()
+            _, events = self._sessions.get(session_id, (0, []))
+            if len(events) < self.max_events or is_terminal(event): events.append(event)
+            self._sessions[session_id] = (time.time(), events)
+            return len(events)
+
+    def events_since(self, session_id, after=0):
+        with self._lock:
+            _, events = self._sessions.get(session_id, (0, []))
+            if after > len(events): after = 0
+            return [(i + 1, e) for i, e in enumerate(events[after:], start=after)]
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def put_job(self, job_id, record):
+        with self._lock:
+            self._jobs[job_id] = (time.time(), record)
+
+    def get_job(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            return entry[1] if entry else None
+
+    def request_cancel(self, job_id):
+        if self._on_cancel: self._on_cancel(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "sessions": len(self._sessions), "jobs": len(self._jobs)}
+
+    def _prune(self):
+        now = time.time()
+        for sid in [s for s, (t, _) in self._sessions.items() if now - t > self.retention_s]: del self._sessions[sid]
+        for jid in [j for j, (t, _) in self._jobs.items() if now - t > self.job_ttl_s]: del self._jobs[jid]
+
+
+class SQLiteBackend(StateBackend):
+    """Estado num arquivo SQLite (WAL) compartilhado pelos workers da mesma máquina.
+
+    As escritas vão para uma fila e são gravadas por uma thread própria, em lotes (uma transação
+    por lote): quem publica, inclusive o loop de eventos, não espera pelo disco nem pela trava de
+    escrita dos outros processos. As leituras deste processo esperam as escritas já enfileiradas.
+
+    Não use em sistemas de arquivos de rede: o WAL depende de memória compartilhada local.
+    """
+    WRITE_BATCH = 256
+    name = "sqlite"
+
+    def __init__(self, path: str, retention_s: float = 600, job_ttl_s: float = 3600, poll_s: float = 0.2):
+        super().__init__(retention_s, job_ttl_s)
+        self.path = path
+        self.poll_s = poll_s
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._writes: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._written = threading.Condition()
+        self._queued = self._done = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+                                               created_at REAL NOT NULL, payload TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS events_session ON events (session_id, seq);
+            CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, payload TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS cancels (id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, created_at REAL NOT NULL);
+        """)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="state-sqlite-writer")
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Uma conexão por thread (em autocommit); o WAL permite leituras durante as escritas de outros processos."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql: str, params: tuple):
+        with self._written:
+            self._queued += 1
+        self._writes.put((sql, params))
+
+    def flush(self, timeout: float = 10):
+        """Espera a gravação de tudo o que foi enfileirado até agora."""
+        with self._written:
+            target = self._queued
+            self._written.wait_for(lambda: self._done >= target, timeout)
+
+    def _write_loop(self):
+        conn = self._conn()
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < self.WRITE_BATCH:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [w for w in batch if w is not None]
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for sql, params in writes: conn.execute(sql, params)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            except Exception as e:
+                logger.warning(f"Falha ao gravar o estado compartilhado ({len(writes)} escritas descartadas): {e}")
+            with self._written:
+                self._done += len(writes)
+                self._written.notify_all()
+            if len(writes) < len(batch): return  # None: close()
+
+    def append(self, session_id, event):
+        # A sequência só existe depois da gravação; quem assina a descobre por events_since
+        self._write("INSERT INTO events (session_id, created_at, payload) VALUES (?, ?, ?)",
+                    (session_id, time.time(), json.dumps(event, ensure_ascii=False, default=str)))
+
+    def events_since(self, session_id, after=0):
+        # A sequência é global (AUTOINCREMENT nunca reutiliza valores), então um reset não confunde quem já assinava
+        self.flush()
+        rows = self._conn().execute("SELECT seq, payload FROM events WHERE session_id = ? AND seq > ? ORDER BY seq",
+                                    (session_id, after)).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def reset(self, session_id):
+        self._write("DELETE FROM events WHERE session_id = ?", (session_id,))
+
+    def put_job(self, job_id, record):
+        self._write("INSERT OR REPLACE INTO jobs (job_id, updated_at, payload) VALUES (?, ?, ?)",
+                    (job_id, time.time(), json.dumps(record, ensure_ascii=False, default=str)))
+
+    def get_job(self, job_id):
+        self.flush()
+        row = self._conn().execute("SELECT payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def request_cancel(self, job_id):
+        self._write("INSERT INTO cancels (job_id, created_at) VALUES (?, ?)", (job_id, time.time()))
+
+    def listen(self, on_events, on_cancel):
+        super().listen(on_events, on_cancel)
+        if self._thread: return
+        self._thread = threading.Thread(target=self._poll, daemon=True, name="state-sqlite")
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._writes.put(None)  # Grava o que ainda está na fila e encerra a thread de escrita
+        self._writer.join(timeout=5)
+        if self._thread: self._thread.join(timeout=2)
+
+    def stats(self):
+        self.flush()
+        conn = self._conn()
+        return {"backend": self.name, "path": self.path, "events": conn.execute("SELECT COUNT(*) FROM events").fetchone()[0],
+                "jobs": conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]}
+
+    def _poll(self):
+        conn = self._conn()
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+        last_cancel = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cancels").fetchone()[0]
+        next_prune = 0.0
+        while not self._stop.wait(self.poll_s):
+            try:
+                rows = conn.execute("SELECT session_id, MAX(seq) FROM events WHERE seq > ? GROUP BY session_id", (last_seq,)).fetchall()
+                for session_id, seq in rows:
+                    last_seq = max(last_seq, seq)
+                    self._on_events(session_id)
+                for cancel_id, job_id in conn.execute("SELECT id, job_id FROM cancels WHERE id > ? ORDER BY id", (last_cancel,)).fetchall():
+                    last_cancel = cancel_id
+                    self._on_cancel(job_id)
+                if time.monotonic() > next_prune:
+                    now = time.time()
+                    conn.execute("DELETE FROM events WHERE created_at < ?", (now - self.retention_s,))
+                    conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.job_ttl_s,))
+                    conn.execute("DELETE FROM cancels WHERE created_at < ?", (now - self.job_ttl_s,))
+                    next_prune = time.monotonic() + 60
+            except Exception as e:
+                logger.warning(f"Falha ao consultar o estado compartilhado: {e}")
+
+
+class RespError(Exception):
+    """Resposta de erro do servidor (-ERR ...)."""
+
+
+class RespConnection:
+    """Cliente mínimo do protocolo do Redis (RESP2): comandos, pipeline e leitura de mensagens de pub/sub."""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: Optional[float] = 5):
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+
+    def connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if self.password: self.execute("AUTH", self.password)
+        if self.db: self.execute("SELECT", self.db)
+
+    def close(self):
+        sock, self._sock, self._file = self._sock, None, None  # Pode ser chamado de outra thread, durante uma leitura
+        if sock is None: return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def read_reply(self):
+        line = self._file.readline()
+        if not line: raise ConnectionError("Conexão encerrada pelo servidor")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+": return rest.decode()
+        if kind == b"-": raise RespError(rest.decode())
+        if kind == b":": return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0: return None
+            data = self._file.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self.read_reply() for _ in range(size)]
+        raise ConnectionError(f"Resposta RESP inválida: {line[:40]!r}")
+
+    def send(self, *commands):
+        if self._sock is None: self.connect()
+        self._sock.sendall(b"".join(self._encode(c) for c in commands))
+
+    def execute(self, *args):
+        self.send(args)
+        return self.read_reply()
+
+    def pipeline(self, *commands) -> list:
+        """Envia vários comandos de uma vez e lê as respostas na mesma ordem (um único ida-e-volta)."""
+        self.send(*commands)
+        replies, error = [], None
+        for _ in commands:
+            try:
+                replies.append(self.read_reply())
+            except RespError as e:
+                replies.append(None)
+                error = error or e
+        if error: raise error
+        return replies
+
+
+class RedisBackend(StateBackend):
+    """Estado num servidor compatível com o Redis, compartilhado por réplicas em máquinas diferentes.
+
+    Eventos de cada sessão ficam numa lista (`<prefixo>events:<sessão>`), tarefas em chaves com
+    expiração, e cada evento novo é anunciado no canal `<prefixo>events`. Usa só comandos básicos
+    (RPUSH, LRANGE, LLEN, EXPIRE, SET, GET, DEL, PUBLISH, SUBSCRIBE), disponíveis também em
+    servidores compatíveis e em substitutos locais para testes.
+    """
+    name = "redis"
+
+    def __init__(self, url: str, retention_s: float = 600, job_ttl_s: float = 3600, prefix: str = "noxsub:"):
+        super().__init__(retention_s, job_ttl_s)
+        parsed = urlparse(url)
+        if parsed.scheme != "redis": raise ValueError(f"URL do Redis não suportada: {url}")
+        self.url = url
+        self._params = dict(host=parsed.hostname or "localhost", port=parsed.port or 6379,
+                            db=int(parsed.path.strip("/") or 0), password=parsed.password)
+        self.prefix = prefix
+        self._conn = RespConnection(**self._params)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._subscriber: Optional[RespConnection] = None
+        self._thread: Optional[threading.Thread] = None
+        self._call("PING")  # Falha já na inicialização se o servidor estiver inacessível
+
+    def _call(self, *commands, pipeline: bool = False):
+        """Executa com uma reconexão em caso de queda (a conexão é compartilhada entre threads, sob trava)."""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    return self._conn.pipeline(*commands) if pipeline else self._conn.execute(*commands)
+                except (OSError, ConnectionError):
+                    self._conn.close()
+                    if attempt == 2: raise
+
+    def _events_key(self, session_id: str) -> str:
+        return f"{self.prefix}events:{session_id}"
+
+    def append(self, session_id, event):
+        key = self._events_key(session_id)
+        length, _, _ = self._call(("RPUSH", key, json.dumps(event, ensure_ascii=False, default=str)),
+                                  ("EXPIRE", key, int(self.retention_s)),
+                                  ("PUBLISH", f"{self.prefix}events", session_id), pipeline=True)
+        return length
+
+    def events_since(self, session_id, after=0):
+        key = self._events_key(session_id)
+        length, items = self._call(("LLEN", key), ("LRANGE", key, after, -1), pipeline=True)
+        if length < after:  # Sessão reiniciada (ou expirada) depois da última leitura
+            after, items = 0, self._call("LRANGE", key, 0, -1)
+        return [(after + i + 1, json.loads(item)) for i, item in enumerate(items or [])]
+
+    def reset(self, session_id):
+        self._call("DEL", self._events_key(session_id))
+
+    def put_job(self, job_id, record):
+        self._call("SET", f"{self.prefix}job:{job_id}", json.dumps(record, ensure_ascii=False, default=str), "EX", int(self.job_ttl_s))
+
+    def get_job(self, job_id):
+        data = self._call("GET", f"{self.prefix}job:{job_id}")
+        return json.loads(data) if data else None
+
+    def request_cancel(self, job_id):
+        self._call("PUBLISH", f"{self.prefix}cancel", job_id)
+
+    def listen(self, on_events, on_cancel):
+        super().listen(on_events, on_cancel)
+        if self._thread: return
+        self._thread = threading.Thread(target=self._subscribe_loop, daemon=True, name="state-redis")
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        subscriber = self._subscriber
+        if subscriber: subscriber.close()  # Desbloqueia a leitura da thread de assinatura
+        with self._lock:
+            self._conn.close()
+        if self._thread: self._thread.join(timeout=2)
+
+    def stats(self):
+        return {"backend": self.name, "url": f"redis://{self._params['host']}:{self._params['port']}/{self._params['db']}",
+                "listening": bool(self._subscriber)}
+
+    def _subscribe_loop(self):
+        events_channel, cancel_channel = f"{self.prefix}events".encode(), f"{self.prefix}cancel".encode()
+        backoff = 0.5
+        while not self._stop.is_set():
+            try:
+                self._subscriber = RespConnection(**self._params, timeout=None)
+                self._subscriber.execute("SUBSCRIBE", events_channel, cancel_channel)
+                self._subscriber.read_reply()  # Confirmação do segundo canal
+                backoff = 0.5
+                while True:
+                    message = self._subscriber.read_reply()
+                    if not isinstance(message, list) or len(message) != 3 or message[0] != b"message": continue
+                    target = message[2].decode()
+                    if message[1] == events_channel: self._on_events(target)
+                    elif message[1] == cancel_channel: self._on_cancel(target)
+            except Exception as e:
+                if self._stop.is_set(): break
+                logger.warning(f"Assinatura do estado compartilhado interrompida ({e}); reconectando em {backoff:.1f}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 10)
+            finally:
+                subscriber, self._subscriber = self._subscriber, None
+                if subscriber: subscriber.close()
+
+
+def create_backend(spec: str, sqlite_path: str, redis_url: str, retention_s: float = 600, job_ttl_s: float = 3600) -> StateBackend:
+    """Backend escolhido por nome: `sqlite` (padrão), `redis` ou `memory`."""
+    spec = (spec or "sqlite").lower()
+    if spec == "sqlite": return SQLiteBackend(sqlite_path, retention_s, job_ttl_s)
+    if spec == "redis": return RedisBackend(redis_url, retention_s, job_ttl_s)
+    if spec == "memory": return MemoryBackend(retention_s, job_ttl_s)
+    raise ValueError(f"STATE_BACKEND desconhecido: {spec}")
@@ -0,0 +1,107 @@
+"""Canal de eventos por sessão (status e segmentos) com entrega imediata aos assinantes SSE.
+
+Os eventos ficam num `StateBackend` (ver state_backend.py), de modo que o SSE de uma sessão
+pode ser assinado em qualquer worker, não só naquele que executa a tarefa. `publish` pode ser
+chamado de qualquer thread; assinantes deste processo são acordados na hora, e os de outros
+processos quando o backend anuncia o evento (pub/sub do Redis ou consulta periódica do SQLite).
+"""
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from state_backend import MemoryBackend, StateBackend, is_terminal
+
+__all__ = ["StatusBroker", "is_terminal"]
+
+
+def compact_progress(events: List[Tuple[int, dict]]) -> List[Tuple[int, dict]]:
+    """Descarta eventos de progresso superados por outro mais novo da mesma etapa: de um histórico, só o último valor interessa."""
+    last = {}
+    for i, (_, event) in enumerate(events):
+        if event.get("type") == "progress": last[event.get("stage")] = i
+    return [item for i, item in enumerate(events) if item[1].get("type") != "progress" or last[item[1].get("stage")] == i]
+
+
+class StatusBroker:
+    """Guarda o histórico de eventos de cada sessão para que assinantes tardios recebam tudo desde o início."""
+
+    def __init__(self, backend: Optional[StateBackend] = None, progress_interval_s: float = 0.25):
+        self.backend = backend or MemoryBackend()
+        self.progress_interval_s = progress_interval_s
+        self._subscribers: Dict[str, set] = {}
+        self._last_progress: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def start(self, on_cancel: Callable[[str], None]):
+        """Passa a receber eventos e pedidos de cancelamento vindos de outros processos."""
+        self.backend.listen(self.notify, on_cancel)
+
+    def close(self):
+        self.backend.close()
+
+    def publish(self, session_id: str, event: dict):
+        if event.get("type") == "progress" and not self._progress_due(session_id, event): return
+        if is_terminal(event):
+            with self._lock:
+                for key in [k for k in self._last_progress if k[0] == session_id]: del self._last_progress[key]
+        self.backend.append(session_id, event)
+        self.notify(session_id)
+
+    def _progress_due(self, session_id: str, event: dict) -> bool:
+        """Limita o progresso de cada etapa a um evento por `progress_interval_s` (o último, 100%, sempre passa)."""
+        if event.get("done") or event.get("percent") == 100: return True
+        key, now = (session_id, event.get("stage")), time.monotonic()
+        with self._lock:
+            if now - self._last_progress.get(key, 0.0) < self.progress_interval_s: return False
+            self._last_progress[key] = now
+        return True
+
+    def notify(self, session_id: str):
+        """Acorda os assinantes da sessão neste processo (chamado de qualquer thread)."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, ()))
+        for loop, wake in subscribers:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass  # Loop do assinante já foi encerrado
+
+    def reset(self, session_id: str):
+        """Descarta o histórico ao reutilizar um session_id numa nova tarefa."""
+        self.backend.reset(session_id)
+
+    def latest(self, session_id: str, event_type: str = "status") -> Optional[dict]:
+        events = [e for e in self.events(session_id) if e.get("type", "status") == event_type]
+        return events[-1] if events else None
+
+    def events(self, session_id: str) -> list:
+        return [event for _, event in compact_progress(self.backend.events_since(session_id, 0))]
+
+    async def subscribe(self, session_id: str, heartbeat_s: float = 15) -> AsyncIterator[Optional[dict]]:
+        """Gera o histórico e depois cada novo evento até o status final; None sinaliza heartbeat."""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        entry = (loop, wake)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(entry)
+        try:
+            after, replay = 0, True
+            while True:
+                wake.clear()  # Antes da leitura: um evento gravado durante ela volta a acordar o assinante
+                batch = await loop.run_in_executor(None, self.backend.events_since, session_id, after)
+                if replay: batch, replay = compact_progress(batch), False
+                for seq, event in batch:
+                    after = seq
+                    yield event
+                    if is_terminal(event): return
+                try:
+                    await asyncio.wait_for(wake.wait(), heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(session_id)
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers: del self._subscribers[session_id]
@@ -0,0 +1,50 @@
+"""Testes da escolha de configuração da calibração (python -m pytest -q)."""
+from calibration import choose, thread_options, workers_for
+
+MODELS = ["tiny", "base", "small", "medium"]
+
+
+def measurement(model, threads, rtf, rss_mb=500):
+    return {"model": model, "threads": threads, "rtf": rtf, "load_s": 1.0, "rss_mb": rss_mb}
+
+
+def test_workers_split_the_cores():
+    assert workers_for(2, 500, 8, 4000) == 4
+    assert workers_for(8, 500, 8, 4000) == 1
+    assert workers_for(16, 500, 8, 4000) == 1
+    assert workers_for(0, 500, 8, 4000) == 4  # GPU: sem threads de CPU
+
+
+def test_workers_share_one_model_in_memory():
+    # Quatro workers com um modelo de 1500 MB cabem em 2000 MB: os pesos são de uma instância só
+    assert workers_for(2, 1500, 8, 2000) == 4
+    assert workers_for(2, 2500, 8, 2000) == 1
+
+
+def test_choose_prefers_the_largest_model_within_target():
+    measurements = [measurement("tiny", 2, 0.05), measurement("base", 2, 0.2), measurement("small", 2, 0.45), measurement("medium", 2, 0.9)]
+    selected = choose(measurements, MODELS, 0.5, 4000, 8)
+    assert (selected["model"], selected["hardware_tier"], selected["meets_target"]) == ("small", "high", True)
+
+
+def test_choose_picks_the_threads_with_most_throughput():
+    measurements = [measurement("small", 1, 0.4), measurement("small", 2, 0.25), measurement("small", 8, 0.1)]
+    selected = choose(measurements, MODELS, 0.5, 4000, 8)
+    # 8 workers / 0.4 = 20, 4 / 0.25 = 16, 1 / 0.1 = 10
+    assert (selected["cpu_threads"], selected["workers"], selected["throughput"]) == (1, 8, 20.0)
+
+
+def test_choose_skips_models_over_budget():
+    measurements = [measurement("base", 2, 0.2, rss_mb=300), measurement("small", 2, 0.3, rss_mb=900)]
+    assert choose(measurements, MODELS, 0.5, 600, 8)["model"] == "base"
+
+
+def test_choose_falls_back_to_the_fastest_when_none_meets_target():
+    measurements = [measurement("tiny", 1, 0.9), measurement("tiny", 4, 0.7), measurement("base", 4, 1.5)]
+    selected = choose(measurements, MODELS, 0.5, 4000, 8)
+    assert (selected["model"], selected["cpu_threads"], selected["meets_target"]) == ("tiny", 4, False)
+
+
+def test_thread_options():
+    assert thread_options(8) == [1, 2, 4, 8]
+    assert thread_options(6) == [1, 2, 3, 4, 6]
@@ -0,0 +1,49 @@
+"""Testes da divisão e junção de trechos da mídia longa (python -m pytest -q)."""
+import numpy as np
+
+import chunked_transcription
+from chunked_transcription import SAMPLE_RATE, merge_chunks, plan_chunks
+
+
+def seconds(chunks):
+    return [(a / SAMPLE_RATE, b / SAMPLE_RATE) for a, b in chunks]
+
+
+def test_short_audio_is_a_single_chunk():
+    audio = np.zeros(SAMPLE_RATE * 10, dtype=np.float32)
+    assert plan_chunks(audio, 30) == [(0, len(audio))]
+
+
+def test_cuts_in_the_middle_of_silences(monkeypatch):
+    speech = [(0, 18), (22, 45), (50, 100)]
+    monkeypatch.setattr(chunked_transcription, "_speech_spans",
+                        lambda audio: [{"start": s * SAMPLE_RATE, "end": e * SAMPLE_RATE} for s, e in speech])
+    chunks = seconds(plan_chunks(np.zeros(SAMPLE_RATE * 100, dtype=np.float32), 40))
+    assert chunks[:2] == [(0, 20), (20, 47.5)]
+    assert chunks[-1][1] == 100
+    assert all(b - a <= 40 for a, b in chunks)
+    assert all(a == prev_b for (_, prev_b), (a, _) in zip(chunks, chunks[1:]))
+
+
+def test_falls_back_to_the_quietest_point(monkeypatch):
+    monkeypatch.setattr(chunked_transcription, "_speech_spans", lambda audio: [])
+    audio = np.random.RandomState(0).randn(SAMPLE_RATE * 60).astype(np.float32)
+    audio[SAMPLE_RATE * 30:SAMPLE_RATE * 31] = 0  # Único silêncio dentro da janela [20 s, 40 s]
+    cut = seconds(plan_chunks(audio, 40))[0][1]
+    assert 30 <= cut <= 31
+
+
+def test_merge_offsets_ids_and_drops_boundary_repeats():
+    chunks = [
+        [(0.0, 2.0, "primeira", [(0.0, 2.0, " primeira", 0.9)]), (2.0, 29.8, "repetida", [])],
+        [(29.5, 31.0, "repetida", []), (31.0, 33.0, "", []), (33.0, 35.0, "segunda", [(33.0, 35.0, " segunda", 0.8)])],
+    ]
+    words = []
+    captions = merge_chunks(chunks, words)
+    assert [(c["id"], c["text"]) for c in captions] == [(1, "primeira"), (2, "repetida"), (3, "segunda")]
+    assert words == [[(0.0, 2.0, " primeira", 0.9)], [], [(33.0, 35.0, " segunda", 0.8)]]
+
+
+def test_merge_keeps_times_monotonic():
+    captions = merge_chunks([[(10.0, 12.0, "a", [])], [(9.5, 9.0, "b", [])]])
+    assert captions[1]["start"] == 10.0 and captions[1]["end"] == 10.0
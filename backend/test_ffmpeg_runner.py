@@ -0,0 +1,31 @@
+"""Testes da leitura de progresso do FFmpeg (python -m pytest -q)."""
+from ffmpeg_runner import parse_progress
+
+
+def test_progress_in_the_middle():
+    block = {"frame": "250", "fps": "61.5", "out_time_us": "10000000", "speed": "2.46x", "progress": "continue"}
+    assert parse_progress(block, 40.0) == {"out_time": 10.0, "percent": 25.0, "fps": 61.5, "speed": 2.46, "done": False}
+
+
+def test_out_time_ms_is_also_microseconds():
+    assert parse_progress({"out_time_ms": "5000000"}, 10.0)["out_time"] == 5.0
+
+
+def test_end_is_always_100_percent():
+    progress = parse_progress({"out_time_us": "9000000", "progress": "end"}, 10.0)
+    assert progress["percent"] == 100.0 and progress["done"]
+
+
+def test_unknown_values_and_duration():
+    block = {"fps": "N/A", "out_time_us": "N/A", "speed": "N/A", "progress": "continue"}
+    assert parse_progress(block, 10.0) == {"out_time": None, "percent": None, "fps": None, "speed": None, "done": False}
+    assert parse_progress({"out_time_us": "3000000"}, None)["percent"] is None
+
+
+def test_negative_and_overshooting_times_are_clamped():
+    assert parse_progress({"out_time_us": "-23219"}, 10.0)["out_time"] == 0.0
+    assert parse_progress({"out_time_us": "12000000"}, 10.0)["percent"] == 100.0
+
+
+def test_garbage_is_ignored():
+    assert parse_progress({"out_time_us": "x", "fps": "?", "speed": "fast"}, 10.0)["out_time"] is None
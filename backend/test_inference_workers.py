@@ -0,0 +1,122 @@
+"""Testes do pool de processos de inferência, com o motor simulado do loadtest (python -m pytest -q)."""
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from inference_workers import InferencePool, InferenceWorkerError
+from job_queue import JobCancelled
+
+ENGINE = "loadtest:FakeWhisperModel"
+
+
+def audio(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * 16000), dtype=np.float32)
+
+
+def wait_for(condition, timeout_s: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if condition(): return True
+        time.sleep(0.05)
+    return condition()
+
+
+def statuses(pool):
+    return [w["status"] for w in pool.stats()["workers"]]
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    """Pools com o motor simulado: segmentos de 0,2 s de áudio decodificados em tempo real (os workers herdam o ambiente)."""
+    monkeypatch.setenv("LOADTEST_LOAD_S", "0")
+    monkeypatch.setenv("LOADTEST_RTF", "1")
+    monkeypatch.setenv("LOADTEST_SEGMENT_S", "0.2")
+    pools = []
+
+    def make(size=1, preload=(), rss_limit_bytes=0, engine=ENGINE, **kwargs):
+        pool = InferencePool(size, engine, 1 << 30, rss_limit_bytes, cancel_grace_s=2, start_timeout_s=30, **kwargs)
+        pools.append(pool)
+        started = pool.start({}, preload)
+        return pool, started
+    yield make
+    for pool in pools: pool.close()
+
+
+def test_transcribes_in_a_worker(make_pool):
+    pool, started = make_pool()
+    assert started
+    segments, info = pool.model("tiny").transcribe(audio(0.6), language="pt")
+    assert info.duration == pytest.approx(0.6)
+    assert [s.text for s in segments] == [" Legenda simulada 1", " Legenda simulada 2", " Legenda simulada 3"]
+    assert statuses(pool) == ["idle"] and pool.stats()["workers"][0]["models"] == ["tiny"]
+
+
+def test_warm_worker_is_preferred(make_pool):
+    pool, _ = make_pool(size=2, preload=["tiny"])
+    list(pool.model("tiny").transcribe(audio(0.2), language="pt")[0])
+    assert (pool.routed_hits, pool.routed_misses) == (1, 0)
+
+
+def test_concurrent_requests_wait_for_the_worker_loading_the_model(make_pool, monkeypatch):
+    monkeypatch.setenv("LOADTEST_LOAD_S", "0.5")
+    pool, _ = make_pool(size=2)
+    threads = [threading.Thread(target=lambda: list(pool.model("tiny").transcribe(audio(0.2), language="pt")[0])) for _ in range(2)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert (pool.routed_hits, pool.routed_misses) == (1, 1)
+    assert sorted(len(w["models"]) for w in pool.stats()["workers"]) == [0, 1]  # Uma cópia só do modelo
+
+
+def test_killed_worker_raises_and_is_replaced(make_pool):
+    pool, _ = make_pool()
+    segments, _ = pool.model("tiny").transcribe(audio(10), language="pt")
+    next(segments)
+    os.kill(pool.stats()["workers"][0]["pid"], signal.SIGKILL)
+    with pytest.raises(InferenceWorkerError):
+        list(segments)
+    assert (pool.crashes, pool.restarts) == (1, 1)
+    assert wait_for(lambda: statuses(pool) == ["idle"])
+    assert len(list(pool.model("tiny").transcribe(audio(0.2), language="pt")[0])) == 1
+
+
+def test_worker_over_rss_limit_is_recycled(make_pool):
+    pool, _ = make_pool(rss_limit_bytes=1)
+    pid = pool.stats()["workers"][0]["pid"]
+    list(pool.model("tiny").transcribe(audio(0.2), language="pt")[0])
+    assert (pool.recycles, pool.restarts) == (1, 1)
+    assert wait_for(lambda: statuses(pool) == ["idle"])
+    worker = pool.stats()["workers"][0]
+    assert worker["pid"] != pid and worker["models"] == ["tiny"]  # Reiniciado já com os modelos que tinha
+
+
+def test_cancel_releases_the_worker(make_pool):
+    pool, _ = make_pool()
+    cancel = threading.Event()
+    segments, _ = pool.model("tiny", cancel).transcribe(audio(10), language="pt")
+    next(segments)
+    cancel.set()
+    with pytest.raises(JobCancelled):
+        list(segments)
+    assert statuses(pool) == ["idle"] and pool.restarts == 0  # Respondeu ao cancelamento: o mesmo processo continua
+    assert len(list(pool.model("tiny").transcribe(audio(0.2), language="pt")[0])) == 1
+
+
+def test_abandoned_generator_is_drained(make_pool):
+    pool, _ = make_pool()
+    segments, _ = pool.model("tiny").transcribe(audio(10), language="pt")
+    next(segments)
+    segments.close()
+    assert statuses(pool) == ["idle"] and pool.restarts == 0
+    assert len(list(pool.model("tiny").transcribe(audio(0.4), language="pt")[0])) == 2
+
+
+def test_worker_that_fails_to_start_is_retried(make_pool):
+    pool, started = make_pool(engine="modulo_inexistente:Motor", restart_backoff_s=0.1)
+    assert not started
+    assert wait_for(lambda: pool.restarts >= 2, 60)  # Continua tentando, com espera crescente
+    with pytest.raises(InferenceWorkerError):
+        pool.model("tiny").transcribe(audio(0.2), language="pt")
@@ -0,0 +1,100 @@
+"""Testes da fila de tarefas (python -m pytest -q)."""
+import asyncio
+import gc
+import threading
+import time
+import weakref
+
+import pytest
+
+from job_queue import JobCancelled, JobScheduler, QueueFullError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_higher_priority_runs_first_and_fifo_between_equals():
+    async def scenario():
+        scheduler = JobScheduler(slots=1, max_queue=10)
+        gate, order = threading.Event(), []
+        blocker = scheduler.submit(lambda job: gate.wait(5))
+        await asyncio.sleep(0.05)  # O único slot fica ocupado enquanto as demais entram na fila
+        jobs = [scheduler.submit(lambda job, name=name: order.append(name), priority=priority)
+                for name, priority in (("a", 0), ("b", 5), ("c", 0), ("d", 5))]
+        assert [scheduler.position(j) for j in jobs] == [3, 1, 4, 2]
+        gate.set()
+        await asyncio.gather(*(scheduler.wait(j) for j in [blocker, *jobs]))
+        await scheduler.stop()
+        return order
+    assert run(scenario()) == ["b", "d", "a", "c"]
+
+
+def test_queue_full_raises():
+    async def scenario():
+        scheduler = JobScheduler(slots=1, max_queue=1)
+        gate = threading.Event()
+        scheduler.submit(lambda job: gate.wait(5))
+        await asyncio.sleep(0.05)
+        scheduler.submit(lambda job: None)
+        with pytest.raises(QueueFullError):
+            scheduler.submit(lambda job: None)
+        gate.set()
+        await scheduler.stop()
+    run(scenario())
+
+
+def test_cancel_queued_and_running():
+    async def scenario():
+        scheduler = JobScheduler(slots=1, max_queue=10)
+
+        def long_task(job):
+            for _ in range(500):
+                job.check_cancelled()
+                time.sleep(0.01)
+        running = scheduler.submit(long_task)
+        queued = scheduler.submit(lambda job: "nunca")
+        await asyncio.sleep(0.05)
+        assert scheduler.cancel(queued.id).status == "cancelled"
+        scheduler.cancel(running.id)
+        for job in (queued, running):
+            with pytest.raises(JobCancelled):
+                await scheduler.wait(job)
+        assert running.status == "cancelled"
+        assert scheduler.cancel("inexistente") is None
+        await scheduler.stop()
+    run(scenario())
+
+
+def test_error_keeps_status_code():
+    class Rejected(Exception):
+        status_code, detail = 413, "Arquivo grande demais"
+
+    async def scenario():
+        scheduler = JobScheduler(slots=1, max_queue=10)
+        job = scheduler.submit(lambda job: (_ for _ in ()).throw(Rejected()))
+        with pytest.raises(Rejected):
+            await scheduler.wait(job)
+        await scheduler.stop()
+        return job
+    job = run(scenario())
+    assert (job.status, job.error, job.error_status) == ("error", "Arquivo grande demais", 413)
+
+
+def test_finished_job_releases_closure_and_is_pruned_on_get():
+    class Audio:
+        pass
+
+    async def scenario():
+        scheduler = JobScheduler(slots=1, max_queue=10, result_ttl_s=0)
+        audio = Audio()
+        ref = weakref.ref(audio)
+        job = scheduler.submit(lambda job, audio=audio: "ok")
+        del audio
+        assert await scheduler.wait(job) == "ok"
+        gc.collect()
+        assert ref() is None and job.fn is None
+        await asyncio.sleep(0.01)
+        assert scheduler.get(job.id) is None
+        await scheduler.stop()
+    run(scenario())
@@ -0,0 +1,156 @@
+"""Testes do armazenamento de mídias (python -m pytest -q)."""
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+from media_store import MediaStore, MediaStoreError
+
+
+def make_store(tmp_path, **kwargs):
+    options = {"ttl_s": 3600, "quota_bytes": 1 << 30, "max_file_size": 1 << 20, **kwargs}
+    return MediaStore(str(tmp_path / "media"), **options)
+
+
+def add(store, tmp_path, content: bytes, filename: str = "video.mp4") -> dict:
+    path = tmp_path / f"{hashlib.sha256(content).hexdigest()}.part"
+    path.write_bytes(content)
+    return store.add_file(str(path), filename)
+
+
+def upload(store, content: bytes, filename: str, sha256=None) -> dict:
+    created = store.create_upload(filename, len(content), sha256)
+    with store.open_chunk(created["upload_id"], 0) as f:
+        f.write(content)
+    return store.complete_upload(created["upload_id"])
+
+
+def test_known_hash_still_requires_the_bytes(tmp_path):
+    store = make_store(tmp_path)
+    asset = add(store, tmp_path, b"conteudo", "original.mp4")
+    created = store.create_upload("outro.mp4", 8, asset["asset_id"])
+    assert "upload_id" in created and "asset" not in created
+    with pytest.raises(MediaStoreError) as e:
+        store.complete_upload(created["upload_id"])
+    assert e.value.status_code == 409
+
+
+def test_dedup_after_upload_keeps_the_new_filename(tmp_path):
+    store = make_store(tmp_path)
+    first = add(store, tmp_path, b"conteudo", "original.mp4")
+    second = upload(store, b"conteudo", "outro.mp4", first["asset_id"])
+    assert second["asset_id"] == first["asset_id"] and second["filename"] == "outro.mp4"
+    assert store.stats()["assets"] == 1
+
+
+def test_wrong_hash_is_rejected(tmp_path):
+    store = make_store(tmp_path)
+    with pytest.raises(MediaStoreError) as e:
+        upload(store, b"conteudo", "video.mp4", "0" * 64)
+    assert e.value.status_code == 422
+
+
+def test_offset_and_concurrent_chunks_are_rejected(tmp_path):
+    store = make_store(tmp_path)
+    upload_id = store.create_upload("video.mp4", 6)["upload_id"]
+    with store.open_chunk(upload_id, 0) as f:
+        with pytest.raises(MediaStoreError) as concurrent:
+            with store.open_chunk(upload_id, 0):
+                pass
+        f.write(b"abc")
+    assert concurrent.value.status_code == 409
+    with pytest.raises(MediaStoreError):
+        with store.open_chunk(upload_id, 0):
+            pass
+    with store.open_chunk(upload_id, 3) as f:
+        f.write(b"def")
+    assert store.upload_status(upload_id)["offset"] == 6
+
+
+def test_parallel_puts_at_the_same_offset_append_once(tmp_path):
+    store = make_store(tmp_path)
+    upload_id = store.create_upload("video.mp4")["upload_id"]
+    barrier, outcomes = threading.Barrier(4), []
+
+    def put():
+        barrier.wait()
+        try:
+            with store.open_chunk(upload_id, 0) as f:
+                time.sleep(0.05)
+                f.write(b"x" * 10)
+            outcomes.append("ok")
+        except MediaStoreError:
+            outcomes.append("409")
+    threads = [threading.Thread(target=put) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert outcomes.count("ok") == 1
+    assert store.upload_status(upload_id)["offset"] == 10
+
+
+def test_cleanup_skips_pinned_assets(tmp_path):
+    store = make_store(tmp_path)
+    asset = add(store, tmp_path, b"em uso")
+    store.quota_bytes = 0
+    store.pin(asset["asset_id"])
+    assert store.cleanup()["removed"] == 0 and store.exists(asset["asset_id"])
+    with pytest.raises(MediaStoreError):
+        store.delete(asset["asset_id"])
+    store.unpin(asset["asset_id"])
+    assert store.cleanup()["removed"] == 1 and not store.exists(asset["asset_id"])
+
+
+def test_cleanup_removes_expired_assets(tmp_path):
+    store = make_store(tmp_path, ttl_s=60)
+    old, fresh = add(store, tmp_path, b"antigo"), add(store, tmp_path, b"novo")
+    meta_dir = os.path.dirname(old["path"])
+    meta = store._read_meta(meta_dir)
+    store._write_meta(meta_dir, {**meta, "last_access": time.time() - 120})
+    with store.pinned(fresh["asset_id"]):
+        assert store.cleanup()["removed"] == 1
+    assert not store.exists(old["asset_id"]) and store.exists(fresh["asset_id"])
+
+
+def test_new_asset_survives_the_cleanup_after_add(tmp_path):
+    store = make_store(tmp_path, quota_bytes=10)
+    old = add(store, tmp_path, b"antigo")
+    asset = add(store, tmp_path, b"novo-xx")  # Os dois não cabem: sai o antigo, nunca o recém-gravado
+    assert store.exists(asset["asset_id"]) and not store.exists(old["asset_id"])
+
+
+def test_add_file_hands_the_pin_to_the_caller(tmp_path):
+    store = make_store(tmp_path)
+    path = tmp_path / "novo.part"
+    path.write_bytes(b"fixado")
+    asset = store.add_file(str(path), "video.mp4", pin=True)
+    store.quota_bytes = 0
+    assert store.cleanup()["removed"] == 0
+    store.unpin(asset["asset_id"])
+    assert store.cleanup()["removed"] == 1
+
+
+def test_file_larger_than_quota_is_rejected(tmp_path):
+    store = make_store(tmp_path, quota_bytes=4)
+    with pytest.raises(MediaStoreError) as error:
+        add(store, tmp_path, b"grande demais")
+    assert error.value.status_code == 413
+    with pytest.raises(MediaStoreError):
+        store.create_upload("video.mp4", 5)
+
+
+def test_resumable_upload_in_progress_is_not_expired(tmp_path):
+    store = make_store(tmp_path, ttl_s=60)
+    created = store.create_upload("video.mp4", 20)
+    directory = os.path.join(store.uploads_dir, created["upload_id"])
+    old = time.time() - 120
+    os.utime(directory, (old, old))  # O diretório é antigo, mas o último pedaço acabou de chegar
+    with store.open_chunk(created["upload_id"], 0) as f:
+        f.write(b"0123456789")
+    store.cleanup()
+    assert store.upload_status(created["upload_id"])["offset"] == 10
+    part = os.path.join(directory, "data.part")
+    os.utime(part, (old, old))
+    store.cleanup()
+    assert not os.path.exists(directory)
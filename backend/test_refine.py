@@ -0,0 +1,51 @@
+"""Testes dos diffs do refinamento em duas passadas (python -m pytest -q)."""
+from refine import RefineAligner
+
+DRAFT = [{"id": 1, "start": 0.0, "end": 1.0, "text": "olá mundo"},
+         {"id": 2, "start": 2.0, "end": 3.0, "text": "tudo bom"},
+         {"id": 3, "start": 4.0, "end": 5.0, "text": "até logo"}]
+
+
+def test_unchanged_caption_emits_nothing():
+    aligner = RefineAligner(DRAFT)
+    assert aligner.feed([(0.0, 0.5, " olá", 0.9), (0.52, 1.02, " mundo", 0.9)], until=2.0) == []  # Dentro da tolerância
+    assert aligner.captions() == [{"id": 1, "start": 0.0, "end": 1.02, "text": "olá mundo"}]
+
+
+def test_update_is_emitted_once_the_next_caption_starts():
+    aligner = RefineAligner(DRAFT)
+    assert aligner.feed([(0.0, 0.5, " Olá,", 0.9)], until=0.5) == []  # Legenda 1 ainda pode receber palavras
+    ops = aligner.feed([(0.5, 1.2, " mundo!", 0.9), (2.0, 3.0, " tudo bom", 0.9)], until=3.0)
+    assert ops == [{"op": "update", "id": 1, "start": 0.0, "end": 1.2, "text": "Olá, mundo!"}]
+
+
+def test_time_change_beyond_tolerance_is_an_update():
+    aligner = RefineAligner(DRAFT)
+    ops = aligner.feed([(0.3, 1.0, " olá mundo", 0.9)], until=2.5)
+    assert ops == [{"op": "update", "id": 1, "start": 0.3, "end": 1.0, "text": "olá mundo"}]
+
+
+def test_caption_without_words_is_removed():
+    aligner = RefineAligner(DRAFT)
+    assert aligner.feed([(0.0, 1.0, " olá mundo", 0.9)], until=1.0) == []
+    assert aligner.feed([(4.0, 5.0, " até logo", 0.9)], until=5.0) == [{"op": "remove", "id": 2}]
+    assert aligner.finish() == []
+    assert [c["id"] for c in aligner.captions()] == [1, 3]
+
+
+def test_words_go_to_the_caption_of_their_midpoint():
+    aligner = RefineAligner(DRAFT)
+    ops = aligner.feed([(1.8, 2.4, " tudo", 0.9), (2.4, 3.0, " bem", 0.9), (3.9, 5.0, " até logo", 0.9)], until=5.0)
+    ops += aligner.finish()
+    assert {"op": "remove", "id": 1} in ops
+    assert {"op": "update", "id": 2, "start": 1.8, "end": 3.0, "text": "tudo bem"} in ops
+    assert [c["text"] for c in aligner.captions()] == ["tudo bem", "até logo"]
+
+
+def test_empty_draft_adds_captions_with_new_ids():
+    aligner = RefineAligner([])
+    ops = aligner.feed([(0.0, 0.5, " olá", 0.9), (0.5, 1.0, " mundo", 0.9)], until=1.0)
+    assert ops == [{"op": "add", "caption": {"id": 1, "start": 0.0, "end": 1.0, "text": "olá mundo"}}]
+    assert aligner.feed([(1.0, 1.5, " ", 0.9)], until=1.5) == []
+    assert aligner.finish() == []
+    assert aligner.captions() == [ops[0]["caption"]]
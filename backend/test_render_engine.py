@@ -0,0 +1,129 @@
+"""Testes da renderização por segmentos (python -m pytest -q); o teste de ponta a ponta precisa do FFmpeg com libx264 e libass."""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+import render_engine
+from render_engine import captions_for_range, copy_profile, parse_video_stream, plan_split_times, segment_key
+
+MAIN_STREAM = "Stream #0:0[0x1](und): Video: h264 (Main) (avc1 / 0x31637661), yuv420p(progressive), 320x240 [SAR 1:1 DAR 4:3], 25 fps, 25 tbr, 12800 tbn (default)"
+
+
+def probe_of(line: str, codec: str = "h264") -> dict:
+    return {"version": render_engine.PROBE_VERSION, "codec": codec, **parse_video_stream(line)}
+
+
+def test_parse_video_stream():
+    assert parse_video_stream(MAIN_STREAM) == {"profile": "Main", "pix_fmt": "yuv420p", "interlaced": False, "timescale": 12800}
+    info = parse_video_stream("Stream #0:0: Video: h264 (High 10), yuv420p10le(tv, bt709, top first), 1920x1080, 29.97 fps, 90k tbn")
+    assert info == {"profile": "High 10", "pix_fmt": "yuv420p10le", "interlaced": True, "timescale": 90000}
+
+
+def test_copy_profile_only_for_sources_libx264_can_match():
+    assert copy_profile(probe_of(MAIN_STREAM)) == "main"
+    assert copy_profile(probe_of(MAIN_STREAM.replace("(Main)", "(Constrained Baseline)"))) == "baseline"
+    assert copy_profile(probe_of(MAIN_STREAM.replace("(Main)", "(High 4:2:2)"))) is None
+    assert copy_profile(probe_of(MAIN_STREAM.replace("(progressive)", "(tv, top first)"))) is None
+    assert copy_profile(probe_of(MAIN_STREAM.replace("h264 (Main)", "vp9"), "vp9")) is None
+    assert copy_profile({**probe_of(MAIN_STREAM), "version": 1}) is None
+
+
+def test_plan_split_times():
+    keyframes = [float(t) for t in range(0, 100, 2)]
+    assert plan_split_times(keyframes, 100, 30) == [30, 60, 90]
+    assert plan_split_times(keyframes, 100, 45) == [46]
+    assert plan_split_times(keyframes, 100, 200) == []
+
+
+def test_captions_for_range_is_relative_and_clipped():
+    captions = [{"id": 1, "start": 5, "end": 12, "text": "a"}, {"id": 2, "start": 12, "end": 14, "text": " "},
+                {"id": 3, "start": 19, "end": 25, "text": "b"}, {"id": 4, "start": 25, "end": 30, "text": "c"}]
+    assert captions_for_range(captions, 10, 20) == [{"id": 1, "start": 0.0, "end": 2, "text": "a"}, {"id": 3, "start": 9, "end": 10, "text": "b"}]
+
+
+def test_segment_key_changes_only_with_what_the_segment_shows():
+    captions = [{"start": 1.0, "end": 2.0, "text": "olá"}]
+    key = segment_key("src", 0, 10, captions, "style", "fast", 23, "main")
+    assert key == segment_key("src", 0, 10, [{**captions[0], "id": 99}], "style", "fast", 23, "main")
+    assert key != segment_key("src", 0, 10, [{**captions[0], "text": "oi"}], "style", "fast", 23, "main")
+    assert key != segment_key("src", 0, 10, captions, "style", "fast", 23, "high")
+
+
+def _has_ffmpeg_with(*names: str) -> bool:
+    if not shutil.which("ffmpeg"): return False
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True).stdout
+    out += subprocess.run(["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True).stdout
+    return all(re.search(rf"\s{name}\s", out) for name in names)
+
+
+def _run(cmd, error_msg, **kwargs):
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0: raise RuntimeError(f"{error_msg}: {proc.stderr[-2000:]}")
+
+
+def _write_srt(captions, path):
+    def ts(s: float) -> str:
+        return f"{int(s // 3600):02d}:{int(s % 3600 // 60):02d}:{int(s % 60):02d},{int(round(s * 1000)) % 1000:03d}"
+    with open(path, "w", encoding="utf-8") as f:
+        for i, c in enumerate(captions, 1): f.write(f"{i}\n{ts(c['start'])} --> {ts(c['end'])}\n{c['text']}\n\n")
+
+
+def _frame_hashes(path: str, first: int, last: int) -> list:
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-v", "error", "-i", path, "-map", "0:v", "-vf", f"select='between(n,{first},{last})'",
+                          "-fps_mode", "passthrough", "-f", "framemd5", "-"], capture_output=True, text=True, check=True).stdout
+    return [line.rsplit(",", 1)[1].strip() for line in out.splitlines() if line and not line.startswith("#")]
+
+
+@pytest.mark.skipif(not _has_ffmpeg_with("libx264", "subtitles"), reason="FFmpeg com libx264 e libass não encontrado")
+def test_mixed_copy_and_encode_output_decodes(tmp_path):
+    # Origem com parâmetros bem diferentes dos do libx264 padrão (CAVLC, 1 referência) para que SPS/PPS não coincidam
+    src, output = str(tmp_path / "src.mp4"), str(tmp_path / "out.mp4")
+    _run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=25", "-t", "30",
+          "-c:v", "libx264", "-profile:v", "main", "-x264-params", "cabac=0:ref=1:keyint=50:min-keyint=50:scenecut=0",
+          "-pix_fmt", "yuv420p", "-y", src], "Erro ao gerar a origem")
+    captions = [{"id": 1, "start": 12.0, "end": 15.0, "text": "só no meio"}]
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    stats = render_engine.render_segmented(src, captions, output, str(workdir), _write_srt, _run, 3, "ultrafast", 23, 10)
+    assert stats["copied"] >= 2 and stats["encoded"] >= 1
+
+    decode = subprocess.run(["ffmpeg", "-hide_banner", "-v", "error", "-i", output, "-map", "0:v", "-f", "null", "-"], capture_output=True, text=True)
+    assert decode.returncode == 0 and decode.stderr == ""
+    assert len(_frame_hashes(output, 0, 10 ** 6)) == 750
+    # O último segmento, copiado depois de um recodificado, decodifica idêntico à origem
+    assert _frame_hashes(output, 500, 749) == _frame_hashes(src, 500, 749)
+
+
+def test_concurrent_first_splits_share_one_directory(tmp_path):
+    calls = []
+
+    def fake_split(cmd, error_msg, **kwargs):
+        calls.append(cmd)
+        staging = cmd[cmd.index("-segment_list") + 1].rsplit("/", 1)[0]
+        time.sleep(0.1)
+        with open(f"{staging}/seg_00000.mkv", "wb"): pass
+        with open(f"{staging}/segments.csv", "w") as f: f.write("seg_00000.mkv,0.000000,10.000000\n")
+    directory = str(tmp_path / "segments-plan")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(render_engine.split_segments("src.mp4", [], directory, fake_split))) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(calls) == 1
+    assert results == [[(f"{directory}/seg_00000.mkv", 0.0, 10.0)]] * 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["segments-plan"]
+
+
+def test_split_published_by_another_process_wins(tmp_path):
+    directory = str(tmp_path / "segments-plan")
+
+    def racing_split(cmd, error_msg, **kwargs):
+        for target in (cmd[cmd.index("-segment_list") + 1].rsplit("/", 1)[0], directory):
+            os.makedirs(target, exist_ok=True)
+            with open(f"{target}/segments.csv", "w") as f: f.write(f"{os.path.basename(target)}.mkv,0,5\n")
+    assert render_engine.split_segments("src.mp4", [], directory, racing_split) == [(f"{directory}/segments-plan.mkv", 0.0, 5.0)]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["segments-plan"]
@@ -0,0 +1,208 @@
+"""Testes dos backends de estado compartilhado (python -m pytest -q).
+
+O Redis é substituído por um servidor RESP mínimo em memória, no próprio processo de teste.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from state_backend import MemoryBackend, RedisBackend, SQLiteBackend
+
+
+class FakeRedis:
+    """Servidor RESP2 em asyncio (numa thread) com os comandos que o RedisBackend usa."""
+
+    def __init__(self):
+        self.data = {}
+        self.channels = {}
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._client, "127.0.0.1", 0))
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait(5)
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    async def _shutdown(self):
+        self.server.close()
+        clients = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in clients: task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if value is None: return b"$-1\r\n"
+        if isinstance(value, int): return b":%d\r\n" % value
+        if isinstance(value, str): return f"+{value}\r\n".encode()
+        if isinstance(value, bytes): return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(FakeRedis._encode(v) for v in value)
+
+    async def _client(self, reader, writer):
+        subscribed = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self._execute(args, writer, subscribed))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed: self.channels[channel].discard(writer)
+            writer.close()
+
+    def _execute(self, args, writer, subscribed) -> bytes:
+        command, args = args[0].decode().upper(), args[1:]
+        if command == "PING": return self._encode("PONG")
+        if command == "RPUSH":
+            self.data.setdefault(args[0], []).extend(args[1:])
+            return self._encode(len(self.data[args[0]]))
+        if command == "LLEN": return self._encode(len(self.data.get(args[0], [])))
+        if command == "LRANGE":
+            items, start, stop = self.data.get(args[0], []), int(args[1]), int(args[2])
+            return self._encode(items[start:(len(items) + stop if stop < 0 else stop) + 1])
+        if command == "EXPIRE": return self._encode(int(args[0] in self.data))
+        if command == "SET":
+            self.data[args[0]] = args[1]
+            return self._encode("OK")
+        if command == "GET": return self._encode(self.data.get(args[0]))
+        if command == "DEL": return self._encode(sum(self.data.pop(key, None) is not None for key in args))
+        if command == "PUBLISH":
+            listeners = self.channels.get(args[0], set())
+            for listener in listeners: listener.write(self._encode([b"message", args[0], args[1]]))
+            return self._encode(len(listeners))
+        if command == "SUBSCRIBE":
+            replies = []
+            for channel in args:
+                self.channels.setdefault(channel, set()).add(writer)
+                subscribed.add(channel)
+                replies.append(self._encode([b"subscribe", channel, len(subscribed)]))
+            return b"".join(replies)
+        return f"-ERR unknown command '{command}'\r\n".encode()
+
+
+def settle(backend):
+    """Espera as escritas em segundo plano do SQLite: só depois delas os outros processos as enxergam."""
+    if isinstance(backend, SQLiteBackend): backend.flush()
+
+
+def wait_for(condition, timeout_s: float = 3.0) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if condition(): return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def pair(request, tmp_path):
+    """Duas instâncias do mesmo backend, como dois workers apontando para o mesmo estado."""
+    if request.param == "sqlite":
+        path = str(tmp_path / "state.db")
+        backends = [SQLiteBackend(path, poll_s=0.05), SQLiteBackend(path, poll_s=0.05)]
+        yield backends
+        for backend in backends: backend.close()
+    else:
+        server = FakeRedis()
+        backends = [RedisBackend(server.url), RedisBackend(server.url)]
+        yield backends
+        for backend in backends: backend.close()
+        server.close()
+
+
+def test_events_are_shared(pair):
+    writer, reader = pair
+    writer.append("s1", {"status": "a", "stepId": 2})
+    writer.append("s1", {"status": "b", "stepId": 5})
+    settle(writer)
+    events = reader.events_since("s1", 0)
+    assert [e["status"] for _, e in events] == ["a", "b"]
+    assert [e["status"] for _, e in reader.events_since("s1", events[0][0])] == ["b"]
+    assert reader.events_since("outra", 0) == []
+
+
+def test_reset_restarts_the_session(pair):
+    writer, reader = pair
+    for step in range(3): writer.append("s1", {"stepId": step + 1})
+    settle(writer)
+    last = reader.events_since("s1", 0)[-1][0]
+    writer.reset("s1")
+    settle(writer)
+    assert reader.events_since("s1", 0) == []
+    writer.append("s1", {"status": "nova", "stepId": 2})
+    settle(writer)
+    # Quem já assinava (com o último número da sessão antiga) recebe o evento da nova
+    assert [e["status"] for _, e in reader.events_since("s1", last)] == ["nova"]
+
+
+def test_jobs_are_shared(pair):
+    writer, reader = pair
+    writer.put_job("j1", {"status": "running"})
+    writer.put_job("j1", {"status": "done"})
+    settle(writer)
+    assert reader.get_job("j1") == {"status": "done"}
+    assert reader.get_job("j2") is None
+
+
+def test_events_and_cancels_reach_the_other_instance(pair):
+    writer, listener = pair
+    events, cancels = [], []
+    listener.listen(events.append, cancels.append)
+    time.sleep(0.2)  # Assinatura/consulta em andamento antes de publicar
+    writer.append("s1", {"stepId": 3})
+    writer.request_cancel("j1")
+    assert wait_for(lambda: "s1" in events)
+    assert wait_for(lambda: cancels == ["j1"])
+
+
+def test_sqlite_batches_writes_and_flushes(tmp_path):
+    path = str(tmp_path / "state.db")
+    backend = SQLiteBackend(path)
+    for i in range(1000): backend.append("s1", {"i": i})
+    assert backend.append("s1", {"i": 1000}) is None  # A gravação fica para a thread de escrita
+    assert [e["i"] for _, e in backend.events_since("s1", 0)] == list(range(1001))
+    for i in range(100): backend.append("s2", {"i": i})
+    backend.put_job("j1", {"status": "done"})
+    backend.close()  # Grava o que ainda estava na fila
+    other = SQLiteBackend(path)
+    assert len(other.events_since("s2", 0)) == 100 and other.get_job("j1") == {"status": "done"}
+    assert other.stats()["events"] == 1101
+    other.close()
+
+
+def test_memory_backend():
+    backend = MemoryBackend(max_events=2)
+    cancels = []
+    backend.listen(lambda session_id: None, cancels.append)
+    assert [backend.append("s1", {"stepId": n}) for n in (2, 3)] == [1, 2]
+    backend.append("s1", {"type": "progress"})  # Acima do limite: descartado
+    backend.append("s1", {"stepId": 10})  # O status final sempre entra
+    assert [seq for seq, _ in backend.events_since("s1", 0)] == [1, 2, 3]
+    assert [e["stepId"] for _, e in backend.events_since("s1", 2)] == [10]
+    backend.reset("s1")
+    backend.append("s1", {"stepId": 2})
+    assert [e["stepId"] for _, e in backend.events_since("s1", 3)] == [2]
+    backend.request_cancel("j1")
+    assert cancels == ["j1"]
@@ -0,0 +1,66 @@
+"""Testes do cache de transcrição (python -m pytest -q)."""
+import os
+import time
+
+from transcription_cache import TranscriptionCache, make_cache_key
+
+CONFIG = {"beam_size": 1, "vad_filter": True}
+RESULT = {"captions": [{"id": 1, "start": 0.0, "end": 1.5, "text": "olá"}]}
+
+
+def test_make_cache_key_is_deterministic():
+    assert make_cache_key("abc", "small", "pt", CONFIG) == make_cache_key("abc", "small", "pt", dict(reversed(CONFIG.items())))
+
+
+def test_make_cache_key_covers_every_parameter():
+    base = make_cache_key("abc", "small", "pt", CONFIG)
+    assert make_cache_key("abd", "small", "pt", CONFIG) != base
+    assert make_cache_key("abc", "medium", "pt", CONFIG) != base
+    assert make_cache_key("abc", "small", "en", CONFIG) != base
+    assert make_cache_key("abc", "small", "pt", {**CONFIG, "beam_size": 5}) != base
+
+
+def test_miss_then_hit(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=1 << 20, max_age_s=3600)
+    key = make_cache_key("abc", "small", "pt", CONFIG)
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(key) == RESULT
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_expired_entry_is_a_miss(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=1 << 20, max_age_s=60)
+    cache.put("k", RESULT)
+    old = time.time() - 120
+    os.utime(os.path.join(str(tmp_path), "k.json"), (old, old))
+    assert cache.get("k") is None
+    assert cache.evictions == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=1 << 20, max_age_s=3600)
+    for i, key in enumerate(("a", "b")):
+        cache.put(key, RESULT)
+        used = time.time() - 100 + i
+        os.utime(os.path.join(str(tmp_path), f"{key}.json"), (used, used))
+    cache.get("a")  # "a" passa a ser o mais recente
+    cache.max_bytes = os.path.getsize(os.path.join(str(tmp_path), "a.json")) * 2
+    cache.put("c", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT and cache.get("c") == RESULT
+
+
+def test_hits_do_not_extend_max_age(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=1 << 20, max_age_s=60)
+    cache.put("k", RESULT)
+    path = os.path.join(str(tmp_path), "k.json")
+    written = time.time() - 50
+    os.utime(path, (written, written))
+    assert cache.get("k") == RESULT
+    assert os.path.getmtime(path) == written
+    os.utime(path, (time.time(), written - 20))  # Lida agora, gravada há 70s
+    assert cache.get("k") is None
@@ -0,0 +1,85 @@
+"""Testes da re-segmentação por palavras (python -m pytest -q)."""
+from word_store import WordStore, WordTimings, resegment, to_srt, wrap_lines
+
+
+def speech(text: str, start: float = 0.0, word_s: float = 0.3, gap_s: float = 0.05):
+    """Palavras seguidas, no formato do Whisper (espaço inicial), num único segmento."""
+    words, t = [], start
+    for token in text.split():
+        words.append((t, t + word_s, f" {token}", 0.9))
+        t += word_s + gap_s
+    return words
+
+
+def test_empty_timings():
+    assert resegment(WordTimings.build([])) == []
+
+
+def test_short_sentence_is_one_caption():
+    captions = resegment(WordTimings.build([speech("olá mundo")]))
+    assert len(captions) == 1
+    assert captions[0]["text"] == "olá mundo"
+    assert captions[0]["start"] == 0.0
+    assert captions[0]["end"] >= 0.8  # Duração mínima
+
+
+def test_lines_respect_max_chars():
+    timings = WordTimings.build([speech("uma frase bem comprida que precisa ser quebrada em mais de uma legenda porque não cabe em duas linhas curtas")])
+    captions = resegment(timings, max_chars_per_line=20, max_lines=2, max_duration_ms=60000)
+    assert len(captions) > 1
+    for caption in captions:
+        lines = caption["text"].split("\n")
+        assert len(lines) <= 2
+        assert all(len(line) <= 20 for line in lines)
+    assert " ".join(c["text"].replace("\n", " ") for c in captions) == "".join(timings.words()).strip()
+
+
+def test_pause_splits_captions():
+    timings = WordTimings.build([speech("primeira parte") + speech("segunda parte", start=3.0)])
+    captions = resegment(timings)
+    assert [c["text"] for c in captions] == ["primeira parte", "segunda parte"]
+    assert captions[1]["start"] == 3.0
+
+
+def test_max_duration_splits_slow_speech():
+    captions = resegment(WordTimings.build([speech("a b c d e f g h", word_s=1.0, gap_s=0.0)]), max_duration_ms=3000, pause_ms=10000)
+    assert len(captions) > 1
+    assert all(c["end"] - c["start"] <= 3.0 for c in captions[:-1])
+
+
+def test_captions_keep_min_gap_and_order():
+    timings = WordTimings.build([speech("rápido demais para ler tudo isso"), speech("e logo depois vem outra frase", start=2.2)])
+    captions = resegment(timings, max_cps=5, min_gap_ms=80)
+    for previous, current in zip(captions, captions[1:]):
+        assert current["start"] - previous["end"] >= 0.08 - 1e-9
+        assert previous["end"] > previous["start"]
+    assert [c["id"] for c in captions] == list(range(1, len(captions) + 1))
+
+
+def test_reading_speed_extends_end_into_pause():
+    captions = resegment(WordTimings.build([speech("legenda com bastante texto", word_s=0.1, gap_s=0.0), speech("fim", start=10.0)]), max_cps=10)
+    first = captions[0]
+    assert first["end"] >= first["start"] + len("legenda com bastante texto") / 10
+    assert first["cps"] <= 10
+
+
+def test_wrap_lines_balances():
+    assert wrap_lines("curto", 42, 2) == "curto"
+    lines = wrap_lines("um dois três quatro cinco seis", 20, 2).split("\n")
+    assert len(lines) == 2 and abs(len(lines[0]) - len(lines[1])) <= 6
+
+
+def test_srt_export():
+    srt = to_srt(resegment(WordTimings.build([speech("olá mundo")])))
+    assert srt.startswith("1\n00:00:00,000 --> 00:00:")
+    assert "olá mundo" in srt
+
+
+def test_store_round_trip(tmp_path):
+    timings = WordTimings.build([speech("olá mundo"), speech("até logo", start=2.0)])
+    WordStore(str(tmp_path)).put("s1", timings)
+    loaded = WordStore(str(tmp_path)).get("s1")  # Outro processo: lê do disco
+    assert loaded.words() == timings.words()
+    assert loaded.segments.tolist() == [0, 2]
+    assert resegment(loaded) == resegment(timings)
+    assert WordTimings.from_dict(timings.to_dict()).words() == timings.words()
@@ -0,0 +1,87 @@
+"""Testes do cache de metadados do YouTube (python -m pytest -q)."""
+import asyncio
+import threading
+import time
+
+from youtube_source import MetadataCache, video_key
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def test_video_key_normalizes_url_forms():
+    for url in (URL, "https://youtu.be/dQw4w9WgXcQ?t=3", "https://youtube.com/shorts/dQw4w9WgXcQ", "https://www.youtube.com/embed/dQw4w9WgXcQ"):
+        assert video_key(url) == "yt:dQw4w9WgXcQ"
+    assert video_key("https://www.youtube.com/watch?v=curto") == "https://www.youtube.com/watch?v=curto"
+    assert video_key("https://vimeo.com/123") is None
+
+
+class CountingFetch:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.calls, self.delay, self.fail = 0, delay, fail
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str) -> dict:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail: raise RuntimeError("indisponível")
+        return {"id": video_key(url), "title": "Vídeo"}
+
+
+def test_same_video_in_other_url_form_is_a_hit():
+    fetch = CountingFetch()
+    cache = MetadataCache(fetch)
+
+    async def scenario():
+        first = await cache.get(URL)
+        assert await cache.get("https://youtu.be/dQw4w9WgXcQ") is first
+    asyncio.run(scenario())
+    assert (fetch.calls, cache.hits, cache.misses) == (1, 1, 1)
+
+
+def test_concurrent_lookups_share_one_fetch():
+    fetch = CountingFetch(delay=0.1)
+    cache = MetadataCache(fetch)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get(URL) for _ in range(5)))
+    results = asyncio.run(scenario())
+    assert fetch.calls == 1 and all(r is results[0] for r in results)
+    assert cache.stats()["inflight"] == 0
+
+
+def test_expired_entries_are_fetched_again():
+    fetch = CountingFetch()
+    cache = MetadataCache(fetch, ttl_s=0)
+
+    async def scenario():
+        await cache.get(URL)
+        await cache.get(URL)
+    asyncio.run(scenario())
+    assert fetch.calls == 2
+
+
+def test_failures_are_not_cached():
+    fetch = CountingFetch(delay=0.05, fail=True)
+    cache = MetadataCache(fetch)
+
+    async def scenario():
+        results = await asyncio.gather(cache.get(URL), cache.get(URL), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        fetch.fail = False
+        return await cache.get(URL)
+    assert asyncio.run(scenario())["title"] == "Vídeo"
+    assert fetch.calls == 2
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = MetadataCache(CountingFetch(), max_entries=2)
+    urls = [f"https://youtu.be/{c * 11}" for c in "abc"]
+
+    async def scenario():
+        await cache.get(urls[0])
+        await cache.get(urls[1])
+        await cache.get(urls[0])
+        await cache.get(urls[2])
+    asyncio.run(scenario())
+    assert list(cache._entries) == [video_key(urls[0]), video_key(urls[2])]
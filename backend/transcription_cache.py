@@ -0,0 +1,118 @@
+"""Cache persistente em disco para resultados de transcrição.
+
+A chave é derivada do hash do conteúdo da mídia enviada, do modelo, do idioma e
+dos parâmetros de decodificação, então reenviar o mesmo vídeo devolve as legendas
+sem passar de novo pelo FFmpeg e pelo Whisper.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(media_hash: str, model: str, language: str, config: dict) -> str:
+    """Gera a chave do cache a partir da mídia e de todos os parâmetros que mudam o resultado."""
+    payload = json.dumps({"media": media_hash, "model": model, "language": language, "config": config},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranscriptionCache:
+    """Armazena cada resultado como um arquivo JSON, com expulsão por idade e por tamanho total.
+
+    O mtime do arquivo é o momento da gravação (a idade conta dele, então uma entrada lida com
+    frequência ainda expira em `max_age_s`); o atime, atualizado a cada acerto, ordena a expulsão LRU.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age_s: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Retorna o resultado salvo ou None; entradas expiradas contam como falha."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                written = os.path.getmtime(path)
+                if time.time() - written > self.max_age_s:
+                    os.remove(path)
+                    self.evictions += 1
+                    raise FileNotFoundError(path)
+                with open(path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+                os.utime(path, (time.time(), written))  # Marca como usado recentemente (atime) sem renovar a idade
+                self.hits += 1
+                return result
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+
+    def put(self, key: str, result: dict):
+        """Grava um resultado de forma atômica e aplica os limites de idade e tamanho."""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(result, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Falha ao gravar no cache de transcrição: {e}")
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                return
+            self._evict()
+
+    def _evict(self):
+        """Remove entradas expiradas (pela gravação) e, depois, as menos usadas (pelo último acerto) até caber em max_bytes."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"): continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime > self.max_age_s:
+                os.remove(path)
+                self.evictions += 1
+            else:
+                entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"): os.remove(os.path.join(self.directory, name))
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [os.path.getsize(os.path.join(self.directory, n)) for n in os.listdir(self.directory) if n.endswith(".json")]
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(sizes), "size_bytes": sum(sizes), "max_bytes": self.max_bytes, "max_age_s": self.max_age_s,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,237 @@
+"""Tempos por palavra de cada sessão e re-segmentação das legendas sem passar de novo pelo modelo.
+
+As palavras de uma transcrição ficam em colunas numpy (início e fim em ms, probabilidade, posição
+do texto num único bloco UTF-8): ~16 bytes por palavra mais o texto, ou ~150 KB para uma hora de
+fala. Com elas, trocar o tamanho da linha, a velocidade de leitura ou o formato de saída (SRT,
+WebVTT, ASS) é só recalcular os cortes, em milissegundos.
+"""
+import collections
+import hashlib
+import os
+import threading
+import time
+import uuid
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Word = Tuple[float, float, str, float]  # (início s, fim s, texto com o espaço inicial do Whisper, probabilidade)
+
+SENTENCE_END = (".", "?", "!", "…", "。", "？", "！")
+CLAUSE_END = (",", ";", ":", "—", "–")
+
+
+class WordTimings:
+    """Palavras de uma transcrição em arrays; `segments` guarda o índice da primeira palavra de cada segmento do Whisper."""
+
+    def __init__(self, start_ms: np.ndarray, end_ms: np.ndarray, prob: np.ndarray, text: np.ndarray, offsets: np.ndarray, segments: np.ndarray):
+        self.start_ms, self.end_ms, self.prob = start_ms, end_ms, prob
+        self.text, self.offsets, self.segments = text, offsets, segments
+        self._decoded = bytes(text).decode("utf-8")
+
+    @classmethod
+    def build(cls, segments: Iterable[Sequence[Word]]) -> "WordTimings":
+        starts, ends, probs, parts, offsets, segment_starts, pos = [], [], [], [], [0], [], 0
+        for words in segments:
+            if words: segment_starts.append(len(starts))
+            for start, end, word, prob in words:
+                starts.append(round(start * 1000))
+                ends.append(round(max(end, start) * 1000))
+                probs.append(prob)
+                parts.append(word)
+                pos += len(word)
+                offsets.append(pos)  # Posições em caracteres (não bytes) do texto decodificado
+        return cls(np.array(starts, dtype=np.int32), np.array(ends, dtype=np.int32), np.array(probs, dtype=np.float16),
+                   np.frombuffer("".join(parts).encode("utf-8"), dtype=np.uint8), np.array(offsets, dtype=np.int32),
+                   np.array(segment_starts, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.start_ms)
+
+    def word(self, i: int) -> str:
+        return self._decoded[self.offsets[i]:self.offsets[i + 1]]
+
+    def words(self) -> List[str]:
+        offsets = self.offsets.tolist()
+        return [self._decoded[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def to_dict(self) -> dict:
+        """Forma em listas, para o cache de transcrições (JSON)."""
+        return {"start_ms": self.start_ms.tolist(), "end_ms": self.end_ms.tolist(), "prob": [round(float(p), 3) for p in self.prob],
+                "words": self.words(), "segments": self.segments.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WordTimings":
+        bounds = list(data["segments"]) + [len(data["words"])]
+        rows = list(zip(np.array(data["start_ms"]) / 1000, np.array(data["end_ms"]) / 1000, data["words"], data["prob"]))
+        return cls.build(rows[a:b] for a, b in zip(bounds, bounds[1:]))
+
+    def save(self, path: str):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez(tmp, start_ms=self.start_ms, end_ms=self.end_ms, prob=self.prob, text=self.text, offsets=self.offsets, segments=self.segments)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "WordTimings":
+        with np.load(path) as data:
+            return cls(*(data[k] for k in ("start_ms", "end_ms", "prob", "text", "offsets", "segments")))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.start_ms, self.end_ms, self.prob, self.text, self.offsets, self.segments))
+
+
+class WordStore:
+    """Tempos por palavra de cada sessão em disco (visível a todos os workers), com as mais usadas em memória."""
+
+    def __init__(self, directory: str, ttl_s: float = 7 * 86400, memory_items: int = 64):
+        self.directory = directory
+        self.ttl_s = ttl_s
+        self.memory_items = memory_items
+        self._memory: "collections.OrderedDict[str, WordTimings]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha256(session_id.encode()).hexdigest()[:32]}.npz")
+
+    def put(self, session_id: str, timings: WordTimings):
+        timings.save(self._path(session_id))
+        with self._lock:
+            self._remember(session_id, timings)
+        if time.monotonic() > self._next_prune: self._prune()
+
+    def get(self, session_id: str) -> Optional[WordTimings]:
+        with self._lock:
+            timings = self._memory.get(session_id)
+            if timings is not None:
+                self._memory.move_to_end(session_id)
+                return timings
+        try:
+            timings = WordTimings.load(self._path(session_id))
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            self._remember(session_id, timings)
+        return timings
+
+    def _remember(self, session_id: str, timings: WordTimings):
+        self._memory[session_id] = timings
+        self._memory.move_to_end(session_id)
+        while len(self._memory) > self.memory_items: self._memory.popitem(last=False)
+
+    def _prune(self):
+        self._next_prune = time.monotonic() + 3600
+        cutoff = time.time() - self.ttl_s
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff: os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def wrap_lines(text: str, max_chars: int, max_lines: int) -> str:
+    """Quebra o texto em até `max_lines` linhas de no máximo `max_chars` (se couber), o mais equilibradas possível."""
+    if len(text) <= max_chars or max_lines < 2: return text
+    words, lines = text.split(" "), []
+    while len(lines) < max_lines - 1 and len(" ".join(words)) > max_chars:
+        total, left = len(" ".join(words)), max_lines - len(lines) - 1
+        cut, best, size = 1, None, -1
+        for i in range(1, len(words)):
+            size += len(words[i - 1]) + 1
+            if size > max_chars and best is not None: break
+            # A linha mais longa entre esta e a média das que sobram: menor é mais equilibrado
+            score = max(size, (total - size - 1) / left)
+            if best is None or score < best: cut, best = i, score
+        lines.append(" ".join(words[:cut]))
+        words = words[cut:]
+    lines.append(" ".join(words))
+    return "\n".join(lines)
+
+
+def resegment(timings: WordTimings, max_chars_per_line: int = 42, max_lines: int = 2, max_cps: float = 17.0,
+              min_gap_ms: int = 80, min_duration_ms: int = 800, max_duration_ms: int = 7000, pause_ms: int = 700) -> List[dict]:
+    """Monta legendas a partir das palavras respeitando as regras de legibilidade.
+
+    Uma legenda fecha quando a próxima palavra não caberia em `max_lines` linhas de `max_chars_per_line`
+    caracteres ou a faria passar de `max_duration_ms`, depois de uma pausa de `pause_ms`, ou num fim de frase (ou
+    de segmento do Whisper) se já tiver metade do tamanho máximo. Depois, cada legenda fica na tela
+    o bastante para ser lida a `max_cps` caracteres por segundo (e no mínimo `min_duration_ms`), sem
+    invadir a seguinte, e legendas seguidas ficam separadas por pelo menos `min_gap_ms`.
+    """
+    n = len(timings)
+    if n == 0: return []
+    max_chars = max_chars_per_line * max(1, max_lines)
+    starts, ends, words = timings.start_ms.tolist(), timings.end_ms.tolist(), timings.words()
+    stripped = [w.strip() for w in words]
+    segment_starts = set(timings.segments.tolist())
+    # Preenchimento guloso das linhas: se nem ele cabe em `max_lines`, nenhuma quebra cabe
+    groups, first, length, lines, line_length = [], 0, len(stripped[0]), 1, len(stripped[0])
+    for i in range(1, n):
+        word, previous = stripped[i], stripped[i - 1]
+        new_lines, new_line_length = (lines, line_length + 1 + len(word)) if line_length + 1 + len(word) <= max_chars_per_line else (lines + 1, len(word))
+        soft_break = length >= max_chars / 2 and (previous.endswith(SENTENCE_END) or i in segment_starts
+                                                  or (length >= max_chars * 0.75 and previous.endswith(CLAUSE_END)))
+        if (new_lines > max_lines or ends[i] - starts[first] > max_duration_ms or starts[i] - ends[i - 1] >= pause_ms or soft_break):
+            groups.append((first, i))
+            first, length, lines, line_length = i, len(word), 1, len(word)
+        else:
+            length, lines, line_length = length + 1 + len(word), new_lines, new_line_length
+    groups.append((first, n))
+
+    captions = []
+    for index, (a, b) in enumerate(groups):
+        text = "".join(words[a:b]).strip()
+        start, end = starts[a], ends[b - 1]
+        # Tempo de leitura: estende o fim para dentro da pausa seguinte, sem passar do início da próxima legenda
+        limit = starts[groups[index + 1][0]] - min_gap_ms if index + 1 < len(groups) else None
+        wanted = max(end, start + min_duration_ms, start + int(1000 * len(text) / max_cps) if max_cps > 0 else end)
+        end = max(end, min(wanted, limit) if limit is not None else wanted)
+        if limit is not None and end > limit: end = max(start + 1, limit)  # Legendas coladas: garante o intervalo mínimo
+        captions.append({"id": index + 1, "start": start / 1000, "end": end / 1000, "text": wrap_lines(text, max_chars_per_line, max_lines),
+                         "cps": round(len(text) / max(0.001, (end - start) / 1000), 1)})
+    return captions
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    ms = max(0, round(seconds * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02}:{m:02}:{s:02}{separator}{ms:03}"
+
+
+def to_srt(captions: List[dict]) -> str:
+    return "".join(f"{i}\n{_timestamp(c['start'], ',')} --> {_timestamp(c['end'], ',')}\n{c['text']}\n\n" for i, c in enumerate(captions, 1))
+
+
+def to_vtt(captions: List[dict]) -> str:
+    # "-->" não pode aparecer no texto de uma cue
+    body = "".join(f"{i}\n{_timestamp(c['start'], '.')} --> {_timestamp(c['end'], '.')}\n{c['text'].replace('-->', '->')}\n\n"
+                   for i, c in enumerate(captions, 1))
+    return f"WEBVTT\n\n{body}"
+
+
+def _ass_time(seconds: float) -> str:
+    cs = max(0, round(seconds * 100))
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return f"{h}:{m:02}:{s:02}.{cs:02}"
+
+
+def to_ass(captions: List[dict], font: str = "Arial", font_size: int = 48, play_res: Tuple[int, int] = (1920, 1080)) -> str:
+    """ASS com um estilo padrão (texto branco, contorno preto, embaixo e centralizado)."""
+    header = (f"[Script Info]\nScriptType: v4.00+\nPlayResX: {play_res[0]}\nPlayResY: {play_res[1]}\nWrapStyle: 2\nScaledBorderAndShadow: yes\n\n"
+              "[V4+ Styles]\nFormat: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+              "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+              f"Style: Default,{font},{font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,3,1,2,60,60,50,1\n\n"
+              "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
+    # Chaves abririam blocos de override do ASS; a quebra de linha é \N
+    lines = (f"Dialogue: 0,{_ass_time(c['start'])},{_ass_time(c['end'])},Default,,0,0,0,,"
+             f"{c['text'].replace('{', '(').replace('}', ')').replace(chr(10), chr(92) + 'N')}\n" for c in captions)
+    return header + "".join(lines)
+
+
+EXPORTERS = {"srt": (to_srt, "application/x-subrip; charset=utf-8"), "vtt": (to_vtt, "text/vtt"), "ass": (to_ass, "text/x-ssa")}
@@ -0,0 +1,118 @@
+"""Acesso ao YouTube pelo yt-dlp: metadados em cache e download só do áudio.
+
+Os metadados de cada vídeo ficam em memória por um tempo (`ttl_s`) e consultas simultâneas
+da mesma URL (ex.: digitação com debounce no frontend) compartilham uma única chamada ao
+`extract_info`. Para transcrever, só o stream `bestaudio` é baixado, sem vídeo nem pós-processamento.
+"""
+import asyncio
+import collections
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def video_key(url: str) -> Optional[str]:
+    """Identificador canônico do vídeo (`yt:<id>`), a própria URL se o id não for reconhecido, ou None se não for do YouTube."""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if 'youtube.com' not in host and 'youtu.be' not in host: return None
+    if 'youtu.be' in host:
+        candidate = parsed.path.strip("/").split("/")[0]
+    elif parsed.path == "/watch":
+        candidate = parse_qs(parsed.query).get("v", [""])[0]
+    else:
+        parts = parsed.path.strip("/").split("/")
+        candidate = parts[1] if len(parts) > 1 and parts[0] in ("shorts", "embed", "live", "v") else ""
+    return f"yt:{candidate}" if _VIDEO_ID.match(candidate) else url
+
+
+def base_options(cookiefile: Optional[str] = None) -> dict:
+    opts = {'noplaylist': True, 'quiet': True, 'no_warnings': True}
+    if cookiefile and os.path.exists(cookiefile): opts['cookiefile'] = cookiefile
+    return opts
+
+
+def fetch_metadata(url: str, cookiefile: Optional[str] = None) -> dict:
+    """Título, miniatura, duração e autor do vídeo, sem baixar a mídia."""
+    import yt_dlp  # Importado sob demanda: o yt-dlp é pesado e a maioria das requisições não o usa
+    with yt_dlp.YoutubeDL(base_options(cookiefile)) as ydl:
+        info = ydl.extract_info(url, download=False)
+    duration = info.get('duration') or 0
+    minutes, seconds = divmod(duration, 60)
+    return {
+        "id": info.get('id'),
+        "title": info.get('title', 'Título não disponível'),
+        "thumbnail": info.get('thumbnail', ''),
+        "duration": duration,
+        "duration_formatted": f"{int(minutes):02}:{int(seconds):02}",
+        "author": info.get('uploader', 'Autor desconhecido'),
+    }
+
+
+class MetadataCache:
+    """Metadados por vídeo com expiração; buscas simultâneas do mesmo vídeo aguardam a mesma consulta."""
+
+    def __init__(self, fetch: Callable[[str], dict], ttl_s: float = 3600, max_entries: int = 512):
+        self.fetch = fetch
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "collections.OrderedDict[str, Tuple[float, dict]]" = collections.OrderedDict()
+        self._inflight = {}
+
+    async def get(self, url: str, executor=None) -> dict:
+        key = video_key(url) or url
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl_s:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key])
+        self.misses += 1
+        future = asyncio.get_running_loop().run_in_executor(executor, self.fetch, url)
+        self._inflight[key] = future
+        try:
+            metadata = await asyncio.shield(future)  # Falhas não entram no cache; quem aguardava recebe o mesmo erro
+        finally:
+            self._inflight.pop(key, None)
+        self._entries[key] = (time.monotonic(), metadata)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+        return metadata
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "inflight": len(self._inflight), "ttl_s": self.ttl_s, "hits": self.hits, "misses": self.misses}
+
+
+def download_audio(url: str, directory: str, cookiefile: Optional[str] = None, max_filesize: Optional[int] = None,
+                   on_progress: Optional[Callable[[dict], None]] = None, cancel_event: Optional[threading.Event] = None) -> Tuple[str, dict]:
+    """Baixa só o melhor stream de áudio para `directory` e devolve (caminho, info).
+
+    Se `cancel_event` for acionado, o download é interrompido no próximo bloco recebido.
+    """
+    import yt_dlp
+
+    def hook(d: dict):
+        if cancel_event is not None and cancel_event.is_set(): raise yt_dlp.utils.DownloadCancelled("Download cancelado")
+        if on_progress and d.get("status") == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            done = d.get("downloaded_bytes") or 0
+            on_progress({"percent": round(min(100.0, 100 * done / total), 1) if total else None,
+                         "downloaded_bytes": done, "speed": d.get("speed")})
+
+    opts = {**base_options(cookiefile), 'format': 'bestaudio/best', 'outtmpl': os.path.join(directory, 'audio.%(ext)s'),
+            'progress_hooks': [hook]}
+    if max_filesize: opts['max_filesize'] = max_filesize
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+    files = [name for name in os.listdir(directory) if name.startswith("audio.") and not name.endswith(".part")]
+    if not files: raise RuntimeError("Falha no download do áudio (arquivo maior que o permitido ou indisponível).")
+    return os.path.join(directory, files[0]), info